@@ -0,0 +1,255 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+from threading import Lock
+from sqlmodel import Session, select
+from db import engine
+from models import Reservations
+import base64
+
+BLOCKING_STATUSES = ('pending', 'confirmed', 'active')
+
+def blocking_overlap(car_id, start: date, end: date):
+    '''
+    builds an EXISTS over the blocking reservations of a car that overlap the dates, a range
+    scan of ix_reservations_blocking_car_period. The database decides, so unlike the index
+    it can't be stale
+
+    Input:
+        car_id: the car's id, or a column (e.g. Cars.id) for a correlated check
+        start: the first day
+        end: the last day
+    Returns:
+        the EXISTS clause
+    '''
+    return select(Reservations.id).where(
+        Reservations.car_id == car_id,
+        Reservations.status.in_(BLOCKING_STATUSES),
+        Reservations.start_at <= end,
+        Reservations.end_at >= start
+    ).exists()
+
+class CarIntervals:
+    '''
+    sorted interval list for the blocking reservations of a single car. starts are kept
+    sorted and max_ends[i] holds the largest end date among the first i + 1 intervals, so
+    an overlap check is one bisect plus one comparison
+    '''
+    def __init__(self):
+        self.starts: list[date] = []
+        self.ends: list[date] = []
+        self.ids: list[int] = []
+        self.max_ends: list[date] = []
+
+    def insert(self, reservation_id: int, start_at: date, end_at: date) -> None:
+        i = bisect_right(self.starts, start_at)
+        self.starts.insert(i, start_at)
+        self.ends.insert(i, end_at)
+        self.ids.insert(i, reservation_id)
+        self.max_ends.insert(i, end_at)
+        self._rebuild_max_ends(i)
+
+    def remove(self, reservation_id: int, start_at: date) -> None:
+        i = bisect_left(self.starts, start_at)
+        while self.ids[i] != reservation_id:
+            i += 1
+        del self.starts[i], self.ends[i], self.ids[i], self.max_ends[i]
+        self._rebuild_max_ends(i)
+
+    def overlaps(self, start: date, end: date) -> bool:
+        # every interval starting on or before `end` is a candidate; one of them overlaps
+        # if the furthest reaching end among them is on or after `start`
+        i = bisect_right(self.starts, end)
+        return i > 0 and self.max_ends[i - 1] >= start
+
+    def blocked_days(self, start: date, end: date) -> int:
+        '''
+        builds a bitmask of the days in [start, end] covered by a reservation, bit i being
+        start + i days
+        '''
+        # max_ends never decreases, so every interval before `first` ends before the window
+        first = bisect_left(self.max_ends, start)
+        last = bisect_right(self.starts, end)
+        mask = 0
+        for k in range(first, last):
+            if self.ends[k] < start:
+                continue
+            lo = (max(self.starts[k], start) - start).days
+            hi = (min(self.ends[k], end) - start).days
+            mask |= ((1 << (hi - lo + 1)) - 1) << lo
+        return mask
+
+    def _rebuild_max_ends(self, i: int) -> None:
+        running = self.max_ends[i - 1] if i > 0 else None
+        for j in range(i, len(self.ends)):
+            running = self.ends[j] if running is None or self.ends[j] > running else running
+            self.max_ends[j] = running
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+class AvailabilityIndex:
+    '''
+    in-memory index of the blocking (pending, confirmed, active) reservations of every car.
+    Postgres stays the source of truth: the index only answers read-side availability
+    questions, and writes are still guarded by the reservation_no_overlap constraint
+    '''
+    def __init__(self):
+        self._cars: dict[int, CarIntervals] = {}
+        # reservation id -> (car id, start date) so a reservation can be removed by id
+        self._reservations: dict[int, tuple[int, date]] = {}
+        self._lock = Lock()
+
+    def load(self, db: Session) -> None:
+        '''
+        (re)builds the index from the database
+
+        Input:
+            db: a database session
+        Returns:
+            None
+        '''
+        # ordered like ix_reservations_blocking_car_period, so the rows come straight off the index
+        stmt = (
+            select(Reservations.id, Reservations.car_id, Reservations.start_at, Reservations.end_at)
+            .where(Reservations.status.in_(BLOCKING_STATUSES))
+            .order_by(Reservations.car_id, Reservations.start_at)
+        )
+        rows = db.exec(stmt).all()
+        cars: dict[int, CarIntervals] = {}
+        reservations: dict[int, tuple[int, date]] = {}
+        for reservation_id, car_id, start_at, end_at in rows:
+            intervals = cars.setdefault(car_id, CarIntervals())
+            intervals.starts.append(start_at)
+            intervals.ends.append(end_at)
+            intervals.ids.append(reservation_id)
+            intervals.max_ends.append(end_at)
+            reservations[reservation_id] = (car_id, start_at)
+        for intervals in cars.values():
+            intervals._rebuild_max_ends(0)
+
+        with self._lock:
+            self._cars = cars
+            self._reservations = reservations
+
+    def sync(self, reservation: Reservations) -> bool:
+        '''
+        brings the index in line with a reservation that was just written to the database
+
+        Input:
+            reservation: a committed reservation
+        Returns:
+            True if the reservation started or stopped blocking its car, otherwise False
+        '''
+        blocking = reservation.status in BLOCKING_STATUSES
+        with self._lock:
+            was_blocking = self._discard(reservation.id)
+            if blocking:
+                self._cars.setdefault(reservation.car_id, CarIntervals()).insert(reservation.id, reservation.start_at, reservation.end_at)
+                self._reservations[reservation.id] = (reservation.car_id, reservation.start_at)
+        return blocking != was_blocking
+
+    def discard(self, reservation_id: int) -> None:
+        '''
+        removes a reservation from the index if it is present
+
+        Input:
+            reservation_id: the id of the reservation to remove
+        Returns:
+            None
+        '''
+        with self._lock:
+            self._discard(reservation_id)
+
+    def discard_car(self, car_id: int) -> None:
+        '''
+        removes every reservation of a car from the index
+
+        Input:
+            car_id: the id of the car
+        Returns:
+            None
+        '''
+        with self._lock:
+            intervals = self._cars.pop(car_id, None)
+            if intervals:
+                for reservation_id in intervals.ids:
+                    self._reservations.pop(reservation_id, None)
+
+    def is_available(self, car_id: int, start: date, end: date) -> bool:
+        '''
+        checks whether a car has no blocking reservation overlapping the given dates
+
+        Input:
+            car_id: the id of the car
+            start: the first day of the requested range
+            end: the last day of the requested range
+        Returns:
+            True if the car is free for the whole range, otherwise False
+        '''
+        with self._lock:
+            intervals = self._cars.get(car_id)
+            return not (intervals and intervals.overlaps(start, end))
+
+    def unavailable_cars(self, start: date, end: date) -> set[int]:
+        '''
+        finds every car with a blocking reservation overlapping the given dates
+
+        Input:
+            start: the first day of the requested range
+            end: the last day of the requested range
+        Returns:
+            a set of car ids
+        '''
+        with self._lock:
+            return {car_id for car_id, intervals in self._cars.items() if intervals.overlaps(start, end)}
+
+    def blocked_days(self, start: date, end: date) -> dict[int, int]:
+        '''
+        builds the calendar of every car with a blocking reservation between the given dates
+
+        Input:
+            start: the first day of the window
+            end: the last day of the window
+        Returns:
+            a dict of car id -> bitmask of the blocked days, bit i being start + i days. Cars
+            that are free for the whole window are left out
+        '''
+        with self._lock:
+            calendar = {car_id: intervals.blocked_days(start, end) for car_id, intervals in self._cars.items()}
+        return {car_id: mask for car_id, mask in calendar.items() if mask}
+
+    def _discard(self, reservation_id: int) -> bool:
+        entry = self._reservations.pop(reservation_id, None)
+        if not entry:
+            return False
+        car_id, start_at = entry
+        intervals = self._cars[car_id]
+        intervals.remove(reservation_id, start_at)
+        if not intervals:
+            del self._cars[car_id]
+        return True
+
+availability_index = AvailabilityIndex()
+
+def encode_days(mask: int, days: int) -> str:
+    '''
+    packs a day bitmask into url-safe base64. Day i is bit i % 8 (least significant first)
+    of byte i // 8
+
+    Input:
+        mask: the bitmask, bit i being the i-th day
+        days: the number of days in the window
+    Returns:
+        the encoded bitmask
+    '''
+    return base64.urlsafe_b64encode(mask.to_bytes((days + 7) // 8, 'little')).decode().rstrip('=')
+
+def load_availability_index() -> None:
+    '''
+    loads the blocking reservations from the database into the shared index
+    
+    Returns:
+        None
+    '''
+    with Session(engine) as db:
+        availability_index.load(db)
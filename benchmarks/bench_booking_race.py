@@ -0,0 +1,105 @@
+'''
+many clients race to book the same car for the same dates: exactly one of them may win each
+round, the others must get 409. Reports the outcome counts, any double bookings found in the
+database afterwards and the booking latency
+
+by default the app runs in-process; pass --url to race against a running server, e.g. one
+started with several workers (python -m server --workers 4), where each worker's own
+availability index can't see the others' bookings and only the database keeps them apart
+
+usage (needs the same .env as the app, with migrations applied):
+    python -m benchmarks.bench_booking_race --clients 50 --rounds 20
+    python -m benchmarks.bench_booking_race --url http://127.0.0.1:8000 --clients 200
+'''
+from sqlalchemy import delete, func, insert, select
+from db import engine
+from models import Cars, Reservations
+from availability import BLOCKING_STATUSES
+from datetime import date, timedelta
+from statistics import quantiles
+from collections import Counter
+import argparse, asyncio, time
+import httpx
+
+RACE_DESCRIPTION = 'booking race'
+
+async def book(client: httpx.AsyncClient, car_id: int, start: date, days: int, client_id: int) -> tuple[int, float]:
+    reservation = {
+        'car_id': car_id,
+        'user_email': f'racer{client_id}@example.com',
+        'user_first_name': 'Racer',
+        'user_last_name': str(client_id),
+        'start_at': start.isoformat(),
+        'end_at': (start + timedelta(days=days)).isoformat(),
+        'total_amount': 50
+    }
+    begin = time.perf_counter()
+    resp = await client.post('/reservations/add', json=reservation)
+    return resp.status_code, time.perf_counter() - begin
+
+async def race(client: httpx.AsyncClient, car_id: int, clients: int, rounds: int) -> tuple[Counter, list[float]]:
+    outcomes = Counter()
+    latencies = []
+    start = date.today() + timedelta(days=30)
+    for i in range(rounds):
+        # every client asks for an overlapping window, shifted by a day or two
+        results = await asyncio.gather(*(book(client, car_id, start + timedelta(days=i * 10 + c % 2), 3, c) for c in range(clients)))
+        for code, latency in results:
+            outcomes[code] += 1
+            latencies.append(latency)
+    return outcomes, latencies
+
+async def run(url: str | None, clients: int, rounds: int, car_id: int) -> tuple[Counter, list[float]]:
+    if url is not None:
+        async with httpx.AsyncClient(base_url=url, timeout=60, limits=httpx.Limits(max_connections=clients)) as client:
+            return await race(client, car_id, clients, rounds)
+
+    from main import app
+    from db import async_engine
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(base_url='http://bench', transport=httpx.ASGITransport(app=app)) as client:
+                return await race(client, car_id, clients, rounds)
+    finally:
+        await async_engine.dispose()
+
+def double_bookings(car_id: int) -> int:
+    # pairs of blocking reservations of the race car whose dates overlap
+    first, second = Reservations.__table__.alias(), Reservations.__table__.alias()
+    stmt = select(func.count()).select_from(first).join(second, first.c.id < second.c.id).where(
+        first.c.car_id == car_id, second.c.car_id == car_id,
+        first.c.status.in_(BLOCKING_STATUSES), second.c.status.in_(BLOCKING_STATUSES),
+        first.c.start_at <= second.c.end_at, second.c.start_at <= first.c.end_at
+    )
+    with engine.connect() as conn:
+        return conn.scalar(stmt)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='a running server, by default the app runs in-process')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        car_id = conn.execute(insert(Cars).values(
+            make='Race', model='Car', year=2024, seats=4, transmission='automatic', daily_rate=50, description=RACE_DESCRIPTION
+        ).returning(Cars.id)).scalar_one()
+    try:
+        start = time.perf_counter()
+        outcomes, latencies = asyncio.run(run(args.url, args.clients, args.rounds, car_id))
+        elapsed = time.perf_counter() - start
+        overlapping = double_bookings(car_id)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(Reservations).where(Reservations.car_id == car_id))
+            conn.execute(delete(Cars).where(Cars.id == car_id))
+
+    cuts = quantiles(latencies, n=100)
+    print(f"{args.rounds} rounds x {args.clients} clients in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} bookings/s)")
+    print(f"  won {outcomes[200]} (expected {args.rounds}), rejected {outcomes[409]}, other {sum(outcomes.values()) - outcomes[200] - outcomes[409]}")
+    print(f"  double bookings in the database: {overlapping}")
+    print(f"  latency p50 {cuts[49] * 1000:.1f} ms, p95 {cuts[94] * 1000:.1f} ms, p99 {cuts[98] * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+'''
+compares exporting every reservation by paging through /admin/reservations (the old way)
+with the streaming /admin/reservations/export, in-process: wall time, requests and the peak
+memory traced while the rows are read
+
+seed the data first (python -m benchmarks.seed), the peak of the streaming export should
+stay flat as --scale grows
+
+usage (needs the same .env as the app, with migrations applied):
+    python -m benchmarks.seed --scale 100k
+    python -m benchmarks.bench_export --format csv
+'''
+from benchmarks.suite import login
+from config import settings
+from reservation_list import status_conditions, stream_reservations
+import argparse, asyncio, time, tracemalloc
+import httpx
+
+async def paged(client: httpx.AsyncClient, headers: dict) -> tuple[int, int]:
+    rows = requests = 0
+    cursor = None
+    while True:
+        params = {'limit': settings.PAGE_SIZE_MAX, **({'cursor': cursor} if cursor else {})}
+        page = (await client.get('/admin/reservations', params=params, headers=headers)).json()
+        requests += 1
+        rows += len(page.get('items', []))
+        cursor = page.get('next_cursor')
+        if not cursor:
+            return rows, requests
+
+async def streamed(export_format: str) -> tuple[int, int]:
+    # httpx's ASGITransport buffers the whole response body before returning it, so the
+    # generator the endpoint streams is drained directly to trace the server side memory
+    lines = 0
+    async for chunk in stream_reservations(status_conditions(None), export_format):
+        lines += chunk.count('\n')
+    # the csv export starts with a header row
+    return lines - (export_format == 'csv'), 1
+
+async def measure(run) -> dict:
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        rows, requests = await run
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'rows': rows, 'requests': requests, 'seconds': elapsed, 'peak_mib': peak / 2**20}
+
+async def run(export_format: str) -> dict:
+    from main import app
+    from db import async_engine
+    try:
+        # streamed outside the app lifespan, so its background work isn't traced with it
+        results = {'streamed': await measure(streamed(export_format))}
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(base_url='http://bench', transport=httpx.ASGITransport(app=app), timeout=None) as client:
+                headers = {'Authorization': f'Bearer {await login(client)}'}
+                results['paged'] = await measure(paged(client, headers))
+        return results
+    finally:
+        await async_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    args = parser.parse_args()
+
+    for label, stats in asyncio.run(run(args.format)).items():
+        print(
+            f"{label:<9} {stats['rows']:>9} rows in {stats['seconds']:7.2f} s ({stats['rows'] / stats['seconds']:8.0f} rows/s), "
+            f"{stats['requests']:>6} requests, peak {stats['peak_mib']:7.1f} MiB"
+        )
+
+if __name__ == '__main__':
+    main()
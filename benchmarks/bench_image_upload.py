@@ -0,0 +1,52 @@
+'''
+compares the old add_car upload loop (copy each file to disk, then upload it, one at a
+time) with the concurrent streaming pipeline, against the in-memory storage backend with a
+simulated per-upload latency
+
+usage:
+    python -m benchmarks.bench_image_upload --images 10 --latency 0.2
+'''
+from fastapi import UploadFile
+from storage import MemoryStorage
+from uploads import upload_images
+from io import BytesIO
+from uuid import uuid4
+import argparse, asyncio, os, shutil, tempfile, time
+
+def make_images(count: int, size: int) -> list[UploadFile]:
+    return [UploadFile(file=BytesIO(os.urandom(size)), filename=f'{i}.jpg') for i in range(count)]
+
+async def sequential_upload(images: list[UploadFile], storage: MemoryStorage, folder: str) -> list[str]:
+    urls = []
+    for img in images:
+        filename = f"{uuid4().hex}.jpg"
+        dir_path = os.path.join(folder, filename)
+        await img.seek(0)
+        with open(dir_path, "wb") as f:
+            shutil.copyfileobj(img.file, f)
+        with open(dir_path, "rb") as f:
+            urls.append(storage.save(f, filename)[0])
+    return urls
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=10)
+    parser.add_argument('--size', type=int, default=2_000_000, help='bytes per image')
+    parser.add_argument('--latency', type=float, default=0.2, help='simulated storage latency per upload, in seconds')
+    args = parser.parse_args()
+
+    storage = MemoryStorage(latency=args.latency)
+    with tempfile.TemporaryDirectory() as folder:
+        before = asyncio.run(timed(sequential_upload(make_images(args.images, args.size), storage, folder)))
+    after = asyncio.run(timed(upload_images(make_images(args.images, args.size), storage)))
+    print(f"{args.images} images of {args.size / 1e6:.1f} MB, {args.latency * 1000:.0f} ms upload latency")
+    print(f"  before (sequential, via disk): {before * 1000:8.1f} ms")
+    print(f"  after (concurrent, streamed):  {after * 1000:8.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+'''
+measures the cold start of the app: how long a fresh interpreter takes to import a module
+(main by default, i.e. what every uvicorn worker does before serving), plus the modules
+with the largest cumulative import time from python -X importtime
+
+usage (needs the same .env as the app):
+    python -m benchmarks.bench_import_time --runs 10
+    python -m benchmarks.bench_import_time --module config --top 5
+'''
+from statistics import median
+import argparse, subprocess, sys, time
+
+def import_once(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', f'import {module}'], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+def slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+    # -X importtime writes '<self us> | <cumulative us> | <module>' lines to stderr
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], check=True, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.removeprefix('import time:').split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    # the first run warms the bytecode cache so every measured run starts from .pyc files
+    import_once(args.module)
+    timings = [import_once(args.module) for _ in range(args.runs)]
+    print(f'import {args.module}: median {median(timings) * 1000:.1f} ms, min {min(timings) * 1000:.1f} ms over {args.runs} runs')
+    print(f'\nslowest imports (cumulative):')
+    for cumulative, name in slowest_imports(args.module, args.top):
+        print(f'{cumulative / 1000:>10.1f} ms  {name}')
+
+if __name__ == '__main__':
+    main()
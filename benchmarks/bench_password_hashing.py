@@ -0,0 +1,59 @@
+'''
+compares login latency and the latency seen by other requests on the same event loop
+when argon2 runs inline (the old behaviour) versus on the hashing pool
+
+usage (needs the same .env as the app):
+    python -m benchmarks.bench_password_hashing --logins 50
+'''
+from user import hash_password, verify_password, verify_password_async
+from statistics import quantiles
+import argparse, asyncio, time
+
+PROBE_INTERVAL = 0.005
+
+def percentiles(samples: list[float]) -> dict:
+    cuts = quantiles(samples, n=100)
+    return {'p50': cuts[49] * 1000, 'p99': cuts[98] * 1000}
+
+async def login(hashed: str, inline: bool, start: float) -> float:
+    # measured from the start of the burst so time spent queued counts as login latency
+    if inline:
+        verify_password('test_password', hashed)
+    else:
+        await verify_password_async('test_password', hashed)
+    return time.perf_counter() - start
+
+async def probe(stop: asyncio.Event, lags: list[float]) -> None:
+    # stands in for a cheap request (e.g. an availability search) sharing the worker:
+    # any delay beyond the requested sleep is time the loop was blocked
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+async def run(logins: int, inline: bool) -> tuple[dict, dict]:
+    hashed = hash_password('test_password')
+    stop = asyncio.Event()
+    lags: list[float] = []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(login(hashed, inline, start) for _ in range(logins)))
+    stop.set()
+    await probe_task
+    return percentiles(list(latencies)), percentiles(lags)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=50)
+    args = parser.parse_args()
+
+    for label, inline in (('before (inline)', True), ('after (pool)', False)):
+        login_stats, probe_stats = asyncio.run(run(args.logins, inline))
+        print(
+            f"{label:<16} login p50 {login_stats['p50']:8.1f} ms  p99 {login_stats['p99']:8.1f} ms  |  "
+            f"other requests p50 {probe_stats['p50']:8.1f} ms  p99 {probe_stats['p99']:8.1f} ms"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+measures how throughput scales with the number of server workers: starts python -m server
+with each worker count in turn, drives it with the load test and reports requests per
+second relative to a single worker
+
+usage (needs the same .env as the app, with migrations applied):
+    python -m benchmarks.bench_workers --workers 1 2 4 8
+    python -m benchmarks.bench_workers --workers 1 4 --path "/cars/available_cars?start=2030-01-01&end=2030-01-05"
+'''
+from benchmarks.loadtest import run as loadtest
+import argparse, asyncio, os, signal, subprocess, sys, time
+import httpx
+
+def wait_until_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'{url}/openapi.json', timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server at {url} did not start within {timeout} s')
+
+def measure(workers: int, port: int, path: str, concurrency: int, requests: int) -> dict:
+    env = {**os.environ, 'PORT': str(port), 'ACCESS_LOG': 'false'}
+    server = subprocess.Popen([sys.executable, '-m', 'server', '--workers', str(workers)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_ready(url, timeout=60)
+        # warm up every worker (connection pools, caches) before measuring
+        asyncio.run(loadtest(url, path, concurrency, concurrency * workers * 4))
+        return asyncio.run(loadtest(url, path, concurrency, requests))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--path', default='/cars/calendar?start=2030-01-01&days=90')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cores, {args.path}')
+    baseline = None
+    for workers in args.workers:
+        stats = measure(workers, args.port, args.path, args.concurrency, args.requests)
+        baseline = baseline or stats['rps']
+        print(
+            f"{workers:>3} workers: {stats['rps']:8.0f} req/s ({stats['rps'] / baseline:.2f}x), "
+            f"p50 {stats['p50']:.1f} ms, p99 {stats['p99']:.1f} ms, {stats['errors']} errors"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+'''
+runs EXPLAIN on the statements behind the hot routes and checks that each one is planned
+with the index that was added for it (see migrations.HOT_PATH_INDEXES)
+
+on a small database Postgres prefers sequential scans no matter which indexes exist, so
+sequential scans are disabled for the check by default. Pass --allow-seqscan on a
+database with production-sized data to see the plans the planner would really pick
+
+usage (needs the same .env as the app, with migrations applied):
+    python -m benchmarks.explain_queries
+    python -m benchmarks.explain_queries --allow-seqscan --verbose
+'''
+from sqlmodel import select
+from sqlalchemy import and_, text
+from db import engine
+from models import Cars, CarImages, Reservations, RefreshTokens, MediaJobs, JobStatus
+from availability import BLOCKING_STATUSES
+from reservation_list import COLUMNS, SORT_KEYS, status_conditions
+from pagination import keyset_page, encode_cursor
+from datetime import date, datetime, timezone
+import argparse, sys
+
+START = date(2025, 7, 1)
+EMAIL = 'user@example.com'
+PAGE = 20
+
+def reservation_page(conditions: list, sort: str, cursor: list):
+    return keyset_page(
+        select(*COLUMNS).join(Cars, Cars.id == Reservations.car_id).where(*conditions),
+        SORT_KEYS[sort], encode_cursor(cursor), PAGE
+    )
+
+# (route, statement, indexes that may serve it); the statements mirror the ones the routes build
+QUERIES = [
+    (
+        'availability index load',
+        select(Reservations.id, Reservations.car_id, Reservations.start_at, Reservations.end_at)
+            .where(Reservations.status.in_(BLOCKING_STATUSES))
+            .order_by(Reservations.car_id, Reservations.start_at),
+        ('ix_reservations_blocking_car_period',)
+    ),
+    (
+        'GET /cars/available_cars',
+        select(Cars, CarImages.image_url)
+            .outerjoin(CarImages, and_(CarImages.car_id == Cars.id, CarImages.is_primary == True))
+            .where(Cars.is_active, Cars.id.not_in([1, 2])),
+        ('ix_carimages_primary', 'ix_carimages_car_id')
+    ),
+    (
+        'GET /cars/{id}',
+        select(CarImages).where(CarImages.car_id == 1),
+        ('ix_carimages_car_id', 'ix_carimages_primary')
+    ),
+    (
+        'GET /admin/reservations?sort=status',
+        reservation_page(status_conditions('active'), 'status', ['pending', 100]),
+        ('ix_reservations_status_id',)
+    ),
+    (
+        'GET /admin/reservations?sort=start_at',
+        reservation_page(status_conditions(None), 'start_at', [START, 100]),
+        ('ix_reservations_start_at_id',)
+    ),
+    (
+        'GET /user_info/reservations',
+        reservation_page(status_conditions('active') + [Reservations.user_email == EMAIL], 'id', [100]),
+        ('ix_reservations_user_email_id', 'ix_reservations_user_email_status_id')
+    ),
+    (
+        'GET /admin/cars?stat=active',
+        keyset_page(select(*Cars.__table__.columns).where(Cars.is_active == True), (Cars.id,), encode_cursor([100]), PAGE),
+        ('ix_cars_is_active_id',)
+    ),
+    (
+        'DELETE /admin/cars (reservation check)',
+        select(Reservations.car_id).where(Reservations.car_id.in_([1, 2, 3])).distinct(),
+        ('ix_reservations_car_id', 'ix_reservations_blocking_car_period')
+    ),
+    (
+        'DELETE /admin/cars (images)',
+        select(CarImages.id).where(CarImages.car_id.in_([1, 2, 3])),
+        ('ix_carimages_car_id', 'ix_carimages_primary')
+    ),
+    (
+        'DELETE /admin/cars (media jobs)',
+        select(MediaJobs.id).where(MediaJobs.car_id.in_([1, 2, 3])),
+        ('ix_mediajobs_car_id',)
+    ),
+    (
+        'POST /user/logout',
+        select(RefreshTokens).where(RefreshTokens.user_id == 1),
+        ('ix_refreshtokens_user_id',)
+    ),
+    (
+        'GET /cars/search?sort=-daily_rate',
+        keyset_page(
+            select(Cars.id).where(Cars.is_active, Cars.daily_rate >= 40, Cars.daily_rate <= 120),
+            (Cars.daily_rate, Cars.id), encode_cursor(['100.00', 100]), PAGE, descending=True
+        ),
+        ('ix_cars_is_active_daily_rate_id',)
+    ),
+    (
+        'GET /cars/search?sort=year',
+        keyset_page(select(Cars.id).where(Cars.is_active, Cars.year >= 2020), (Cars.year, Cars.id), encode_cursor([2021, 100]), PAGE),
+        ('ix_cars_is_active_year_id',)
+    ),
+    (
+        'GET /cars/search?make=...',
+        select(Cars.id).where(Cars.is_active, Cars.make.in_(['Toyota', 'Honda'])),
+        ('ix_cars_is_active_make_model',)
+    ),
+    (
+        'media job recovery',
+        select(MediaJobs.id).where(MediaJobs.status == JobStatus.processing, MediaJobs.updated_at < datetime(2025, 7, 1, tzinfo=timezone.utc)),
+        ('ix_mediajobs_status_updated_at',)
+    ),
+]
+
+def explain(conn, stmt) -> list[str]:
+    # literal values so the planner can match partial index predicates, like it does for
+    # the custom plans psycopg gets with real parameters
+    sql = str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+    if engine.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+    return [row[0] for row in conn.execute(text(f'EXPLAIN {sql}'))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--allow-seqscan', action='store_true', help='keep sequential scans enabled')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    failures = 0
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql' and not args.allow_seqscan:
+            conn.execute(text('SET enable_seqscan = off'))
+        for route, stmt, indexes in QUERIES:
+            plan = explain(conn, stmt)
+            used = [name for name in indexes if any(name in line for line in plan)]
+            failures += not used
+            print(f"{'ok  ' if used else 'MISS'} {route:<42} {', '.join(used) or 'expected ' + ' or '.join(indexes)}")
+            if args.verbose or not used:
+                for line in plan:
+                    print(f'       {line}')
+        conn.rollback()
+
+    print(f'\n{len(QUERIES) - failures}/{len(QUERIES)} queries use their index')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
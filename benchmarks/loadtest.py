@@ -0,0 +1,73 @@
+'''
+drives concurrent requests against a running server and reports throughput and tail
+latency. Run it against the previous build and the current one to compare them
+
+usage:
+    uvicorn main:app --port 8000
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --path "/cars/available_cars?start=2030-01-01&end=2030-01-05" --concurrency 64 --requests 5000
+'''
+from statistics import quantiles
+import argparse, asyncio, time
+import httpx
+
+async def worker(client: httpx.AsyncClient, path: str, remaining: list[int], latencies: list[float], errors: list[int], headers: dict) -> None:
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        start = time.perf_counter()
+        resp = await client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            errors[0] += 1
+
+async def run(url: str, path: str, concurrency: int, requests: int, token: str | None = None, transport: httpx.AsyncBaseTransport | None = None) -> dict:
+    '''
+    sends `requests` GET requests to `path` from `concurrency` concurrent clients
+
+    Input:
+        url: the base url of the server
+        path: the path (and query string) to request
+        concurrency: how many requests are in flight at once
+        requests: the total number of requests to send
+        token: an optional bearer token for authenticated routes
+        transport: an optional transport, e.g. httpx.ASGITransport to drive the app in-process
+    Returns:
+        a dict with the request count, error count, requests per second and p50/p95/p99 latency in ms
+    '''
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: list[float] = []
+    errors = [0]
+    remaining = [requests]
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60, transport=transport) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, path, remaining, latencies, errors, headers) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    cuts = quantiles(latencies, n=100)
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'p50': cuts[49] * 1000,
+        'p95': cuts[94] * 1000,
+        'p99': cuts[98] * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--path', action='append', required=True)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--token')
+    args = parser.parse_args()
+
+    for path in args.path:
+        stats = asyncio.run(run(args.url, path, args.concurrency, args.requests, args.token))
+        print(
+            f"{path}\n  {stats['requests']} requests, {stats['errors']} errors, {stats['rps']:.0f} req/s, "
+            f"p50 {stats['p50']:.1f} ms, p95 {stats['p95']:.1f} ms, p99 {stats['p99']:.1f} ms"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+'''
+seeds a reproducible fleet and reservation history for the benchmarks: cars with a primary
+image, about RESERVATIONS_PER_CAR non-overlapping reservations per car spread around today
+(completed and cancelled in the past, active now, pending and confirmed ahead) and an admin
+user for the authenticated routes
+
+works on Postgres and on SQLite as a local stand-in; seeded rows are marked so --clear
+removes them without touching anything else
+
+usage (needs the same .env as the app, with migrations applied):
+    python -m benchmarks.seed --scale 100k
+    python -m benchmarks.seed --reservations 250000 --seed 7
+    python -m benchmarks.seed --clear
+'''
+from sqlalchemy import delete, insert, select
+from db import engine
+from models import Cars, CarImages, Reservations, Users, ReservationStatus
+from user import hash_password
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterator
+import argparse, random, time
+
+# reservations to seed per --scale preset
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+RESERVATIONS_PER_CAR = 100
+CHUNK_SIZE = 10_000
+# seeded cars carry this description, which is how they are found again
+SEED_DESCRIPTION = 'benchmark fleet'
+ADMIN_EMAIL = 'bench-admin@example.com'
+ADMIN_PASSWORD = 'bench_password'
+
+FLEET = [
+    ('Toyota', 'Corolla', 5, 'automatic', 45), ('Toyota', 'RAV4', 5, 'automatic', 65),
+    ('Honda', 'Civic', 5, 'manual', 42), ('Honda', 'Odyssey', 8, 'automatic', 90),
+    ('Ford', 'Mustang', 4, 'manual', 110), ('Ford', 'Explorer', 7, 'automatic', 85),
+    ('Tesla', 'Model 3', 5, 'automatic', 120), ('Volkswagen', 'Golf', 5, 'manual', 40),
+    ('BMW', 'X5', 5, 'automatic', 150), ('Kia', 'Carnival', 8, 'automatic', 80)
+]
+
+def generate_cars(rng: random.Random, count: int) -> list[dict]:
+    cars = []
+    for _ in range(count):
+        make, model, seats, transmission, rate = rng.choice(FLEET)
+        cars.append({
+            'make': make,
+            'model': model,
+            'year': rng.randint(2015, 2025),
+            'seats': seats,
+            'transmission': transmission,
+            'daily_rate': Decimal(rate + rng.randint(-5, 15)),
+            'description': SEED_DESCRIPTION,
+            'is_active': rng.random() > 0.05
+        })
+    return cars
+
+def reservation_status(rng: random.Random, start: date, end: date, today: date) -> ReservationStatus:
+    if end < today:
+        return ReservationStatus.completed if rng.random() < 0.85 else ReservationStatus.cancelled
+    if start <= today:
+        return ReservationStatus.active
+    roll = rng.random()
+    if roll < 0.6:
+        return ReservationStatus.confirmed
+    return ReservationStatus.pending if roll < 0.9 else ReservationStatus.cancelled
+
+def generate_reservations(rng: random.Random, cars: list[tuple[int, Decimal]], per_car: int, customers: int, today: date) -> Iterator[list[dict]]:
+    '''
+    lays out each car's reservations back to back with random gaps, so blocking reservations
+    never overlap (the exclusion constraint from the readme holds)
+
+    Input:
+        rng: the random source
+        cars: (car id, daily rate) pairs
+        per_car: reservations per car
+        customers: the number of distinct customer emails
+        today: the reference date for the statuses
+    Returns:
+        chunks of at most CHUNK_SIZE rows
+    '''
+    chunk = []
+    for car_id, rate in cars:
+        # an average reservation plus gap takes about 17 days; about two thirds of each
+        # car's history lies in the past
+        cursor = today - timedelta(days=int(per_car * 17 * 0.65) + rng.randint(0, 30))
+        for _ in range(per_car):
+            start = cursor + timedelta(days=rng.randint(0, 20))
+            end = start + timedelta(days=rng.randint(0, 13))
+            cursor = end + timedelta(days=1)
+            customer = rng.randrange(customers)
+            chunk.append({
+                'car_id': car_id,
+                'user_email': f'customer{customer}@example.com',
+                'user_first_name': 'Customer',
+                'user_last_name': str(customer),
+                'start_at': start,
+                'end_at': end,
+                'status': reservation_status(rng, start, end, today),
+                'total_amount': rate * ((end - start).days + 1)
+            })
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def seeded_car_ids() -> list[int]:
+    with engine.connect() as conn:
+        return list(conn.scalars(select(Cars.id).where(Cars.description == SEED_DESCRIPTION).order_by(Cars.id)))
+
+def clear() -> None:
+    '''
+    deletes the seeded cars with their images and reservations, and the benchmark admin
+
+    Returns:
+        None
+    '''
+    seeded = select(Cars.id).where(Cars.description == SEED_DESCRIPTION).scalar_subquery()
+    with engine.begin() as conn:
+        conn.execute(delete(Reservations).where(Reservations.car_id.in_(seeded)))
+        conn.execute(delete(CarImages).where(CarImages.car_id.in_(seeded)))
+        conn.execute(delete(Cars).where(Cars.description == SEED_DESCRIPTION))
+        conn.execute(delete(Users).where(Users.email == ADMIN_EMAIL))
+
+def seed(reservations: int, seed_value: int = 0) -> None:
+    '''
+    seeds the fleet, the reservation history and the benchmark admin
+
+    Input:
+        reservations: the number of reservations, cars are added at RESERVATIONS_PER_CAR each
+        seed_value: the random seed, the same seed gives the same data
+    Returns:
+        None
+    '''
+    rng = random.Random(seed_value)
+    today = date.today()
+    car_count = max(reservations // RESERVATIONS_PER_CAR, 1)
+
+    with engine.begin() as conn:
+        if conn.scalar(select(Users.id).where(Users.email == ADMIN_EMAIL)) is None:
+            conn.execute(insert(Users).values(
+                first_name='Bench', last_name='Admin', email=ADMIN_EMAIL,
+                password_hash=hash_password(ADMIN_PASSWORD), is_admin=True
+            ))
+        conn.execute(insert(Cars), generate_cars(rng, car_count))
+
+    car_ids = seeded_car_ids()[-car_count:]
+    with engine.connect() as conn:
+        rates = dict(conn.execute(select(Cars.id, Cars.daily_rate).where(Cars.id.in_(car_ids))).all())
+    with engine.begin() as conn:
+        conn.execute(insert(CarImages), [
+            {'car_id': car_id, 'image_url': f'https://images.example.com/cars/{car_id}.jpg', 'is_primary': True}
+            for car_id in car_ids
+        ])
+
+    # one transaction per chunk keeps memory flat and lets a long 10m run make progress
+    customers = max(reservations // 20, 1)
+    inserted = 0
+    for chunk in generate_reservations(rng, [(car_id, rates[car_id]) for car_id in car_ids], RESERVATIONS_PER_CAR, customers, today):
+        with engine.begin() as conn:
+            conn.execute(insert(Reservations), chunk)
+        inserted += len(chunk)
+        print(f'\r{inserted}/{car_count * RESERVATIONS_PER_CAR} reservations', end='', flush=True)
+    print()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--reservations', type=int, help='overrides --scale')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clear', action='store_true', help='only delete previously seeded data')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    clear()
+    if not args.clear:
+        seed(args.reservations or SCALES[args.scale], args.seed)
+    print(f'done in {time.perf_counter() - start:.1f} s')
+
+if __name__ == '__main__':
+    main()
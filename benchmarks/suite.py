@@ -0,0 +1,172 @@
+'''
+benchmark suite for the main read endpoints: drives each scenario concurrently and reports
+throughput, p50/p95/p99 latency and, when the app runs in-process, memory allocated while
+serving it. Results can be saved as a baseline and later runs compared against it, failing
+when a scenario regresses by more than the tolerance
+
+seed the data first (python -m benchmarks.seed). By default the app runs in-process behind
+httpx.ASGITransport, which measures the application without a server in between; pass --url
+to drive a running server instead (no allocation figures then)
+
+usage (needs the same .env as the app, with migrations applied):
+    python -m benchmarks.seed --scale 100k
+    python -m benchmarks.suite --save benchmarks/baselines/100k.json
+    python -m benchmarks.suite --compare benchmarks/baselines/100k.json --tolerance 0.15
+    python -m benchmarks.suite --url http://127.0.0.1:8000 --scenario calendar
+'''
+from benchmarks.loadtest import run as loadtest
+from benchmarks.seed import ADMIN_EMAIL, ADMIN_PASSWORD, seeded_car_ids
+from datetime import date, timedelta
+import argparse, asyncio, json, os, platform, sys, tracemalloc
+import httpx
+
+# the metrics a regression is judged on, and whether higher is better
+COMPARED = {'rps': True, 'p95': False, 'p99': False, 'peak_kib': False}
+
+def scenarios(car_id: int) -> dict[str, tuple[str, bool]]:
+    '''
+    the benchmarked requests, with dates relative to today like the seeded data
+
+    Input:
+        car_id: a seeded car
+    Returns:
+        a dict of scenario name -> (path, whether it needs the admin token)
+    '''
+    start = date.today() + timedelta(days=7)
+    return {
+        'available_cars': (f'/cars/available_cars?start={start}&end={start + timedelta(days=4)}', False),
+        'car': (f'/cars/{car_id}', False),
+        'calendar': (f'/cars/calendar?start={start}&days=90', False),
+        'admin_reservations': ('/admin/reservations?sort=start_at&statuses=active', True),
+        'admin_cars': ('/admin/cars?stat=active', True)
+    }
+
+async def login(client: httpx.AsyncClient) -> str:
+    resp = await client.post('/user/token', data={'username': ADMIN_EMAIL, 'password': ADMIN_PASSWORD})
+    resp.raise_for_status()
+    return resp.json()['access_token']
+
+async def measure_allocations(url: str, path: str, concurrency: int, requests: int, token: str | None, transport: httpx.AsyncBaseTransport) -> dict:
+    # a separate pass, since tracing every allocation slows the requests down
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await loadtest(url, path, concurrency, requests, token, transport)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_kib': (peak - before) / 1024, 'retained_kib': (current - before) / 1024}
+
+async def run_suite(url: str | None, names: list[str], concurrency: int, requests: int, alloc_requests: int) -> dict:
+    '''
+    runs the selected scenarios
+
+    Input:
+        url: a running server, or None to run the app in-process
+        names: the scenarios to run
+        concurrency: how many requests are in flight at once
+        requests: requests per scenario
+        alloc_requests: requests in the allocation pass of each scenario (in-process only)
+    Returns:
+        a dict of scenario name -> stats
+    '''
+    car_ids = seeded_car_ids()
+    if not car_ids:
+        raise RuntimeError('no benchmark data, run python -m benchmarks.seed first')
+    paths = scenarios(car_ids[len(car_ids) // 2])
+
+    if url is None:
+        from main import app
+        from db import async_engine
+        try:
+            async with app.router.lifespan_context(app):
+                return await run_scenarios('http://bench', paths, names, concurrency, requests, alloc_requests, httpx.ASGITransport(app=app))
+        finally:
+            # pooled connections belong to this event loop, close them before it goes away
+            await async_engine.dispose()
+    return await run_scenarios(url, paths, names, concurrency, requests, 0, None)
+
+async def run_scenarios(url: str, paths: dict, names: list[str], concurrency: int, requests: int, alloc_requests: int, transport: httpx.AsyncBaseTransport | None) -> dict:
+    async with httpx.AsyncClient(base_url=url, transport=transport) as client:
+        token = await login(client)
+
+    results = {}
+    for name in names:
+        path, needs_token = paths[name]
+        scenario_token = token if needs_token else None
+        # warm-up: connection pools, caches and lazily built state
+        await loadtest(url, path, concurrency, concurrency * 2, scenario_token, transport)
+        stats = await loadtest(url, path, concurrency, requests, scenario_token, transport)
+        if alloc_requests:
+            stats.update(await measure_allocations(url, path, concurrency, alloc_requests, scenario_token, transport))
+        results[name] = stats
+        print(format_stats(name, stats), flush=True)
+    return results
+
+def format_stats(name: str, stats: dict) -> str:
+    line = (
+        f"{name:<20} {stats['rps']:8.0f} req/s  p50 {stats['p50']:7.1f} ms  p95 {stats['p95']:7.1f} ms  "
+        f"p99 {stats['p99']:7.1f} ms  {stats['errors']} errors"
+    )
+    if 'peak_kib' in stats:
+        line += f"  peak {stats['peak_kib']:8.0f} KiB  retained {stats['retained_kib']:6.0f} KiB"
+    return line
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    '''
+    compares a run with a saved baseline
+
+    Input:
+        results: the scenario stats of this run
+        baseline: the scenario stats of the baseline
+        tolerance: the allowed relative change, e.g. 0.15 for 15%
+    Returns:
+        a description of every regression, empty if there are none
+    '''
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            if metric not in stats or metric not in baseline[name] or not baseline[name][metric]:
+                continue
+            change = stats[metric] / baseline[name][metric] - 1
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f'{name} {metric}: {baseline[name][metric]:.1f} -> {stats[metric]:.1f} ({change:+.0%})')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='a running server, by default the app runs in-process')
+    parser.add_argument('--scenario', action='append', help='run only these scenarios (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--alloc-requests', type=int, default=200)
+    parser.add_argument('--save', help='write the results to this baseline file')
+    parser.add_argument('--compare', help='compare the results with this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args()
+
+    names = args.scenario or list(scenarios(0))
+    results = asyncio.run(run_suite(args.url, names, args.concurrency, args.requests, args.alloc_requests))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            # baselines only compare meaningfully on the same machine, database and data
+            meta = {'python': platform.python_version(), 'machine': platform.node(), 'cores': os.cpu_count(), 'concurrency': args.concurrency}
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions beyond {args.tolerance:.0%}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+import time
+
+class TTLCache:
+    '''
+    a bounded, thread-safe LRU cache whose entries also expire after a fixed time to live
+    '''
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        looks up a key, dropping it if it has expired
+
+        Input:
+            key: the cache key
+            default: the value returned on a miss
+        Returns:
+            the cached value or default
+        '''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        '''
+        stores a value, evicting the least recently used entry when the cache is full
+
+        Input:
+            key: the cache key
+            value: the value to store
+            ttl: overrides the cache's time to live for this entry
+        Returns:
+            None
+        '''
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        '''
+        removes a key if it is present
+
+        Input:
+            key: the cache key
+        Returns:
+            None
+        '''
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self) -> list[Hashable]:
+        '''
+        lists the keys that have not expired
+
+        Returns:
+            a snapshot of the keys, least recently used first
+        '''
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (expires_at, _) in self._data.items() if expires_at > now]
+
+    def clear(self) -> None:
+        '''
+        removes every entry
+
+        Returns:
+            None
+        '''
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
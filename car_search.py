@@ -0,0 +1,135 @@
+from fastapi import HTTPException, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, func
+from models import Cars, CarImages, CarFilters, Transmission
+from availability import availability_index
+from pricing import price_engine, check_span
+from pagination import keyset_page, split_page
+from datetime import date
+
+# sort name -> (sort columns, descending); each ends in the primary key so the keyset is
+# unique, and the price and year sorts are backed by ix_cars_is_active_daily_rate_id and
+# ix_cars_is_active_year_id
+SORT_KEYS = {
+    'id': ((Cars.id,), False),
+    'daily_rate': ((Cars.daily_rate, Cars.id), False),
+    '-daily_rate': ((Cars.daily_rate, Cars.id), True),
+    'year': ((Cars.year, Cars.id), False),
+    '-year': ((Cars.year, Cars.id), True)
+}
+
+FACETS = ('make', 'model', 'year', 'seats', 'transmission')
+
+def facet_conditions(filters: CarFilters) -> dict[str, list]:
+    '''
+    maps each facet to the conditions its filters add to the search
+
+    Input:
+        filters: the search filters
+    Returns:
+        a dict of facet -> conditions, empty for facets that aren't filtered
+    '''
+    conditions: dict[str, list] = {facet: [] for facet in FACETS}
+    if filters.make:
+        conditions['make'].append(Cars.make.in_(filters.make))
+    if filters.model:
+        conditions['model'].append(Cars.model.in_(filters.model))
+    if filters.year_min is not None:
+        conditions['year'].append(Cars.year >= filters.year_min)
+    if filters.year_max is not None:
+        conditions['year'].append(Cars.year <= filters.year_max)
+    if filters.seats:
+        conditions['seats'].append(Cars.seats.in_(filters.seats))
+    if filters.transmission:
+        conditions['transmission'].append(Cars.transmission.in_(filters.transmission))
+    return conditions
+
+def facet_matches(filters: CarFilters, facet: str, value) -> bool:
+    # facet_conditions applied in python, to the grouped facet rows
+    match facet:
+        case 'year':
+            return (filters.year_min is None or value >= filters.year_min) and (filters.year_max is None or value <= filters.year_max)
+        case _:
+            selected = getattr(filters, facet)
+            return not selected or value in selected
+
+def base_conditions(filters: CarFilters) -> list:
+    # filters that aren't facets apply to the facet counts as well
+    conditions = [Cars.is_active]
+    if filters.rate_min is not None:
+        conditions.append(Cars.daily_rate >= filters.rate_min)
+    if filters.rate_max is not None:
+        conditions.append(Cars.daily_rate <= filters.rate_max)
+    return conditions
+
+async def count_facets(db: AsyncSession, base: list, filters: CarFilters) -> tuple[int, dict[str, dict]]:
+    '''
+    counts the matching cars per facet value with a single GROUP BY over every facet column.
+    Each facet is counted with every filter except its own, so the values a client could
+    switch to keep their counts
+
+    Input:
+        db: a database session
+        base: the conditions that apply to every count
+        filters: the search filters
+    Returns:
+        the number of cars matching every filter and a dict of facet -> value -> count
+    '''
+    columns = [getattr(Cars, facet) for facet in FACETS]
+    groups = (await db.exec(select(*columns, func.count()).where(*base).group_by(*columns))).all()
+
+    total = 0
+    facets: dict[str, dict] = {facet: {} for facet in FACETS}
+    for *values, count in groups:
+        matches = {facet: facet_matches(filters, facet, value) for facet, value in zip(FACETS, values)}
+        if all(matches.values()):
+            total += count
+        for facet, value in zip(FACETS, values):
+            if all(matched for other, matched in matches.items() if other != facet):
+                key = value.value if isinstance(value, Transmission) else value
+                facets[facet][key] = facets[facet].get(key, 0) + count
+    return total, {facet: dict(sorted(counts.items())) for facet, counts in facets.items()}
+
+async def search_cars(db: AsyncSession, start: date, end: date, filters: CarFilters, sort: str, cursor: str | None, limit: int) -> dict:
+    '''
+    gets one keyset page of the cars available for the dates that match the filters, with
+    their price for the dates and the facet counts
+
+    Input:
+        db: a database session
+        start: the first rented day
+        end: the last rented day
+        filters: the search filters
+        sort: one of SORT_KEYS
+        cursor: the cursor of the previous page, or None for the first page
+        limit: the page size
+    Returns:
+        a dict with the page items, the next cursor (None on the last page), the number of
+        matching cars and the facet counts
+    Raises:
+        HTTPException (400): if the dates, the sort order or the cursor are invalid
+    '''
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid sort {sort}')
+    try:
+        check_span(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    base = base_conditions(filters) + [Cars.id.not_in(availability_index.unavailable_cars(start, end))]
+    total, facets = await count_facets(db, base, filters)
+
+    columns, descending = SORT_KEYS[sort]
+    primary_image = and_(CarImages.car_id == Cars.id, CarImages.is_primary == True)
+    conditions = base + [condition for conditions_of_facet in facet_conditions(filters).values() for condition in conditions_of_facet]
+    stmt = keyset_page(select(Cars, CarImages.image_url).outerjoin(CarImages, primary_image).where(*conditions), columns, cursor, limit, descending)
+    rows, next_cursor = split_page((await db.exec(stmt)).all(), limit, lambda row: [getattr(row[0], column.key) for column in columns])
+
+    quotes = price_engine.quote_many({car.id: car.daily_rate for car, _ in rows}, start, end)
+    items = []
+    for car, image_url in rows:
+        car = car.model_dump()
+        car['image_url'] = image_url
+        car['total_amount'] = quotes[car['id']]
+        items.append(car)
+    return {'items': items, 'next_cursor': next_cursor, 'total': total, 'facets': facets}
@@ -1,12 +1,89 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from decimal import Decimal
+import os
 
 class Settings(BaseSettings):
+    # read once, from the .env next to this file; variables set in the environment win
+    model_config = SettingsConfigDict(env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'), extra='ignore')
+    DB_URL: str
+    SECRET_KEY: str
+    ALGORITHM: str
+    IK_PRIVATE: str | None = None
+    IK_PUBLIC: str | None = None
+    IK_URL: str | None = None
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     REFRESH_COOKIE_NAME: str = 'refresh_token'
     REFRESH_COOKIE_PATH: str = '/'
     CSRF_COOKIE_NAME: str ='csrf_token'
     CSRF_HEADER_NAME: str = 'X-CSRF-Token'
+    REFRESH_TOKEN_SWEEP_SECONDS: int = 3600
+    # rotated and revoked refresh tokens remembered in memory, 0 disables the set
+    REVOKED_TOKEN_CACHE_SIZE: int = 10000
     MEDIA_PATH: str = 'media'
+    PAGE_SIZE_DEFAULT: int = 20
+    PAGE_SIZE_MAX: int = 100
+    # rows fetched per round trip by the streaming reservation export
+    EXPORT_BATCH_SIZE: int = 1000
+    # exports running at once per worker; each holds its own database connection, outside
+    # the request pool, for the whole download
+    EXPORT_MAX_CONCURRENT: int = 2
+    IMAGE_UPLOAD_CONCURRENCY: int = 4
+    THUMBNAIL_WIDTH: int = 400
+    MEDIA_JOB_WORKERS: int = 2
+    MEDIA_JOB_MAX_ATTEMPTS: int = 3
+    MEDIA_JOB_RETRY_DELAY: float = 2.0
+    MEDIA_JOB_STALE_SECONDS: int = 600
+    # where car images are stored: 'imagekit', 'local' (MEDIA_PATH/images, served at
+    # MEDIA_URL) or 'memory' (offline fake for tests and benchmarks)
+    STORAGE_BACKEND: str = 'imagekit'
+    MEDIA_URL: str = '/media/images'
+    MEMORY_STORAGE_LATENCY: float = 0.0
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # connections the whole server may open; when set, python -m server splits it between
+    # the workers and overrides DB_POOL_SIZE and DB_MAX_OVERFLOW
+    DB_MAX_CONNECTIONS: int | None = None
+    HOST: str = '0.0.0.0'
+    PORT: int = 8000
+    # defaults to one worker per core
+    WEB_WORKERS: int | None = None
+    GRACEFUL_SHUTDOWN_SECONDS: int = 30
+    ACCESS_LOG: bool = False
+    SERVER_TIMING_HEADER: bool = True
+    # a statement running this many times in one request is reported as a possible N+1
+    N_PLUS_ONE_THRESHOLD: int = 5
+    AVAILABILITY_REFRESH_SECONDS: int = 60
+    CALENDAR_MAX_DAYS: int = 366
+    PASSWORD_HASH_WORKERS: int = 4
+    # serve /admin/reservation_counts from the reservationcounts rollup table
+    RESERVATION_COUNTS_ROLLUP: bool = False
+    RESERVATION_BATCH_MAX: int = 500
+    # longest span a reservation, quote or search may ask for
+    MAX_RENTAL_DAYS: int = 366
+    # reservations are priced from the car's daily rate; the defaults charge every day alike.
+    # Complex values are JSON in the environment, e.g.
+    # PRICING_SEASONS='[["06-15", "08-31", "1.25"]]' and PRICING_LONG_RENTAL_DISCOUNTS='{"7": "0.1", "28": "0.2"}'
+    PRICING_WEEKEND_MULTIPLIER: Decimal = Decimal('1')
+    PRICING_SEASONS: list[tuple[str, str, Decimal]] = []
+    PRICING_LONG_RENTAL_DISCOUNTS: dict[int, Decimal] = {}
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: int = 60
+    # a change to a user is only evicted from the worker that made it, so admins are cached
+    # briefly: a demotion reaches the other workers within this many seconds
+    USER_CACHE_ADMIN_TTL_SECONDS: int = 5
+    # when enabled, get_current_user builds the user from the access token claims without
+    # touching the database; role changes then only apply once the token expires
+    TRUST_TOKEN_CLAIMS: bool = False
+    RESPONSE_CACHE_SIZE: int = 1024
+    # also bounds how long another worker's reservation can go unnoticed with the per-process store
+    RESPONSE_CACHE_TTL_SECONDS: int = 60
+    RESPONSE_CACHE_MAX_AGE: int = 0
+    # shared store for the response cache (e.g. redis://localhost:6379/0), needs the redis package.
+    # Responses built from the per-process availability index stay in each worker's memory
+    RESPONSE_CACHE_URL: str | None = None
     
 settings = Settings()
\ No newline at end of file
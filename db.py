@@ -1,14 +1,44 @@
 from fastapi import Depends
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from typing import Annotated
-from dotenv import find_dotenv, load_dotenv
-import os
+from config import settings
+from db_pool import InstrumentedQueuePool, InstrumentedAsyncQueuePool
 
-path = find_dotenv()
-load_dotenv(path)
-DB_URL = os.getenv('DB_URL')
+pool_options = {
+    'pool_size': settings.DB_POOL_SIZE,
+    'max_overflow': settings.DB_MAX_OVERFLOW,
+    'pool_timeout': settings.DB_POOL_TIMEOUT,
+    'pool_recycle': settings.DB_POOL_RECYCLE,
+    'pool_pre_ping': settings.DB_POOL_PRE_PING
+}
 
-engine = create_engine(DB_URL)
+def async_db_url(url: str) -> str:
+    '''
+    derives the URL of the async engine from DB_URL. postgresql+psycopg already resolves to
+    psycopg 3's async driver under create_async_engine; SQLite (the local stand-in the tests
+    and benchmarks can run on) needs aiosqlite named explicitly
+
+    Input:
+        url: the database URL
+    Returns:
+        the URL with an async driver
+    '''
+    if url.startswith('sqlite://'):
+        return url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+    return url
+
+engine = create_engine(settings.DB_URL, poolclass=InstrumentedQueuePool, **pool_options)
+async_engine = create_async_engine(async_db_url(settings.DB_URL), poolclass=InstrumentedAsyncQueuePool, **pool_options)
+# a streaming export holds its connection for the whole download, so exports connect through
+# their own unpooled engine instead of tying up the request pool; reservation_list bounds how
+# many run at once (settings.EXPORT_MAX_CONCURRENT)
+export_engine = create_async_engine(async_db_url(settings.DB_URL), poolclass=NullPool)
+# objects stay usable after commit; an expired attribute would need an implicit (and, in
+# async code, illegal) lazy load
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def get_session():
     with Session(engine) as session:
@@ -16,5 +46,17 @@ def get_session():
         
 SessionDep = Annotated[Session, Depends(get_session)]
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+async def get_async_session():
+    async with async_session_maker() as session:
+        yield session
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+def get_pool_stats() -> dict:
+    '''
+    gets connection pool statistics for both engines
+    
+    Returns:
+        a dict with the async (request) pool and sync (startup/background) pool statistics
+    '''
+    return {'async': async_engine.pool.stats(), 'sync': engine.pool.stats()}
@@ -0,0 +1,74 @@
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy import exc
+from threading import Lock
+import time
+
+class PoolMetrics:
+    '''
+    running counters for a connection pool: how many checkouts happened, how long callers
+    waited for a connection, and how often the pool had to overflow or timed out
+    '''
+    def __init__(self):
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = Lock()
+
+    def record_checkout(self, wait: float, overflowed: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+class InstrumentedPoolMixin:
+    '''
+    times every checkout from the pool and records it in self.metrics
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        overflow_before = self.overflow()
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start, self.overflow() > max(overflow_before, 0))
+        return conn
+
+    def stats(self) -> dict:
+        '''
+        reports the current pool state together with the running counters
+
+        Returns:
+            a dict of pool statistics, wait times in milliseconds
+        '''
+        metrics = self.metrics
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'checkouts': metrics.checkouts,
+            'overflow_events': metrics.overflow_events,
+            'timeouts': metrics.timeouts,
+            'wait_ms_avg': metrics.wait_seconds_total / metrics.checkouts * 1000 if metrics.checkouts else 0.0,
+            'wait_ms_max': metrics.wait_seconds_max * 1000
+        }
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
@@ -0,0 +1,183 @@
+from fastapi import UploadFile
+from sqlmodel import select
+from sqlalchemy import update
+from db import async_session_maker
+from config import settings
+from models import Cars, CarImages, MediaJobs, JobStatus
+from uploads import store_file
+from storage import get_storage
+from response_cache import response_cache
+from datetime import datetime, timezone, timedelta
+from uuid import uuid4
+import asyncio, os, shutil, logging
+
+logger = logging.getLogger(__name__)
+
+def job_folder(job_id: str) -> str:
+    return os.path.join(settings.MEDIA_PATH, 'jobs', job_id)
+
+def spool_images(job_id: str, images: list[UploadFile]) -> None:
+    '''
+    copies the raw uploads to MEDIA_PATH/jobs/<job id> so a worker (or a restarted process)
+    can pick them up after the request has returned
+
+    Input:
+        job_id: the id of the job
+        images: the uploaded files, the first one becomes the primary image
+    Returns:
+        None
+    '''
+    folder = job_folder(job_id)
+    os.makedirs(folder, exist_ok=True)
+    for i, img in enumerate(images):
+        ext = os.path.splitext(img.filename or "")[1].lower() or ".bin"
+        img.file.seek(0)
+        # zero padded so the original order survives a directory listing
+        with open(os.path.join(folder, f"{i:04d}{ext}"), "wb") as f:
+            shutil.copyfileobj(img.file, f)
+
+class MediaJobQueue:
+    '''
+    in-process queue of car media jobs. Job state lives in the mediajobs table, so any
+    worker process can answer status polls and unfinished jobs are picked up again on startup
+    '''
+    def __init__(self):
+        self.queue: asyncio.Queue | None = None
+        self.workers: list[asyncio.Task] = []
+
+    async def start(self, workers: int) -> None:
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._work()) for _ in range(workers)]
+        # jobs that are still queued, or whose worker died mid-way (processing for longer
+        # than MEDIA_JOB_STALE_SECONDS)
+        stale = datetime.now(timezone.utc) - timedelta(seconds=settings.MEDIA_JOB_STALE_SECONDS)
+        async with async_session_maker() as db:
+            await db.exec(update(MediaJobs).where(MediaJobs.status == JobStatus.processing, MediaJobs.updated_at < stale).values(status=JobStatus.queued))
+            await db.commit()
+            stmt = select(MediaJobs.id).where(MediaJobs.status == JobStatus.queued)
+            for job_id in (await db.exec(stmt)).all():
+                if os.path.isdir(job_folder(job_id)):
+                    self.queue.put_nowait(job_id)
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, car: Cars, images: list[UploadFile]) -> MediaJobs:
+        '''
+        creates a job for a car that was just added and queues it
+
+        Input:
+            car: the car the images belong to
+            images: the uploaded files
+        Returns:
+            the created job
+        '''
+        job = MediaJobs(id=uuid4().hex, car_id=car.id)
+        await asyncio.to_thread(spool_images, job.id, images)
+        async with async_session_maker() as db:
+            db.add(job)
+            await db.commit()
+        # without running workers (e.g. outside the app lifespan) the job stays queued and
+        # is recovered on the next startup
+        if self.queue:
+            self.queue.put_nowait(job.id)
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self.process(job_id)
+            except Exception:
+                logger.exception("media job %s crashed", job_id)
+            finally:
+                self.queue.task_done()
+
+    async def process(self, job_id: str) -> None:
+        '''
+        uploads a job's images, inserts the CarImages rows and activates the car. Failures
+        are retried with exponential backoff up to settings.MEDIA_JOB_MAX_ATTEMPTS times. A
+        job whose car (or the job itself) was deleted is dropped. The spool folder is removed
+        unless the job is waiting for a retry or run by another worker
+
+        Input:
+            job_id: the id of the job
+        Returns:
+            None
+        '''
+        folder = job_folder(job_id)
+        keep_folder = False
+        try:
+            async with async_session_maker() as db:
+                # claim the job atomically so two workers (or processes) never run it twice
+                claim = (
+                    update(MediaJobs)
+                    .where(MediaJobs.id == job_id, MediaJobs.status == JobStatus.queued)
+                    .values(status=JobStatus.processing, attempts=MediaJobs.attempts + 1, updated_at=datetime.now(timezone.utc))
+                )
+                if (await db.exec(claim)).rowcount != 1:
+                    # another worker has it, unless the job was deleted together with its car
+                    keep_folder = await db.get(MediaJobs, job_id) is not None
+                    return
+                await db.commit()
+                job = await db.get(MediaJobs, job_id)
+                # the lock is held until the commit, so the car can't be deleted while its
+                # images upload (backends without row locks are caught by the commit failing)
+                car = await db.get(Cars, job.car_id, with_for_update={'key_share': True}) if job else None
+                if car is None:
+                    logger.warning("media job %s dropped, its car no longer exists", job_id)
+                    if job:
+                        await db.delete(job)
+                        await db.commit()
+                    return
+                
+                try:
+                    uploaded = await self._upload_folder(folder)
+                    db.add_all([
+                        CarImages(car_id=car.id, image_url=image_url, thumbnail_url=thumbnail_url, is_primary=(i == 0))
+                        for i, (image_url, thumbnail_url) in enumerate(uploaded)
+                    ])
+                    car.is_active = True
+                    job.status = JobStatus.completed
+                    job.error = None
+                    job.updated_at = datetime.now(timezone.utc)
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    job = await db.get(MediaJobs, job_id)
+                    if job is None:
+                        logger.warning("media job %s dropped, it was deleted while running", job_id)
+                        return
+                    job.error = str(e)
+                    if job.attempts < settings.MEDIA_JOB_MAX_ATTEMPTS:
+                        job.status = JobStatus.queued
+                        keep_folder = True
+                        if self.queue:
+                            delay = settings.MEDIA_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+                            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, job_id)
+                    else:
+                        job.status = JobStatus.failed
+                    job.updated_at = datetime.now(timezone.utc)
+                    await db.commit()
+                    return
+            
+            await response_cache.invalidate_car(car.id)
+            await response_cache.invalidate_catalog()
+        finally:
+            if not keep_folder:
+                await asyncio.to_thread(shutil.rmtree, folder, True)
+
+    async def _upload_folder(self, folder: str) -> list[tuple[str, str]]:
+        semaphore = asyncio.Semaphore(settings.IMAGE_UPLOAD_CONCURRENCY)
+        storage = get_storage()
+
+        async def upload(filename: str) -> tuple[str, str]:
+            with open(os.path.join(folder, filename), "rb") as f:
+                return await store_file(f, filename, semaphore, storage)
+
+        return await asyncio.gather(*(upload(filename) for filename in sorted(os.listdir(folder))))
+
+media_jobs = MediaJobQueue()
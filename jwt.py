@@ -3,20 +3,15 @@ from jose import jwt
 from uuid import uuid4
 from fastapi import Response
 from config import settings
-from dotenv import find_dotenv, load_dotenv
-import os
+from models import UserBase
 
-path = find_dotenv()
-load_dotenv(path)
-SECRET_KEY = os.getenv('SECRET_KEY') 
-ALGORITHM = os.getenv('ALGORITHM')
-
-def create_access_token(email: str) -> str:
+def create_access_token(email: str, user: UserBase | None = None) -> str:
     '''
     creates an access token for the current user
     
     Input:
         email: the user's email
+        user: when given, the user's name and role are embedded as claims
     Returns:
         an access token
     '''
@@ -28,7 +23,11 @@ def create_access_token(email: str) -> str:
         "iat": int(now.timestamp()),
         "exp": expires
     }
-    encoded_jwt = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    if user:
+        payload["first_name"] = user.first_name
+        payload["last_name"] = user.last_name
+        payload["admin"] = user.is_admin
+    encoded_jwt = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 def create_refresh_token(email: str) -> tuple:
@@ -50,7 +49,7 @@ def create_refresh_token(email: str) -> tuple:
         "iat": int(now.timestamp()),
         "exp": int(expires.timestamp())
     }
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return token, jti, now, expires
 
 def set_refresh_cookie(resp: Response, refresh_token: str, *, csrf_token: str) -> None:
@@ -1,21 +1,57 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from db import create_db_and_tables
+from fastapi.staticfiles import StaticFiles
+from migrations import check_migrations
+from availability import load_availability_index
+from reservation_counts import rebuild_reservation_counts
+from jobs import media_jobs
+from response_cache import response_cache
+from refresh_tokens import sweep_refresh_tokens
+from metrics import MetricsMiddleware
 from contextlib import asynccontextmanager
 from config import settings
-from routes import auth, cars, reservations, admin
-import uvicorn
+from routes import auth, cars, reservations, admin, user_info
+import asyncio, os
+
+async def refresh_availability_index():
+    # each worker keeps its own index, so reload it periodically to pick up reservations
+    # written by other workers
+    while True:
+        await asyncio.sleep(settings.AVAILABILITY_REFRESH_SECONDS)
+        await asyncio.to_thread(load_availability_index)
+        # cached availability may predate the reservations that were just picked up
+        await response_cache.invalidate_catalog()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    # the schema is managed by migrations.py, the app only refuses to start on an outdated one
+    check_migrations()
+    load_availability_index()
+    if settings.RESERVATION_COUNTS_ROLLUP:
+        rebuild_reservation_counts()
+    refresh_task = None
+    if settings.AVAILABILITY_REFRESH_SECONDS > 0:
+        refresh_task = asyncio.create_task(refresh_availability_index())
+    sweep_task = asyncio.create_task(sweep_refresh_tokens())
+    await media_jobs.start(settings.MEDIA_JOB_WORKERS)
     yield
+    await media_jobs.stop()
+    sweep_task.cancel()
+    if refresh_task:
+        refresh_task.cancel()
     
 app = FastAPI(lifespan=lifespan)
 app.include_router(auth.router)
 app.include_router(reservations.router)
 app.include_router(cars.router)
 app.include_router(admin.router)
+app.include_router(user_info.router)
+
+if settings.STORAGE_BACKEND == 'local' and settings.MEDIA_URL.startswith('/'):
+    # only the stored images are exposed, not the rest of MEDIA_PATH (e.g. spooled job uploads)
+    images_path = os.path.join(settings.MEDIA_PATH, 'images')
+    os.makedirs(images_path, exist_ok=True)
+    app.mount(settings.MEDIA_URL, StaticFiles(directory=images_path), name='media')
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,5 +61,9 @@ app.add_middleware(
     allow_headers=["*", settings.CSRF_HEADER_NAME],
 )
 
+# added last so it is the outermost middleware and times everything else
+app.add_middleware(MetricsMiddleware)
+
 if __name__ == '__main__':
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    from server import run
+    run(dev=True)
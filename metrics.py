@@ -0,0 +1,158 @@
+from sqlalchemy import event
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+from contextvars import ContextVar
+from collections import Counter
+from bisect import bisect_left
+from threading import Lock
+from db import engine, async_engine
+from config import settings
+import logging, time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in ms; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class RequestStats:
+    '''
+    what a single request did on the database
+    '''
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.statement_counts: Counter[str] = Counter()
+
+    def n_plus_one(self) -> dict[str, int]:
+        '''
+        finds the statements that ran settings.N_PLUS_ONE_THRESHOLD times or more, the sign of
+        a query issued once per row of an earlier result
+
+        Returns:
+            a dict of statement -> number of executions
+        '''
+        return {statement: count for statement, count in self.statement_counts.items() if count >= settings.N_PLUS_ONE_THRESHOLD}
+
+current_request: ContextVar[RequestStats | None] = ContextVar('current_request', default=None)
+
+class RouteMetrics:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.db_ms = 0.0
+        self.statements = 0
+        self.max_statements = 0
+        self.n_plus_one: Counter[str] = Counter()
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'latency_histogram_ms': dict(zip([f'le_{bound}' for bound in LATENCY_BUCKETS_MS] + ['inf'], self.buckets)),
+            'avg_db_ms': self.db_ms / self.count if self.count else 0.0,
+            'avg_statements': self.statements / self.count if self.count else 0.0,
+            'max_statements': self.max_statements,
+            'n_plus_one': dict(self.n_plus_one.most_common(5))
+        }
+
+class MetricsRegistry:
+    '''
+    per-route aggregates for this worker process
+    '''
+    def __init__(self):
+        self.routes: dict[str, RouteMetrics] = {}
+        self._lock = Lock()
+
+    def record(self, route: str, status_code: int, elapsed_ms: float, stats: RequestStats) -> None:
+        '''
+        adds a finished request to its route's aggregates
+
+        Input:
+            route: the route, e.g. 'GET /cars/{id}'
+            status_code: the response status code
+            elapsed_ms: the request latency in ms
+            stats: what the request did on the database
+        Returns:
+            None
+        '''
+        suspects = stats.n_plus_one()
+        with self._lock:
+            metrics = self.routes.setdefault(route, RouteMetrics())
+            metrics.count += 1
+            metrics.errors += status_code >= 500
+            metrics.total_ms += elapsed_ms
+            metrics.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            metrics.db_ms += stats.db_time * 1000
+            metrics.statements += stats.statements
+            metrics.max_statements = max(metrics.max_statements, stats.statements)
+            metrics.n_plus_one.update(suspects.keys())
+        for statement, count in suspects.items():
+            logger.warning("possible N+1 in %s: statement ran %s times in one request: %s", route, count, statement)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {route: metrics.snapshot() for route, metrics in sorted(self.routes.items())}
+
+    def clear(self) -> None:
+        with self._lock:
+            self.routes.clear()
+
+metrics_registry = MetricsRegistry()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._metrics_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = current_request.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_time += time.perf_counter() - context._metrics_start
+    # the SQL text has placeholders for the values, so a per-row query shows up as one
+    # statement executed many times
+    stats.statement_counts[statement] += 1
+
+# db.engine serves startup and background work, its async counterpart serves the requests;
+# the async engine's events are dispatched by its sync_engine
+for instrumented in (engine, async_engine.sync_engine):
+    event.listen(instrumented, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(instrumented, 'after_cursor_execute', _after_cursor_execute)
+
+class MetricsMiddleware:
+    '''
+    times every request, counts its SQL statements and adds a Server-Timing header
+    '''
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if settings.SERVER_TIMING_HEADER:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    value = f'app;dur={elapsed_ms:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"'
+                    message['headers'] = list(message.get('headers', [])) + [(b'server-timing', value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            # the router stores the matched route in the scope, so metrics are kept per
+            # route template rather than per url
+            route = scope.get('route')
+            name = f"{scope['method']} {route.path if route else 'unmatched'}"
+            metrics_registry.record(name, status_code, (time.perf_counter() - start) * 1000, stats)
@@ -0,0 +1,190 @@
+'''
+schema migrations. Each migration runs once, in order, and is recorded in the
+schema_migrations table. Apply them before starting the app:
+
+    python -m migrations upgrade
+    python -m migrations status
+'''
+from sqlmodel import SQLModel
+from sqlalchemy import Table, Column, String, DateTime, MetaData, Engine, Connection, inspect, select, text
+from db import engine
+from models import Reservations, CarImages, Cars, RefreshTokens, Users, MediaJobs, ReservationCounts
+from datetime import datetime, timezone
+from typing import Callable
+import argparse
+
+# kept out of SQLModel.metadata so it is never part of the application schema
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', String, primary_key=True),
+    Column('applied_at', DateTime(timezone=True), nullable=False)
+)
+
+# any constant works, it only has to be the same for every process running migrations
+MIGRATION_LOCK_ID = 72_616_001
+
+# the tables the app had before migrations existed. Tables added since come from their own
+# migrations, so this list never grows
+INITIAL_TABLES = (Cars, CarImages, Reservations, Users, RefreshTokens)
+
+def initial_schema(conn: Connection) -> None:
+    # tables that already exist (databases created by the old create_all on startup) are left
+    # alone. The tables are built from the current models, so they can already have the columns
+    # and indexes later migrations add: those migrations check before they change anything
+    SQLModel.metadata.create_all(conn, tables=[model.__table__ for model in INITIAL_TABLES])
+
+def carimages_thumbnail_url(conn: Connection) -> None:
+    columns = {column['name'] for column in inspect(conn).get_columns('carimages')}
+    if 'thumbnail_url' not in columns:
+        conn.execute(text('ALTER TABLE carimages ADD COLUMN thumbnail_url VARCHAR'))
+
+HOT_PATH_INDEXES = {
+    Cars: ('ix_cars_is_active_id',),
+    Reservations: (
+        'ix_reservations_status_id', 'ix_reservations_start_at_id', 'ix_reservations_user_email_id',
+        'ix_reservations_user_email_start_at_id', 'ix_reservations_user_email_status_id',
+        'ix_reservations_car_id', 'ix_reservations_blocking_car_period'
+    ),
+    CarImages: ('ix_carimages_car_id', 'ix_carimages_primary'),
+    RefreshTokens: ('ix_refreshtokens_user_id',)
+}
+
+def hot_path_indexes(conn: Connection) -> None:
+    # the definitions live in the models' __table_args__; this creates the ones missing from
+    # tables that existed before they were declared
+    for model, names in HOT_PATH_INDEXES.items():
+        indexes = {index.name: index for index in model.__table__.indexes}
+        for name in names:
+            indexes[name].create(conn, checkfirst=True)
+
+def refreshtokens_expires_at_index(conn: Connection) -> None:
+    # backs the periodic sweep of expired refresh tokens
+    indexes = {index.name: index for index in RefreshTokens.__table__.indexes}
+    indexes['ix_refreshtokens_expires_at'].create(conn, checkfirst=True)
+
+RESERVATION_NO_OVERLAP = '''
+ALTER TABLE reservations
+ADD CONSTRAINT reservation_no_overlap
+EXCLUDE USING gist (
+    car_id WITH =,
+    daterange(start_at, end_at, '[]') WITH &&
+)
+WHERE (status IN ('pending', 'active', 'confirmed'))
+'''
+
+def reservation_no_overlap(conn: Connection) -> None:
+    # the guard the booking path relies on. Postgres only, and databases set up by hand from
+    # the readme already have it
+    if conn.dialect.name != 'postgresql':
+        return
+    if conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = 'reservation_no_overlap'")).first():
+        return
+    conn.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+    conn.execute(text(RESERVATION_NO_OVERLAP))
+
+CARS_SEARCH_INDEXES = ('ix_cars_is_active_daily_rate_id', 'ix_cars_is_active_year_id', 'ix_cars_is_active_make_model')
+
+def cars_search_indexes(conn: Connection) -> None:
+    indexes = {index.name: index for index in Cars.__table__.indexes}
+    for name in CARS_SEARCH_INDEXES:
+        indexes[name].create(conn, checkfirst=True)
+
+def mediajobs_table(conn: Connection) -> None:
+    # databases migrated before this one got the table (and its indexes) from 0001
+    MediaJobs.__table__.create(conn, checkfirst=True)
+
+def reservationcounts_table(conn: Connection) -> None:
+    # filled on startup when RESERVATION_COUNTS_ROLLUP is on
+    ReservationCounts.__table__.create(conn, checkfirst=True)
+
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ('0001_initial_schema', initial_schema),
+    ('0002_carimages_thumbnail_url', carimages_thumbnail_url),
+    ('0003_hot_path_indexes', hot_path_indexes),
+    ('0004_refreshtokens_expires_at_index', refreshtokens_expires_at_index),
+    ('0005_reservation_no_overlap', reservation_no_overlap),
+    ('0006_cars_search_indexes', cars_search_indexes),
+    ('0007_mediajobs_table', mediajobs_table),
+    ('0008_reservationcounts_table', reservationcounts_table),
+]
+
+def applied_migrations(conn: Connection) -> set[str]:
+    '''
+    gets the versions that have already been applied
+
+    Input:
+        conn: a database connection
+    Returns:
+        the applied versions
+    '''
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.version)).scalars().all())
+
+def pending_migrations(bind: Engine = engine) -> list[str]:
+    '''
+    gets the versions that still have to be applied, in order
+
+    Input:
+        bind: the engine of the database to check
+    Returns:
+        the pending versions
+    '''
+    with bind.connect() as conn:
+        applied = applied_migrations(conn)
+    return [version for version, _ in MIGRATIONS if version not in applied]
+
+def upgrade(bind: Engine = engine) -> list[str]:
+    '''
+    applies every pending migration, each one in its own transaction
+
+    Input:
+        bind: the engine of the database to migrate
+    Returns:
+        the versions that were applied
+    '''
+    migration_metadata.create_all(bind)
+    applied_now = []
+    for version, migrate in MIGRATIONS:
+        with bind.begin() as conn:
+            if bind.dialect.name == 'postgresql':
+                # serializes concurrent upgrades (e.g. several containers starting at once)
+                conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+            if version in applied_migrations(conn):
+                continue
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now(timezone.utc)))
+            applied_now.append(version)
+
+    return applied_now
+
+def check_migrations(bind: Engine = engine) -> None:
+    '''
+    makes sure the database schema is up to date
+
+    Input:
+        bind: the engine of the database to check
+    Returns:
+        None
+    Raises:
+        RuntimeError: if there are pending migrations
+    '''
+    pending = pending_migrations(bind)
+    if pending:
+        raise RuntimeError(f"Pending database migrations: {', '.join(pending)}. Run `python -m migrations upgrade`")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['upgrade', 'status'])
+    args = parser.parse_args()
+
+    if args.command == 'upgrade':
+        applied = upgrade()
+        print(f"applied {', '.join(applied)}" if applied else "database is up to date")
+    else:
+        pending = pending_migrations()
+        print(f"pending {', '.join(pending)}" if pending else "database is up to date")
+
+if __name__ == '__main__':
+    main()
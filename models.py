@@ -3,8 +3,8 @@ from pydantic import EmailStr, BaseModel, ConfigDict
 from datetime import datetime, date, timezone
 from enum import Enum
 from decimal import Decimal
-from sqlalchemy import Column, Numeric
-from fastapi import Form
+from sqlalchemy import Column, Numeric, Index, text
+from fastapi import Form, Query
 from typing import List
 
 class ReservationStatus(str, Enum):
@@ -14,6 +14,12 @@ class ReservationStatus(str, Enum):
     completed = 'completed'
     active = 'active'
 
+class JobStatus(str, Enum):
+    queued = 'queued'
+    processing = 'processing'
+    completed = 'completed'
+    failed = 'failed'
+
 class Transmission(str, Enum):
     automatic = 'automatic'
     manual = 'manual'
@@ -30,6 +36,13 @@ class Cars(SQLModel, table=True):
     images: List[CarImages] = Relationship(back_populates='car')
     is_active: bool = Field(default=True, nullable=False)
     model_config = ConfigDict(from_attributes=True)
+    __table_args__ = (
+        Index('ix_cars_is_active_id', 'is_active', 'id'),
+        # fleet search: the price and year sorts (and their range filters) and the make filter
+        Index('ix_cars_is_active_daily_rate_id', 'is_active', 'daily_rate', 'id'),
+        Index('ix_cars_is_active_year_id', 'is_active', 'year', 'id'),
+        Index('ix_cars_is_active_make_model', 'is_active', 'make', 'model'),
+    )
     
 class Reservations(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
@@ -43,6 +56,22 @@ class Reservations(SQLModel, table=True):
     total_amount: Decimal = Field(sa_column=Column(Numeric(10, 2), nullable=False))
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     model_config = ConfigDict(from_attributes=True)
+    # composite keys for the keyset paginated lists (see reservation_list.SORT_KEYS)
+    __table_args__ = (
+        Index('ix_reservations_status_id', 'status', 'id'),
+        Index('ix_reservations_start_at_id', 'start_at', 'id'),
+        Index('ix_reservations_user_email_id', 'user_email', 'id'),
+        Index('ix_reservations_user_email_start_at_id', 'user_email', 'start_at', 'id'),
+        Index('ix_reservations_user_email_status_id', 'user_email', 'status', 'id'),
+        Index('ix_reservations_car_id', 'car_id'),
+        # only reservations that block a car (availability.BLOCKING_STATUSES) take part in
+        # overlap checks, so the others are left out of the index
+        Index(
+            'ix_reservations_blocking_car_period', 'car_id', 'start_at', 'end_at',
+            postgresql_where=text("status IN ('pending', 'confirmed', 'active')"),
+            sqlite_where=text("status IN ('pending', 'confirmed', 'active')")
+        ),
+    )
 
 class Users(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
@@ -57,9 +86,15 @@ class CarImages(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     car_id: int = Field(nullable=False, foreign_key='cars.id')
     image_url: str = Field(nullable=False)
+    thumbnail_url: str | None = Field(default=None)
     is_primary: bool = Field(default=False)
     car: Cars = Relationship(back_populates='images')
     model_config = ConfigDict(from_attributes=True)
+    __table_args__ = (
+        Index('ix_carimages_car_id', 'car_id'),
+        # the catalog joins only the primary image of each car
+        Index('ix_carimages_primary', 'car_id', postgresql_where=text('is_primary'), sqlite_where=text('is_primary')),
+    )
     
 class RefreshTokens(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
@@ -67,6 +102,27 @@ class RefreshTokens(SQLModel, table=True):
     user_id: int = Field(nullable=False, foreign_key='users.id')
     issued_at: datetime = Field(nullable=False)
     expires_at: datetime = Field(nullable=False)
+    __table_args__ = (
+        Index('ix_refreshtokens_user_id', 'user_id'),
+        Index('ix_refreshtokens_expires_at', 'expires_at'),
+    )
+    
+class MediaJobs(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    car_id: int = Field(nullable=False, foreign_key='cars.id')
+    status: JobStatus = Field(default=JobStatus.queued)
+    attempts: int = Field(default=0, nullable=False)
+    error: str | None = Field(default=None)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    __table_args__ = (
+        Index('ix_mediajobs_car_id', 'car_id'),
+        Index('ix_mediajobs_status_updated_at', 'status', 'updated_at'),
+    )
+    
+class ReservationCounts(SQLModel, table=True):
+    status: str = Field(primary_key=True)
+    count: int = Field(default=0, nullable=False)
     
 class CarBase(BaseModel):
     make: str
@@ -94,6 +150,36 @@ class CarBase(BaseModel):
             description=description
         )
     
+class CarFilters(BaseModel):
+    make: List[str] | None = None
+    model: List[str] | None = None
+    year_min: int | None = None
+    year_max: int | None = None
+    seats: List[int] | None = None
+    transmission: List[Transmission] | None = None
+    rate_min: Decimal | None = None
+    rate_max: Decimal | None = None
+    
+    @classmethod
+    def as_query(
+        cls,
+        make: List[str] | None = Query(None),
+        model: List[str] | None = Query(None),
+        year_min: int | None = None,
+        year_max: int | None = None,
+        seats: List[int] | None = Query(None),
+        transmission: List[Transmission] | None = Query(None),
+        rate_min: Decimal | None = None,
+        rate_max: Decimal | None = None
+    ):
+        return cls(
+            make=make, model=model, year_min=year_min, year_max=year_max, seats=seats,
+            transmission=transmission, rate_min=rate_min, rate_max=rate_max
+        )
+
+class CarIds(BaseModel):
+    ids: List[int]
+    
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -112,8 +198,11 @@ class UserToCreate(BaseModel):
     
 class ReservationBase(BaseModel):
     car_id: int = Field(nullable=False, foreign_key='car.id')
-    user: EmailStr = Field(nullable=False)
+    user_email: EmailStr = Field(nullable=False)
+    user_first_name: str = Field(nullable=False)
+    user_last_name: str = Field(nullable=False)
     start_at: date = Field(nullable=False)
     end_at: date = Field(nullable=False)
-    total_amount: Decimal = Field(sa_column=Column(Numeric(10, 2), nullable=False))
+    # ignored, reservations are priced on the server from the car's daily rate
+    total_amount: Decimal | None = None
     model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
@@ -0,0 +1,96 @@
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Sequence
+import base64, json
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    '''
+    packs the sort key of the last row on a page into an opaque, url-safe cursor
+
+    Input:
+        values: the sort key values, in sort column order
+    Returns:
+        an opaque cursor string
+    '''
+    plain = [
+        v.value if isinstance(v, Enum) else v.isoformat() if isinstance(v, (date, datetime)) else str(v) if isinstance(v, Decimal) else v
+        for v in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(plain, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    '''
+    unpacks a cursor produced by encode_cursor, converting each value back to the python
+    type of its sort column
+
+    Input:
+        cursor: the opaque cursor string
+        columns: the sort columns the cursor was built for
+    Returns:
+        the sort key values
+    Raises:
+        HTTPException (400): if the cursor is malformed or was built for another sort order
+    '''
+    invalid_cursor = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise invalid_cursor
+        decoded = []
+        for value, column in zip(values, columns):
+            python_type = column.type.python_type
+            if issubclass(python_type, datetime):
+                decoded.append(datetime.fromisoformat(value))
+            elif issubclass(python_type, date):
+                decoded.append(date.fromisoformat(value))
+            elif issubclass(python_type, Enum):
+                decoded.append(python_type(value))
+            elif issubclass(python_type, Decimal) and isinstance(value, str):
+                decoded.append(Decimal(value))
+            elif issubclass(python_type, (int, str)) and isinstance(value, python_type):
+                decoded.append(value)
+            else:
+                raise invalid_cursor
+        return decoded
+    except (ValueError, TypeError, ArithmeticError):
+        raise invalid_cursor
+
+def keyset_page(stmt, columns: Sequence, cursor: str | None, limit: int, descending: bool = False):
+    '''
+    orders a select by the sort columns and restricts it to the rows after the cursor.
+    One extra row is fetched to tell whether there is a next page
+
+    Input:
+        stmt: the select to paginate
+        columns: the sort columns, ending in a unique column (e.g. the id)
+        cursor: the cursor of the previous page, or None for the first page
+        limit: the page size
+        descending: sort every column in descending order, so a single row comparison
+            still selects the rows after the cursor
+    Returns:
+        the paginated select
+    '''
+    if cursor:
+        key = tuple_(*columns)
+        values = tuple(decode_cursor(cursor, columns))
+        stmt = stmt.where(key < values if descending else key > values)
+    return stmt.order_by(*(column.desc() if descending else column for column in columns)).limit(limit + 1)
+
+def split_page(rows: Sequence, limit: int, key: Callable[[Any], Sequence[Any]]) -> tuple[list, str | None]:
+    '''
+    trims the extra row fetched by keyset_page and builds the cursor of the next page
+
+    Input:
+        rows: the rows returned by the paginated select
+        limit: the page size
+        key: returns the sort key values of a row
+    Returns:
+        the rows of this page and the next cursor (None on the last page)
+    '''
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return list(rows), encode_cursor(key(rows[-1]))
+    return list(rows), None
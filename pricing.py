@@ -0,0 +1,215 @@
+from config import settings
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Protocol
+
+CENTS = Decimal('0.01')
+ONE = Decimal(1)
+
+class PricingRule(Protocol):
+    '''
+    adjusts the price of a rental. Rules only look at the dates, never at the car, so a
+    span is priced once and every car's total is its daily rate times the same factor
+
+    a rule has two hooks: day_multiplier for rules that price single days (weekends,
+    seasons) and total_multiplier for rules that price the span as a whole (length
+    discounts). A rule implements both and returns 1 from the one it doesn't use
+    '''
+    # True if the rule prices single days. PriceEngine only walks the days of a span for
+    # these rules, so a rule that sets it to False must return 1 from day_multiplier
+    per_day: bool
+
+    def day_multiplier(self, day: date) -> Decimal:
+        '''
+        called for every rented day, only on rules with per_day set. The multipliers of
+        all the rules on a day are multiplied together and the days are summed
+
+        Input:
+            day: a rented day
+        Returns:
+            what the daily rate is multiplied by on that day
+        '''
+        ...
+
+    def total_multiplier(self, days: int) -> Decimal:
+        '''
+        called once per span, on every rule, after the days are summed. It only sees the
+        length of the rental, so it can't tell which days were rented
+
+        Input:
+            days: the length of the rental, both ends included
+        Returns:
+            what the sum of the day multipliers is multiplied by
+        '''
+        ...
+
+class WeekendRule:
+    '''
+    charges Saturdays and Sundays (or other weekdays, 0 being Monday) at a multiple of the daily rate
+    '''
+    per_day = True
+
+    def __init__(self, multiplier: Decimal, weekdays: tuple[int, ...] = (5, 6)):
+        self.multiplier = multiplier
+        self.weekdays = weekdays
+
+    def day_multiplier(self, day: date) -> Decimal:
+        return self.multiplier if day.weekday() in self.weekdays else ONE
+
+    def total_multiplier(self, days: int) -> Decimal:
+        return ONE
+
+class SeasonRule:
+    '''
+    charges the days between two 'MM-DD' dates, inclusive and in any year, at a multiple of
+    the daily rate. A season may wrap around the new year, e.g. '12-15' to '01-05'
+    '''
+    per_day = True
+
+    def __init__(self, start: str, end: str, multiplier: Decimal):
+        # (month, day) tuples compare like the 'MM-DD' strings without formatting every day
+        self.start = tuple(int(part) for part in start.split('-'))
+        self.end = tuple(int(part) for part in end.split('-'))
+        self.multiplier = multiplier
+
+    def day_multiplier(self, day: date) -> Decimal:
+        month_day = (day.month, day.day)
+        if self.start <= self.end:
+            in_season = self.start <= month_day <= self.end
+        else:
+            in_season = month_day >= self.start or month_day <= self.end
+        return self.multiplier if in_season else ONE
+
+    def total_multiplier(self, days: int) -> Decimal:
+        return ONE
+
+class LongRentalRule:
+    '''
+    discounts rentals by length: the largest tier the rental reaches applies
+    '''
+    per_day = False
+
+    def __init__(self, discounts: dict[int, Decimal]):
+        # (minimum days, discount) with the longest tier first
+        self.tiers = sorted(discounts.items(), reverse=True)
+
+    def day_multiplier(self, day: date) -> Decimal:
+        return ONE
+
+    def total_multiplier(self, days: int) -> Decimal:
+        for min_days, discount in self.tiers:
+            if days >= min_days:
+                return ONE - discount
+        return ONE
+
+def rental_days(start: date, end: date) -> int:
+    # both dates are rented, like the reservation_no_overlap constraint's '[]' range
+    return (end - start).days + 1
+
+def check_span(start: date, end: date) -> int:
+    '''
+    Input:
+        start: the first rented day
+        end: the last rented day
+    Returns:
+        the length of the rental
+    Raises:
+        ValueError: if end is before start or the rental is longer than MAX_RENTAL_DAYS
+    '''
+    days = rental_days(start, end)
+    if days < 1:
+        raise ValueError('The end date is before the start date.')
+    if days > settings.MAX_RENTAL_DAYS:
+        raise ValueError(f'Rentals can last at most {settings.MAX_RENTAL_DAYS} days.')
+    return days
+
+class PriceEngine:
+    def __init__(self, rules: list[PricingRule]):
+        self.rules = rules
+        self.day_rules = [rule for rule in rules if rule.per_day]
+        # the same few spans are priced over and over (a search's dates, a batch's items),
+        # so the day walk is cached per engine
+        self.day_total = lru_cache(maxsize=4096)(self.day_total)
+
+    def day_total(self, start: date, days: int) -> Decimal:
+        # the sum of every day's multipliers, only called with per day rules
+        total = Decimal(0)
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            multiplier = ONE
+            for rule in self.day_rules:
+                multiplier *= rule.day_multiplier(day)
+            total += multiplier
+        return total
+
+    def factor(self, start: date, end: date) -> Decimal:
+        '''
+        prices a span for a daily rate of 1: the sum of every day's multipliers times the
+        length multipliers
+
+        Input:
+            start: the first rented day
+            end: the last rented day
+        Returns:
+            the factor every car's daily rate is multiplied by
+        Raises:
+            ValueError: if end is before start or the rental is longer than MAX_RENTAL_DAYS
+        '''
+        days = check_span(start, end)
+        total = self.day_total(start, days) if self.day_rules else Decimal(days)
+        for rule in self.rules:
+            total *= rule.total_multiplier(days)
+        return total
+
+    def price(self, daily_rate: Decimal, factor: Decimal) -> Decimal:
+        return (Decimal(daily_rate) * factor).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+    def quote(self, daily_rate: Decimal, start: date, end: date) -> Decimal:
+        '''
+        prices a single rental
+
+        Input:
+            daily_rate: the car's daily rate
+            start: the first rented day
+            end: the last rented day
+        Returns:
+            the total, rounded to cents
+        Raises:
+            ValueError: if end is before start or the rental is longer than MAX_RENTAL_DAYS
+        '''
+        return self.price(daily_rate, self.factor(start, end))
+
+    def quote_many(self, daily_rates: dict[int, Decimal], start: date, end: date) -> dict[int, Decimal]:
+        '''
+        prices the same dates for many cars, walking the dates once
+
+        Input:
+            daily_rates: car id -> daily rate
+            start: the first rented day
+            end: the last rented day
+        Returns:
+            car id -> total, rounded to cents
+        Raises:
+            ValueError: if end is before start or the rental is longer than MAX_RENTAL_DAYS
+        '''
+        factor = self.factor(start, end)
+        return {car_id: self.price(rate, factor) for car_id, rate in daily_rates.items()}
+
+def create_price_engine() -> PriceEngine:
+    '''
+    builds the engine from the PRICING_* settings, leaving out rules that change nothing
+
+    Returns:
+        the price engine
+    '''
+    rules: list[PricingRule] = []
+    if settings.PRICING_WEEKEND_MULTIPLIER != ONE:
+        rules.append(WeekendRule(settings.PRICING_WEEKEND_MULTIPLIER))
+    for start, end, multiplier in settings.PRICING_SEASONS:
+        rules.append(SeasonRule(start, end, multiplier))
+    if settings.PRICING_LONG_RENTAL_DISCOUNTS:
+        rules.append(LongRentalRule(settings.PRICING_LONG_RENTAL_DISCOUNTS))
+    return PriceEngine(rules)
+
+price_engine = create_price_engine()
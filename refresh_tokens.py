@@ -0,0 +1,109 @@
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import delete, update
+from db import async_session_maker
+from models import RefreshTokens, Users
+from auth_tokens import create_refresh_token
+from cache import TTLCache
+from config import settings
+from datetime import datetime, timezone
+import asyncio, logging
+
+logger = logging.getLogger(__name__)
+
+# jtis that were rotated or revoked by this process. The table stays the source of truth,
+# the set only lets replays of dead tokens be turned away without a query
+revoked_jtis = TTLCache(settings.REVOKED_TOKEN_CACHE_SIZE, settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+
+def is_revoked(jti: str) -> bool:
+    return revoked_jtis.get(jti, False)
+
+def _revoke(jtis) -> None:
+    for jti in jtis:
+        revoked_jtis.set(jti, True)
+
+async def issue_refresh_token(db: AsyncSession, user_id: int, email: str) -> str:
+    '''
+    replaces every refresh token of a user with a new one, so a user has one session at a time
+
+    Input:
+        db: a database session
+        user_id: the id of the user
+        email: the user's email
+    Returns:
+        the new refresh token
+    '''
+    refresh_token, jti, issued_at, expire_date = create_refresh_token(email)
+    old_jtis = (await db.exec(delete(RefreshTokens).where(RefreshTokens.user_id == user_id).returning(RefreshTokens.jti))).scalars().all()
+    db.add(RefreshTokens(jti=jti, user_id=user_id, issued_at=issued_at, expires_at=expire_date))
+    await db.commit()
+    _revoke(old_jtis)
+
+    return refresh_token
+
+async def rotate_refresh_token(db: AsyncSession, jti: str, email: str) -> str | None:
+    '''
+    swaps a stored refresh token for a new one in a single UPDATE on the unique jti index
+
+    Input:
+        db: a database session
+        jti: the jti of the presented refresh token
+        email: the user's email
+    Returns:
+        the new refresh token, or None if the presented one is unknown, already rotated or expired
+    '''
+    if is_revoked(jti):
+        return None
+
+    refresh_token, new_jti, issued_at, expire_date = create_refresh_token(email)
+    stmt = (
+        update(RefreshTokens)
+        .where(RefreshTokens.jti == jti, RefreshTokens.expires_at > datetime.now(timezone.utc))
+        .values(jti=new_jti, issued_at=issued_at, expires_at=expire_date)
+    )
+    rotated = (await db.exec(stmt)).rowcount == 1
+    await db.commit()
+    # a second request with the same token matches no row, so it can never be rotated twice
+    _revoke([jti])
+
+    return refresh_token if rotated else None
+
+async def revoke_refresh_tokens(db: AsyncSession, email: str) -> None:
+    '''
+    deletes every refresh token of a user in one statement
+
+    Input:
+        db: a database session
+        email: the user's email
+    Returns:
+        None
+    '''
+    user_id = select(Users.id).where(Users.email == email).scalar_subquery()
+    jtis = (await db.exec(delete(RefreshTokens).where(RefreshTokens.user_id == user_id).returning(RefreshTokens.jti))).scalars().all()
+    await db.commit()
+    _revoke(jtis)
+
+async def purge_expired_refresh_tokens() -> int:
+    '''
+    deletes the refresh tokens that have expired
+
+    Returns:
+        the number of deleted tokens
+    '''
+    async with async_session_maker() as db:
+        stmt = delete(RefreshTokens).where(RefreshTokens.expires_at <= datetime.now(timezone.utc))
+        purged = (await db.exec(stmt)).rowcount
+        await db.commit()
+
+    return purged
+
+async def sweep_refresh_tokens() -> None:
+    # keeps the table bounded to the live sessions
+    while True:
+        try:
+            purged = await purge_expired_refresh_tokens()
+            if purged:
+                logger.info("purged %s expired refresh tokens", purged)
+        except Exception:
+            logger.exception("refresh token sweep failed")
+        await asyncio.sleep(settings.REFRESH_TOKEN_SWEEP_SECONDS)
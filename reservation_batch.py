@@ -0,0 +1,108 @@
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import and_, insert, or_
+from availability import BLOCKING_STATUSES, CarIntervals
+from models import Cars, Reservations, ReservationBase, ReservationStatus
+from reservation_counts import adjust_count
+from config import settings
+from pricing import price_engine, check_span
+from datetime import datetime, timezone
+from decimal import Decimal
+
+async def check_batch(db: AsyncSession, reservations: list[ReservationBase]) -> tuple[list[str | None], dict[int, Decimal]]:
+    '''
+    validates a batch of reservations against the database and against each other. Earlier
+    items win, so an item overlapping one before it in the batch is a conflict
+
+    Input:
+        db: a database session
+        reservations: the requested reservations
+    Returns:
+        for each item, None if it can be booked, otherwise why not, and the daily rates of
+        the requested cars
+    '''
+    span_errors = []
+    windows: dict[int, tuple] = {}
+    for r in reservations:
+        try:
+            check_span(r.start_at, r.end_at)
+        except ValueError as e:
+            span_errors.append(str(e))
+            continue
+        span_errors.append(None)
+        start, end = windows.get(r.car_id, (r.start_at, r.end_at))
+        windows[r.car_id] = (min(start, r.start_at), max(end, r.end_at))
+    if not windows:
+        return span_errors, {}
+
+    # one query for the whole batch: each requested car, joined with its blocking
+    # reservations inside the span the batch asks for on that car (a range scan of
+    # ix_reservations_blocking_car_period per car)
+    stmt = (
+        select(Cars.id, Cars.daily_rate, Reservations.id, Reservations.start_at, Reservations.end_at)
+        .outerjoin(Reservations, and_(
+            Reservations.car_id == Cars.id,
+            Reservations.status.in_(BLOCKING_STATUSES),
+            or_(*(
+                and_(Reservations.car_id == car_id, Reservations.start_at <= end, Reservations.end_at >= start)
+                for car_id, (start, end) in windows.items()
+            ))
+        ))
+        .where(Cars.id.in_(windows), Cars.is_active)
+        .order_by(Cars.id, Reservations.start_at)
+    )
+    cars: dict[int, CarIntervals] = {}
+    daily_rates: dict[int, Decimal] = {}
+    for car_id, daily_rate, reservation_id, start_at, end_at in (await db.exec(stmt)).all():
+        daily_rates[car_id] = daily_rate
+        intervals = cars.setdefault(car_id, CarIntervals())
+        if reservation_id is not None:
+            intervals.insert(reservation_id, start_at, end_at)
+
+    results = []
+    for i, (r, span_error) in enumerate(zip(reservations, span_errors)):
+        if span_error:
+            results.append(span_error)
+        elif r.car_id not in cars:
+            results.append('Car not found.')
+        elif cars[r.car_id].overlaps(r.start_at, r.end_at):
+            results.append('The selected car is not available for these dates.')
+        else:
+            # accepted items block the ones after them; negative ids keep them apart from
+            # the stored reservations
+            cars[r.car_id].insert(-i - 1, r.start_at, r.end_at)
+            results.append(None)
+    return results, daily_rates
+
+async def insert_batch(db: AsyncSession, reservations: list[ReservationBase], daily_rates: dict[int, Decimal]) -> list[Reservations]:
+    '''
+    prices reservations and inserts them with a single multi-row INSERT, without committing
+
+    Input:
+        db: a database session
+        reservations: reservations that passed check_batch
+        daily_rates: the daily rates from check_batch
+    Returns:
+        the inserted reservations, in the same order
+    '''
+    created_at = datetime.now(timezone.utc)
+    # items share dates often, so each distinct span is priced once
+    factors = {span: price_engine.factor(*span) for span in {(r.start_at, r.end_at) for r in reservations}}
+    # the client's total_amount is ignored, the price comes from the car's daily rate
+    rows = [
+        {
+            **r.model_dump(exclude={'total_amount'}),
+            'total_amount': price_engine.price(daily_rates[r.car_id], factors[(r.start_at, r.end_at)]),
+            'status': ReservationStatus.pending,
+            'created_at': created_at
+        }
+        for r in reservations
+    ]
+    # insertmanyvalues batches the rows into multi-row INSERT ... RETURNING statements,
+    # sort_by_parameter_order lines the returned ids up with the rows
+    stmt = insert(Reservations).returning(Reservations.id, sort_by_parameter_order=True)
+    ids = (await db.exec(stmt, params=rows)).scalars().all()
+    if settings.RESERVATION_COUNTS_ROLLUP:
+        # a bulk INSERT bypasses the ORM hooks that keep the rollup current
+        await db.exec(adjust_count(ReservationStatus.pending, len(rows)))
+    return [Reservations(id=id, **row) for id, row in zip(ids, rows)]
@@ -0,0 +1,106 @@
+from sqlmodel import Session, select
+from sqlalchemy import String, cast, event, func, inspect, literal, text, true, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db import engine
+from config import settings
+from models import Reservations, ReservationCounts, ReservationStatus
+
+ACTIVE_STATUSES = ('pending', 'active', 'confirmed')
+INACTIVE_STATUSES = ('completed', 'cancelled')
+# pg_try_advisory_xact_lock key: one worker rebuilds the rollup, the others skip it
+REBUILD_LOCK_KEY = 7_300_001
+
+def summarize_counts(rows) -> dict:
+    '''
+    folds per-status counts into the buckets shown on the admin dashboard
+    
+    Input:
+        rows: (status, count) pairs
+    Returns:
+        a dict with the active, inactive and all counts
+    '''
+    counts = {ReservationStatus(status).value: count for status, count in rows}
+    return {
+        'active': sum(counts.get(s, 0) for s in ACTIVE_STATUSES),
+        'inactive': sum(counts.get(s, 0) for s in INACTIVE_STATUSES),
+        'all': sum(counts.values())
+    }
+
+def rebuild_reservation_counts() -> bool:
+    '''
+    recomputes the rollup table from the reservations table with a single
+    INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE. On Postgres, every worker
+    calls this at startup: an advisory lock lets only one of them rebuild, and the rollup
+    table is locked against the counter updates for the rebuild, so an update committed
+    while the counts are read can't be overwritten
+    
+    Returns:
+        True if the rollup was rebuilt, False if another worker is rebuilding it
+    '''
+    with Session(engine) as db:
+        postgres = db.bind.dialect.name == 'postgresql'
+        if postgres:
+            if not db.exec(select(func.pg_try_advisory_xact_lock(REBUILD_LOCK_KEY))).one():
+                return False
+            # waits for the transactions that already moved a counter and blocks the next
+            # ones until the commit, so the counts read below include every adjusted row
+            db.exec(text(f'LOCK TABLE {ReservationCounts.__tablename__} IN EXCLUSIVE MODE'))
+        # every status gets a row, the statuses without reservations a count of 0
+        statuses = union_all(*(select(literal(status.value, String).label('status')) for status in ReservationStatus)).subquery('statuses')
+        counted = (
+            select(statuses.c.status, func.count(Reservations.id))
+            .select_from(statuses.outerjoin(Reservations, cast(Reservations.status, String) == statuses.c.status))
+            # SQLite needs a WHERE to tell the upsert's ON CONFLICT from a join constraint
+            .where(true())
+            .group_by(statuses.c.status)
+        )
+        insert = pg_insert if postgres else sqlite_insert
+        stmt = insert(ReservationCounts).from_select(['status', 'count'], counted)
+        db.exec(stmt.on_conflict_do_update(index_elements=['status'], set_={'count': stmt.excluded['count']}))
+        db.commit()
+    return True
+
+def adjust_count(status, delta: int):
+    '''
+    builds the statement moving one rollup counter. Bulk and Core INSERTs bypass the ORM
+    hooks below, so their callers execute it themselves
+    
+    Input:
+        status: the reservation status
+        delta: how much to add to its count
+    Returns:
+        the UPDATE statement
+    '''
+    return update(ReservationCounts).where(ReservationCounts.status == ReservationStatus(status).value).values(count=ReservationCounts.count + delta)
+
+def _adjust(connection, status, delta: int) -> None:
+    connection.execute(adjust_count(status, delta))
+
+def _stored_status(connection, target: Reservations):
+    # the in-memory object can be stale, so read (and lock) the status the row actually has
+    stmt = select(Reservations.status).where(Reservations.id == target.id).with_for_update()
+    return connection.execute(stmt).scalar_one_or_none()
+
+def _after_insert(mapper, connection, target: Reservations) -> None:
+    _adjust(connection, target.status, 1)
+
+def _before_update(mapper, connection, target: Reservations) -> None:
+    if not inspect(target).attrs.status.history.has_changes():
+        return
+    old_status = _stored_status(connection, target)
+    if old_status is not None and ReservationStatus(old_status) != ReservationStatus(target.status):
+        _adjust(connection, old_status, -1)
+        _adjust(connection, target.status, 1)
+
+def _before_delete(mapper, connection, target: Reservations) -> None:
+    old_status = _stored_status(connection, target)
+    if old_status is not None:
+        _adjust(connection, old_status, -1)
+
+# the counters are updated on the flushing connection, so they commit or roll back together
+# with the reservation write. Bulk UPDATE/DELETE statements bypass these hooks
+if settings.RESERVATION_COUNTS_ROLLUP:
+    event.listen(Reservations, 'after_insert', _after_insert)
+    event.listen(Reservations, 'before_update', _before_update)
+    event.listen(Reservations, 'before_delete', _before_delete)
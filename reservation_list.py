@@ -0,0 +1,135 @@
+from fastapi import HTTPException, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Reservations, Cars
+from reservation_counts import ACTIVE_STATUSES, INACTIVE_STATUSES
+from pagination import keyset_page, split_page
+from db import export_engine
+from config import settings
+from datetime import date
+from decimal import Decimal
+from enum import Enum
+from typing import Any, AsyncIterator
+import asyncio, csv, io, json
+
+# each sort order ends in the primary key so the keyset is unique; every one of them is
+# backed by a matching composite index on reservations
+SORT_KEYS = {
+    'id': (Reservations.id,),
+    'start_at': (Reservations.start_at, Reservations.id),
+    'status': (Reservations.status, Reservations.id)
+}
+
+COLUMNS = (
+    Reservations.id, Reservations.user_email, Reservations.user_first_name, Reservations.user_last_name,
+    Reservations.start_at, Reservations.end_at, Reservations.status, Reservations.total_amount,
+    Cars.id.label('car_id'), Cars.make, Cars.model, Cars.year
+)
+
+def status_conditions(statuses: str | None) -> list:
+    '''
+    maps the statuses query parameter to the filters it adds to a reservation list
+    
+    Input:
+        statuses: 'active', 'inactive' or None for all
+    Returns:
+        a list of conditions, empty when every status is wanted so the sort index can be
+        scanned without a filter
+    '''
+    match statuses:
+        case 'active':
+            return [Reservations.status.in_(ACTIVE_STATUSES)]
+        case 'inactive':
+            return [Reservations.status.in_(INACTIVE_STATUSES)]
+        case _:
+            return []
+
+async def list_reservations(db: AsyncSession, conditions: list, sort: str, cursor: str | None, limit: int) -> dict:
+    '''
+    gets one keyset page of reservations joined with their car
+    
+    Input:
+        db: a database session
+        conditions: filters applied to the reservations
+        sort: one of SORT_KEYS
+        cursor: the next_cursor of the previous page, or None for the first page
+        limit: the page size
+    Returns:
+        a dict with the page items and the next cursor (None on the last page)
+    Raises:
+        HTTPException (400): if the sort order or the cursor is invalid
+    '''
+    sort_columns = SORT_KEYS.get(sort)
+    if not sort_columns:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid sort {sort}')
+    
+    stmt = keyset_page(select(*COLUMNS).join(Cars, Cars.id == Reservations.car_id).where(*conditions), sort_columns, cursor, limit)
+    rows, next_cursor = split_page((await db.exec(stmt)).all(), limit, lambda row: [row._mapping[c] for c in sort_columns])
+    items = [
+        {
+            'id': row.id,
+            'user_email': row.user_email,
+            'user_first_name': row.user_first_name,
+            'user_last_name': row.user_last_name,
+            'start_at': row.start_at,
+            'end_at': row.end_at,
+            'status': row.status,
+            'total_amount': row.total_amount,
+            'car': {'id': row.car_id, 'make': row.make, 'model': row.model, 'year': row.year}
+        }
+        for row in rows
+    ]
+    
+    return {'items': items, 'next_cursor': next_cursor}
+
+EXPORT_FIELDS = tuple(column.key for column in COLUMNS)
+
+# one slot per running export, each holding an export_engine connection
+export_slots = asyncio.Semaphore(settings.EXPORT_MAX_CONCURRENT)
+
+def export_value(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+async def stream_reservations(conditions: list, export_format: str) -> AsyncIterator[str]:
+    '''
+    streams every matching reservation joined with its car, in id order. The rows come
+    from a server-side cursor settings.EXPORT_BATCH_SIZE at a time and each batch is
+    serialized and sent before the next one is fetched, so memory stays flat however
+    many rows there are. At most settings.EXPORT_MAX_CONCURRENT exports read at once, a
+    later one waits for a slot
+
+    Input:
+        conditions: filters applied to the reservations
+        export_format: 'ndjson' (one JSON object per line) or 'csv' (with a header row)
+    Returns:
+        an async iterator of text chunks
+    '''
+    stmt = (
+        select(*COLUMNS).join(Cars, Cars.id == Reservations.car_id).where(*conditions)
+        .order_by(Reservations.id)
+        .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+    )
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+
+    # its own connection rather than the request's session, which may be closed before a
+    # long response has been streamed
+    async with export_slots, export_engine.connect() as conn:
+        result = await conn.stream(stmt)
+        async for rows in result.partitions():
+            if export_format == 'csv':
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([export_value(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(dict(zip(EXPORT_FIELDS, map(export_value, row))), separators=(',', ':')) + '\n' for row in rows)
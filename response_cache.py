@@ -0,0 +1,251 @@
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from cache import TTLCache
+from config import settings
+from datetime import date
+from typing import Any
+import hashlib, json
+
+AVAILABLE_CARS_PREFIX = 'available_cars:'
+CALENDAR_PREFIX = 'calendar:'
+SEARCH_PREFIX = 'search:'
+# responses that depend on the catalog and on reservations, keyed by '<prefix><start>:<end>'
+# optionally followed by ':<anything else the response depends on>'
+DATE_RANGE_PREFIXES = (AVAILABLE_CARS_PREFIX, CALENDAR_PREFIX, SEARCH_PREFIX)
+
+def car_key(car_id: int) -> str:
+    return f'car:{car_id}'
+
+def available_cars_key(start: date, end: date) -> str:
+    return f'{AVAILABLE_CARS_PREFIX}{start.isoformat()}:{end.isoformat()}'
+
+def calendar_key(start: date, end: date) -> str:
+    return f'{CALENDAR_PREFIX}{start.isoformat()}:{end.isoformat()}'
+
+def search_key(start: date, end: date, sort: str) -> str:
+    return f'{SEARCH_PREFIX}{start.isoformat()}:{end.isoformat()}:{sort}'
+
+class CachedResponse:
+    '''
+    a serialized JSON body together with its ETag. The ETag is derived from the body, so
+    every worker hands out the same one for the same content
+    '''
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+    def to_response(self, request: Request) -> Response:
+        '''
+        builds the response for a request, answering 304 when the client already has this version
+
+        Input:
+            request: the incoming request
+        Returns:
+            a 200 response with the body or an empty 304 response
+        '''
+        headers = {'ETag': self.etag, 'Cache-Control': f'public, max-age={settings.RESPONSE_CACHE_MAX_AGE}'}
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or self.etag in tags:
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(self.body, media_type='application/json', headers=headers)
+
+class MemoryStore:
+    '''
+    per-process store, bounded by settings.RESPONSE_CACHE_SIZE with LRU eviction
+    '''
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize, ttl)
+        self.generation = 0
+
+    async def get(self, key: str) -> bytes | None:
+        return self.cache.get(key)
+
+    async def get_generation(self) -> int:
+        return self.generation
+
+    async def bump_generation(self) -> None:
+        self.generation += 1
+
+    async def set(self, key: str, body: bytes, generation: int) -> None:
+        # nothing awaits between the check and the write, so no invalidation can slip in
+        if generation == self.generation:
+            self.cache.set(key, body)
+
+    async def delete(self, keys: list[str]) -> None:
+        for key in keys:
+            self.cache.delete(key)
+
+    async def keys(self, prefix: str) -> list[str]:
+        return [key for key in self.cache.keys() if key.startswith(prefix)]
+
+    async def clear(self) -> None:
+        self.cache.clear()
+
+# stores the body only if no invalidation bumped the generation since it was read
+REDIS_SET_IF_GENERATION = '''
+if tonumber(redis.call('GET', KEYS[1]) or '0') == tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+'''
+
+class RedisStore:
+    '''
+    store shared by every worker, so an invalidation in one worker applies to all of them.
+    The generation lives in redis as well and is compared in the same script that writes,
+    so a worker can't store a response that another worker invalidated meanwhile.
+    Needs the redis package, which is only imported when this store is configured
+    '''
+    def __init__(self, url: str, ttl: int):
+        from redis.asyncio import Redis
+        self.redis = Redis.from_url(url)
+        self.ttl = ttl
+        self.namespace = 'response:'
+        # outside the namespace, so clear() can't reset it
+        self.generation_key = 'response_generation'
+        self.set_if_generation = self.redis.register_script(REDIS_SET_IF_GENERATION)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.redis.get(self.namespace + key)
+
+    async def get_generation(self) -> int:
+        return int(await self.redis.get(self.generation_key) or 0)
+
+    async def bump_generation(self) -> None:
+        await self.redis.incr(self.generation_key)
+
+    async def set(self, key: str, body: bytes, generation: int) -> None:
+        await self.set_if_generation(keys=[self.generation_key, self.namespace + key], args=[generation, body, self.ttl])
+
+    async def delete(self, keys: list[str]) -> None:
+        if keys:
+            await self.redis.delete(*(self.namespace + key for key in keys))
+
+    async def keys(self, prefix: str) -> list[str]:
+        return [key.decode().removeprefix(self.namespace) async for key in self.redis.scan_iter(match=f'{self.namespace}{prefix}*')]
+
+    async def clear(self) -> None:
+        await self.delete(await self.keys(''))
+
+class ResponseCache:
+    '''
+    cache of serialized responses for the public catalog endpoints. Entries are dropped by
+    the writes that change them: car edits drop the car's entry and the catalog, reservation
+    writes drop only the available_cars, calendar and search entries whose dates overlap the
+    reservation.
+
+    Responses built from the availability index (the DATE_RANGE_PREFIXES) always go to a
+    per-process store: the index is per-process and may lag the other workers, so sharing
+    those responses would let a lagging worker publish its stale view to every worker. They
+    are only as stale as this worker's own index, and refreshing the index drops them
+    '''
+    def __init__(self, store: MemoryStore | RedisStore, local: MemoryStore | None = None):
+        if local is None:
+            if not isinstance(store, MemoryStore):
+                raise ValueError('A shared store needs a per-process store for the availability responses')
+            local = store
+        self.store = store
+        self.local = local
+
+    def store_for(self, key: str) -> MemoryStore | RedisStore:
+        return self.local if key.startswith(DATE_RANGE_PREFIXES) else self.store
+
+    async def get(self, key: str) -> CachedResponse | None:
+        '''
+        looks up a cached response
+
+        Input:
+            key: the cache key
+        Returns:
+            the cached response or None on a miss
+        '''
+        body = await self.store_for(key).get(key)
+        return CachedResponse(body) if body is not None else None
+
+    async def generation(self, key: str) -> int:
+        '''
+        reads the generation of the store a key lives in, to pass to set. It is bumped by
+        every invalidation, and a response computed while an invalidation happened may
+        already be stale, so it is served but not stored
+
+        Input:
+            key: the cache key
+        Returns:
+            the current generation
+        '''
+        return await self.store_for(key).get_generation()
+
+    async def set(self, key: str, content: Any, generation: int) -> CachedResponse:
+        '''
+        serializes content the way JSONResponse does and stores it
+
+        Input:
+            key: the cache key
+            content: the response content
+            generation: the value of generation(key) read before the content was loaded
+        Returns:
+            the cached response
+        '''
+        body = json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+        await self.store_for(key).set(key, body, generation)
+        return CachedResponse(body)
+
+    async def invalidate_car(self, car_id: int) -> None:
+        '''
+        drops the cached details of a car
+
+        Input:
+            car_id: the id of the car
+        Returns:
+            None
+        '''
+        await self.store.bump_generation()
+        await self.store.delete([car_key(car_id)])
+
+    async def invalidate_catalog(self) -> None:
+        '''
+        drops every cached list of available cars, calendar and search, after a car was
+        added, removed, activated or deactivated
+
+        Returns:
+            None
+        '''
+        await self.local.bump_generation()
+        for prefix in DATE_RANGE_PREFIXES:
+            await self.local.delete(await self.local.keys(prefix))
+
+    async def invalidate_availability(self, start: date, end: date) -> None:
+        '''
+        drops the cached lists of available cars, calendars and searches whose dates overlap
+        a reservation that started or stopped blocking its car
+
+        Input:
+            start: the first day of the reservation
+            end: the last day of the reservation
+        Returns:
+            None
+        '''
+        await self.local.bump_generation()
+        stale = []
+        for prefix in DATE_RANGE_PREFIXES:
+            for key in await self.local.keys(prefix):
+                cached_start, cached_end = (date.fromisoformat(d) for d in key.removeprefix(prefix).split(':', 2)[:2])
+                if cached_start <= end and cached_end >= start:
+                    stale.append(key)
+        await self.local.delete(stale)
+
+    async def clear(self) -> None:
+        for store in [self.store] if self.local is self.store else [self.store, self.local]:
+            await store.bump_generation()
+            await store.clear()
+
+if settings.RESPONSE_CACHE_URL:
+    response_cache = ResponseCache(
+        RedisStore(settings.RESPONSE_CACHE_URL, settings.RESPONSE_CACHE_TTL_SECONDS),
+        MemoryStore(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL_SECONDS)
+    )
+else:
+    response_cache = ResponseCache(MemoryStore(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL_SECONDS))
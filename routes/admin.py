@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status 
+from fastapi import APIRouter, Depends, HTTPException, Query, status 
+from fastapi.responses import StreamingResponse
 from sqlmodel import select
-from sqlalchemy import func
-from db import SessionDep
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import func, delete
+from sqlalchemy.exc import IntegrityError
+from db import AsyncSessionDep, get_pool_stats
+from metrics import metrics_registry
 from user import get_current_user
-from models import Reservations, UserBase, Cars, CarImages
+from models import Reservations, ReservationCounts, UserBase, Cars, CarImages, MediaJobs, CarIds
+from reservation_counts import summarize_counts
+from reservation_list import list_reservations, status_conditions, stream_reservations, export_slots
+from pagination import keyset_page, split_page
+from config import settings
+from availability import availability_index
+from response_cache import response_cache
+from typing import Literal
 
 router = APIRouter(prefix='/admin', tags=['admin'])
 
 @router.get("/reservation_counts")
-async def get_reservation_counts(db: SessionDep, user: UserBase = Depends(get_current_user)):
+async def get_reservation_counts(db: AsyncSessionDep, user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -16,55 +27,75 @@ async def get_reservation_counts(db: SessionDep, user: UserBase = Depends(get_cu
             headers={"WWW-Authenticate": "Bearer"}
             )
     
-    active_reservations = db.exec(select(func.count()).select_from(Reservations).where(Reservations.status.in_({'pending', 'active', 'confirmed'}))).first()
-    inactive_reservations = db.exec(select(func.count()).select_from(Reservations).where(Reservations.status.in_({'completed', 'cancelled'}))).first()
-    all_reservations = db.exec(select(func.count()).select_from(Reservations)).first()
+    if settings.RESERVATION_COUNTS_ROLLUP:
+        stmt = select(ReservationCounts.status, ReservationCounts.count)
+    else:
+        stmt = select(Reservations.status, func.count()).group_by(Reservations.status)
+    rows = (await db.exec(stmt)).all()
     
-    return {'active': active_reservations, 'inactive': inactive_reservations, 'all': all_reservations}
+    return summarize_counts(rows)
+
+@router.get("/pool_stats")
+async def pool_stats(user: UserBase = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="You are not authorized to perform this action",
+            headers={"WWW-Authenticate": "Bearer"}
+            )
+    
+    return get_pool_stats()
+
+@router.get("/metrics")
+async def get_metrics(user: UserBase = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="You are not authorized to perform this action",
+            headers={"WWW-Authenticate": "Bearer"}
+            )
+    
+    # per worker process, like the pool statistics
+    return metrics_registry.snapshot()
 
 @router.get("/reservations")
-async def get_reservations(db:SessionDep, statuses: str | None = None, cursor: int | None = None, limit: int | None = None, user: UserBase = Depends(get_current_user)):
+async def get_reservations(db: AsyncSessionDep, statuses: str | None = None, sort: str = 'id', cursor: str | None = None, limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX), user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
             detail="You are not authorized to perform this action",
             headers={"WWW-Authenticate": "Bearer"}
             )
-        
-    if not limit:
-        limit = 20
-        
-    match statuses:
-        case 'active':
-            db_statuses = {'pending', 'active', 'confirmed'}
-        case 'inactive':
-            db_statuses = {'completed', 'cancelled'}
-        case _:
-            db_statuses = {'pending', 'active', 'confirmed', 'completed', 'cancelled'}
-            
-    condition = [Reservations.status.in_(db_statuses)]
-    if cursor:
-        condition.append(Reservations.id >= cursor)
-    stmt = select(Reservations, Cars).where(*condition).join(Cars).order_by(Reservations.id).limit(limit + 1)
-    results = db.exec(stmt).all()
-    if not results:
-        return {'response': f'No {status if status != 'all' else 'found'} reservations'}
-    reservations_resp = []
-    for res, car in results:
-        car_info = {'id': car.id, 'make': car.make, 'model': car.model, 'year': car.year}
-        reservation = res.model_dump(exclude={'car_id', 'created_at'})
-        reservation['car'] = car_info
-        reservations_resp.append(reservation)
-    
-    if len(reservations_resp) > limit:
-        cursor = reservations_resp.pop()['id']
-    else:
-        cursor = None
-        
-    return {'items': reservations_resp, 'next_cursor': cursor}
     
+    page = await list_reservations(db, status_conditions(statuses), sort, cursor, limit)
+    if not page['items'] and not cursor:
+        return {'response': f'No {statuses or "found"} reservations'}
+    
+    return page
+    
+@router.get("/reservations/export")
+async def export_reservations(statuses: str | None = None, export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'), user: UserBase = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="You are not authorized to perform this action",
+            headers={"WWW-Authenticate": "Bearer"}
+            )
+    
+    # refused up front rather than left waiting for a slot once the 200 has been sent
+    if export_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many exports in progress, try again later",
+            headers={"Retry-After": "30"}
+            )
+    
+    media_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    headers = {'Content-Disposition': f'attachment; filename="reservations.{export_format}"'}
+    return StreamingResponse(stream_reservations(status_conditions(statuses), export_format), media_type=media_type, headers=headers)
+
 @router.patch("/reservations/approve/{id}")
-def approve_reservations(db: SessionDep, id: int, user: UserBase = Depends(get_current_user)):
+async def approve_reservations(db: AsyncSessionDep, id: int, user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -72,19 +103,22 @@ def approve_reservations(db: SessionDep, id: int, user: UserBase = Depends(get_c
             headers={"WWW-Authenticate": "Bearer"}
             )
         
-    reservation = db.exec(select(Reservations).where(Reservations.id == id)).first()
+    reservation = (await db.exec(select(Reservations).where(Reservations.id == id))).first()
     if not reservation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Reservation not found')
 
     setattr(reservation, 'status', 'confirmed')
         
     db.add(reservation)
-    db.commit()
+    await db.commit()
+    # approving a pending reservation keeps blocking the same dates, so usually nothing changes
+    if availability_index.sync(reservation):
+        await response_cache.invalidate_availability(reservation.start_at, reservation.end_at)
     
     return {'detail': 'Reservation successfully updated'}
 
 @router.patch("/reservations/cancel/{id}")
-def cancel_reservation(db: SessionDep, id: int, user: UserBase = Depends(get_current_user)):
+async def cancel_reservation(db: AsyncSessionDep, id: int, user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -92,56 +126,44 @@ def cancel_reservation(db: SessionDep, id: int, user: UserBase = Depends(get_cur
             headers={"WWW-Authenticate": "Bearer"}
             )
         
-    reservation = db.exec(select(Reservations).where(Reservations.id == id)).first()
+    reservation = (await db.exec(select(Reservations).where(Reservations.id == id))).first()
     if not reservation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Reservation not found')
 
     setattr(reservation, 'status', 'cancelled')
         
     db.add(reservation)
-    db.commit()
+    await db.commit()
+    if availability_index.sync(reservation):
+        await response_cache.invalidate_availability(reservation.start_at, reservation.end_at)
     
     return {'detail': 'Reservation successfully updated'}
 
 @router.get("/cars")
-async def get_cars(db: SessionDep, stat: str | None = None, cursor: int | None = None, limit: int | None = None, user: UserBase = Depends(get_current_user)):
+async def get_cars(db: AsyncSessionDep, stat: str | None = None, cursor: str | None = None, limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX), user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
             detail="You are not authorized to perform this action",
             headers={"WWW-Authenticate": "Bearer"}
             )
-        
-    if not limit:
-        limit = 20
-        
+    
     conditions = []
-    if cursor:
-        conditions.append(Cars.id >= cursor)
     if stat == 'active':
         conditions.append(Cars.is_active == True)
     elif stat == 'inactive':
         conditions.append(Cars.is_active == False)
     
-    if len(conditions) > 0:
-        stmt = select(Cars).where(*conditions).order_by(Cars.id).limit(limit + 1)
-    else:
-        stmt = select(Cars).order_by(Cars.id).limit(limit + 1)
-    
-    db_cars = db.exec(stmt).all()
-    if not db_cars:
+    stmt = keyset_page(select(*Cars.__table__.columns).where(*conditions), (Cars.id,), cursor, limit)
+    rows, cursor = split_page((await db.exec(stmt)).all(), limit, lambda row: [row.id])
+    if not rows:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No cars found')
-    cars = [car.model_dump() for car in db_cars]
-        
-    if len(cars) > limit:
-        cursor = cars.pop()['id']
-    else:
-        cursor = None
+    cars = [dict(row._mapping) for row in rows]
     
     return {'items': cars, 'cursor': cursor}
 
 @router.patch("/cars/set_inactive/{id}")
-async def set_inactive(db: SessionDep, id: int, user: UserBase = Depends(get_current_user)):
+async def set_inactive(db: AsyncSessionDep, id: int, user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -149,18 +171,20 @@ async def set_inactive(db: SessionDep, id: int, user: UserBase = Depends(get_cur
             headers={"WWW-Authenticate": "Bearer"}
             )
         
-    car = db.exec(select(Cars).where(Cars.id == id)).first()
+    car = (await db.exec(select(Cars).where(Cars.id == id))).first()
     if not car:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No cars found')
     
     setattr(car, 'is_active', False)
     db.add(car)
-    db.commit()
+    await db.commit()
+    # the car details don't include is_active, only the catalog changes
+    await response_cache.invalidate_catalog()
     
     return {'detail': f'Status set to inactive for car ID {car.id}'}
 
 @router.patch("/cars/set_active/{id}")
-async def set_active(db: SessionDep, id: int, user: UserBase = Depends(get_current_user)):
+async def set_active(db: AsyncSessionDep, id: int, user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -168,35 +192,105 @@ async def set_active(db: SessionDep, id: int, user: UserBase = Depends(get_curre
             headers={"WWW-Authenticate": "Bearer"}
             )
         
-    car = db.exec(select(Cars).where(Cars.id == id)).first()
+    car = (await db.exec(select(Cars).where(Cars.id == id))).first()
     if not car:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No cars found')
     
     setattr(car, 'is_active', True)
     db.add(car)
-    db.commit()
+    await db.commit()
+    await response_cache.invalidate_catalog()
     
     return {'detail': f'Status set to active for car ID {car.id}'}
 
+DELETE_ATTEMPTS = 2
+
+async def reserved_cars(db: AsyncSession, ids: set[int]) -> set[int]:
+    '''
+    Input:
+        db: a database session
+        ids: car ids
+    Returns:
+        the ids of the cars that have reservations
+    '''
+    return set((await db.exec(select(Reservations.car_id).where(Reservations.car_id.in_(ids)).distinct())).all())
+
+async def delete_cars(db: AsyncSession, ids: set[int]) -> tuple[set[int], set[int]]:
+    '''
+    deletes cars together with their images and media jobs in one transaction, using
+    set-based DELETE statements. Cars that still have reservations are kept
+    
+    the cars are locked before they are checked, so a booking can't slip in between the
+    check and the delete (bookings wait on the lock, then fail the car's foreign key). The
+    delete of the cars repeats the check itself and only the ids it returns count as
+    deleted; if it skips a car (a backend without row locks), the transaction is rolled
+    back and the check runs again
+    
+    Input:
+        db: a database session
+        ids: the ids of the cars to delete
+    Returns:
+        the ids that were deleted and the ids that were kept because they have reservations
+    Raises:
+        HTTPException: 409 if the cars keep gaining reservations while being deleted
+    '''
+    unreserved = ~select(Reservations.id).where(Reservations.car_id == Cars.id).exists()
+    for _ in range(DELETE_ATTEMPTS):
+        existing = set((await db.exec(select(Cars.id).where(Cars.id.in_(ids)).with_for_update())).all())
+        reserved = await reserved_cars(db, existing)
+        deletable = existing - reserved
+        if not deletable:
+            # releases the row locks
+            await db.rollback()
+            return deletable, reserved
+        
+        try:
+            await db.exec(delete(CarImages).where(CarImages.car_id.in_(deletable)))
+            await db.exec(delete(MediaJobs).where(MediaJobs.car_id.in_(deletable)))
+            stmt = delete(Cars).where(Cars.id.in_(deletable), unreserved).returning(Cars.id)
+            deleted = set((await db.exec(stmt)).scalars().all())
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Cars gained reservations while being deleted, try again')
+        if deleted == deletable:
+            await db.commit()
+            for car_id in deleted:
+                availability_index.discard_car(car_id)
+                await response_cache.invalidate_car(car_id)
+            await response_cache.invalidate_catalog()
+            return deleted, reserved
+        # the skipped cars lost their images above, so none of it is kept
+        await db.rollback()
+    
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Cars gained reservations while being deleted, try again')
+
 @router.delete("/cars/delete/{id}")
-async def delete_car(db: SessionDep, id: int, user: UserBase = Depends(get_current_user)):
+async def delete_car(db: AsyncSessionDep, id: int, user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
             detail="You are not authorized to perform this action",
             headers={"WWW-Authenticate": "Bearer"}
             )
-        
-    car = db.exec(select(Cars).where(Cars.id == id)).first()
-    if not car:
+    
+    deleted, reserved = await delete_cars(db, {id})
+    if reserved:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Car ID {id} has reservations and cannot be deleted')
+    if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='No cars found')
     
-    car_imgs = db.exec(select(CarImages).where(CarImages.car_id == car.id)).all()
-    for img in car_imgs:
-        db.delete(img)
-        db.commit()
+    return {'detail': f'Deleted car ID {id}'}
+
+@router.post("/cars/bulk_delete")
+async def bulk_delete_cars(db: AsyncSessionDep, cars: CarIds, user: UserBase = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="You are not authorized to perform this action",
+            headers={"WWW-Authenticate": "Bearer"}
+            )
     
-    db.delete(car)
-    db.commit()
+    ids = set(cars.ids)
+    deleted, reserved = await delete_cars(db, ids)
     
-    return {'detail': f'Deleted car ID {car.id}'}
\ No newline at end of file
+    return {'deleted': sorted(deleted), 'has_reservations': sorted(reserved), 'not_found': sorted(ids - deleted - reserved)}
@@ -1,21 +1,24 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, Depends, Query, Request, UploadFile, File, HTTPException, status
 from sqlmodel import select
-from sqlalchemy import and_, not_, exists
-from db import SessionDep
-from models import Cars, CarBase, UserBase, CarImages, Reservations
+from sqlalchemy import and_
+from db import AsyncSessionDep
+from models import Cars, CarBase, CarFilters, UserBase, CarImages, MediaJobs
 from user import get_current_user
+from uploads import upload_images
+from availability import availability_index, blocking_overlap, encode_days
+from jobs import media_jobs
+from response_cache import response_cache, car_key, available_cars_key, calendar_key, search_key
+from car_search import search_cars
+from pricing import price_engine, check_span
 from config import settings
-from imagekit import imagekit
-from uuid import uuid4
 from typing import List
-from datetime import date
-import os, shutil
+from datetime import date, timedelta
 
 
 router = APIRouter(prefix='/cars', tags=['cars'])
 
 @router.post("/add_car")
-async def add_car(db: SessionDep, car: CarBase = Depends(CarBase.as_form), images: List[UploadFile] = File(...), user: UserBase = Depends(get_current_user)):
+async def add_car(db: AsyncSessionDep, car: CarBase = Depends(CarBase.as_form), images: List[UploadFile] = File(...), user: UserBase = Depends(get_current_user)):
     if not user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -23,66 +26,164 @@ async def add_car(db: SessionDep, car: CarBase = Depends(CarBase.as_form), image
             headers={"WWW-Authenticate": "Bearer"}
             )
     
-    db_car = Cars(**car)
+    # upload first so the car and its images are written in a single transaction
+    uploaded = await upload_images(images)
+    
+    db_car = Cars(**car.model_dump())
     db.add(db_car)
-    db.commit()
-    db.refresh(db_car)
-    
-    saved_images: list[CarImages] = []
-    folder = os.path.join(settings.MEDIA_PATH, f"cars/{db_car.id}")
-    os.makedirs(folder, exist_ok=True)
-    
-    for i, img in enumerate(images):
-        ext = os.path.splitext(img.filename or "")[1].lower() or ".bin"
-        filename = f"{uuid4().hex}{ext}"
-        dir_path = os.path.join(folder, filename)
-        await img.seek(0)
-        with open(dir_path, "wb") as f:
-            shutil.copyfileobj(img.file, f)
-            
-        with open(dir_path, "rb") as f:
-            upload = imagekit.upload_file(
-                file=f,
-                file_name=filename
-            )
-        image_url = upload.response_metadata.raw.get("url")
-        if i == 0:
-            image = CarImages(car_id=db_car.id, image_url=image_url, is_primary=True)
-        else:
-            image = CarImages(car_id=db_car.id, image_url=image_url)
-        saved_images.append(image)
+    await db.flush()
     
+    saved_images = [CarImages(car_id=db_car.id, image_url=image_url, thumbnail_url=thumbnail_url, is_primary=(i == 0)) for i, (image_url, thumbnail_url) in enumerate(uploaded)]
     db.add_all(saved_images)
-    db.commit()
+    await db.commit()
+    await response_cache.invalidate_catalog()
     
     return {"detail": "car added successfuly"}
 
+@router.post("/add_car_job", status_code=status.HTTP_202_ACCEPTED)
+async def add_car_job(db: AsyncSessionDep, car: CarBase = Depends(CarBase.as_form), images: List[UploadFile] = File(...), user: UserBase = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="You are not authorized to perform this action",
+            headers={"WWW-Authenticate": "Bearer"}
+            )
+    
+    # the car stays inactive until its images have been processed
+    db_car = Cars(**car.model_dump(), is_active=False)
+    db.add(db_car)
+    await db.commit()
+    
+    job = await media_jobs.submit(db_car, images)
+    
+    return {"job_id": job.id, "car_id": db_car.id, "status": job.status}
+
+@router.get("/jobs/{job_id}")
+async def get_car_job(db: AsyncSessionDep, job_id: str, user: UserBase = Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail="You are not authorized to perform this action",
+            headers={"WWW-Authenticate": "Bearer"}
+            )
+    
+    job = await db.get(MediaJobs, job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Could not find job")
+    
+    return job.model_dump()
+
 @router.get("/available_cars")
-async def get_available_cars(db: SessionDep, start: date, end: date):
-    # if the start of a new reservation is <= the end of an existing AND the end of the 
-    # new reservation >= the start of the existing reservation, ther's an overlap
-    overlappin_res = and_(Reservations.start_at <= end, Reservations.end_at >= start, Reservations.status.in_(('pending', 'confirmed')))
-    stmt = select(Cars).where(and_(not_(exists(select(Reservations.id).where(Reservations.car_id == Cars.id).where(overlappin_res)))), Cars.is_active)
-    db_available_cars = db.exec(stmt).all()
+async def get_available_cars(db: AsyncSessionDep, request: Request, start: date, end: date):
+    try:
+        check_span(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    key = available_cars_key(start, end)
+    cached = await response_cache.get(key)
+    if cached:
+        return cached.to_response(request)
+    
+    generation = await response_cache.generation(key)
+    # cars with a blocking reservation overlapping the requested dates come from the
+    # availability index, so only the catalog itself is read from the database
+    unavailable = availability_index.unavailable_cars(start, end)
+    # the primary image is joined in the same statement so the query count stays constant
+    # no matter how many cars are available
+    primary_image = and_(CarImages.car_id == Cars.id, CarImages.is_primary == True)
+    stmt = select(Cars, CarImages.image_url).outerjoin(CarImages, primary_image).where(Cars.is_active, Cars.id.not_in(unavailable))
+    results = (await db.exec(stmt)).all()
+    quotes = price_engine.quote_many({car.id: car.daily_rate for car, _ in results}, start, end)
     available_cars = []
     
-    for car in db_available_cars:
-        db_image = db.exec(select(CarImages).where(and_(CarImages.car_id == car.id), CarImages.is_primary == True)).first()
+    for car, image_url in results:
         car = car.model_dump()
-        car['image_url'] = db_image.image_url if db_image else None
+        car['image_url'] = image_url
+        car['total_amount'] = quotes[car['id']]
         available_cars.append(car)
     
-    return available_cars
+    cached = await response_cache.set(key, available_cars, generation)
+    return cached.to_response(request)
+
+@router.get("/calendar")
+async def get_calendar(db: AsyncSessionDep, request: Request, start: date, days: int = Query(90, ge=1, le=settings.CALENDAR_MAX_DAYS)):
+    end = start + timedelta(days=days - 1)
+    key = calendar_key(start, end)
+    cached = await response_cache.get(key)
+    if cached:
+        return cached.to_response(request)
+    
+    generation = await response_cache.generation(key)
+    # one bit per day, built from the availability index; a set bit means the car is free
+    blocked = availability_index.blocked_days(start, end)
+    every_day = (1 << days) - 1
+    car_ids = (await db.exec(select(Cars.id).where(Cars.is_active).order_by(Cars.id))).all()
+    calendar = {
+        'start': start,
+        'days': days,
+        'cars': {car_id: encode_days(every_day & ~blocked.get(car_id, 0), days) for car_id in car_ids}
+    }
+    
+    cached = await response_cache.set(key, calendar, generation)
+    return cached.to_response(request)
+
+@router.get("/search")
+async def search(db: AsyncSessionDep, request: Request, start: date, end: date, filters: CarFilters = Depends(CarFilters.as_query), sort: str = 'id', cursor: str | None = None, limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX)):
+    # only the first, unfiltered page is cached, keyed by dates and sort order like the other
+    # availability responses; caching every filter, cursor and page size combination would
+    # leave the keyspace unbounded and push the hot available_cars and calendar entries out
+    if cursor or limit != settings.PAGE_SIZE_DEFAULT or filters.model_dump(exclude_none=True):
+        return await search_cars(db, start, end, filters, sort, cursor, limit)
+    
+    key = search_key(start, end, sort)
+    cached = await response_cache.get(key)
+    if cached:
+        return cached.to_response(request)
+    
+    generation = await response_cache.generation(key)
+    page = await search_cars(db, start, end, filters, sort, cursor, limit)
+    
+    cached = await response_cache.set(key, page, generation)
+    return cached.to_response(request)
+
+@router.get("/quote")
+async def get_quote(db: AsyncSessionDep, start: date, end: date, car_id: List[int] | None = Query(None)):
+    try:
+        days = check_span(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # without car ids every car available for the dates is quoted, all in one pass. The
+    # database decides which cars are free, a quote isn't served from the (possibly stale)
+    # availability index
+    condition = Cars.id.in_(car_id) if car_id else ~blocking_overlap(Cars.id, start, end)
+    rates = (await db.exec(select(Cars.id, Cars.daily_rate).where(Cars.is_active, condition).order_by(Cars.id))).all()
+    if car_id and not rates:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Could not find car")
+    
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'quotes': price_engine.quote_many(dict(rates), start, end)
+    }
 
 @router.get("/{id}")
-async def get_car(db: SessionDep, id: int):
-    db_car = db.exec(select(Cars).where(Cars.id == id)).first()
+async def get_car(db: AsyncSessionDep, request: Request, id: int):
+    key = car_key(id)
+    cached = await response_cache.get(key)
+    if cached:
+        return cached.to_response(request)
+    
+    generation = await response_cache.generation(key)
+    db_car = (await db.exec(select(Cars).where(Cars.id == id))).first()
     if not db_car:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Could not find car")
     
     car = db_car.model_dump(exclude={'is_active'})
-    db_images = db.exec(select(CarImages).where(CarImages.car_id == db_car.id)).all()
+    db_images = (await db.exec(select(CarImages).where(CarImages.car_id == db_car.id))).all()
     images = [image.image_url for image in db_images]
     car['images'] = images
     
-    return car
\ No newline at end of file
+    cached = await response_cache.set(key, car, generation)
+    return cached.to_response(request)
@@ -1,31 +1,106 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, status
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Numeric, cast, func, insert, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import and_, exists
-from db import SessionDep
-from models import ReservationBase, Reservations
+from db import AsyncSessionDep
+from models import Cars, ReservationBase, Reservations, ReservationStatus, UserBase
+from user import get_current_user
+from availability import availability_index, blocking_overlap
+from reservation_counts import adjust_count
+from response_cache import response_cache
+from reservation_batch import check_batch, insert_batch
+from pricing import price_engine
+from config import settings
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Annotated
 
 router = APIRouter(prefix='/reservations', tags=['reservations'])
 
-@router.post("/add")
-async def add_reservation(db: SessionDep, reservation: ReservationBase):
-    overlap_condition = and_(
-        Reservations.start_at <= reservation.end_at,
-        Reservations.end_at >= reservation.start_at,
-        Reservations.status.in_({'pending', 'confirmed', 'active'}),
-        Reservations.car_id == reservation.car_id
-    )
+def insert_reservation(db: AsyncSession, row: dict, factor: Decimal):
+    '''
+    builds a single statement that inserts a reservation only if its car is active and free
+    for the dates, pricing it from the car's daily rate on the way
 
-    conflict_exists = db.exec(select(exists().where(overlap_condition))).first()
-    
-    if conflict_exists:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The selected car is not available for these dates.")
-    
-    db_reservation = Reservations(**reservation.model_dump())
+    Input:
+        db: a database session
+        row: the reservation's column values, without total_amount
+        factor: the price factor of the dates (see pricing.PriceEngine.factor)
+    Returns:
+        an INSERT ... SELECT ... RETURNING id, total_amount, which returns no row when the
+        car is taken or can't be booked
+    '''
+    columns = list(row) + ['total_amount']
+    overlap = blocking_overlap(row['car_id'], row['start_at'], row['end_at'])
+    postgres = db.bind.dialect.name == 'postgresql'
+    # Postgres types the parameters of a bare SELECT list as text, so they are cast to the
+    # column types there (a CAST to DATE would turn SQLite's ISO dates into numbers)
+    typed = cast if postgres else literal
+    total_amount = func.round(Cars.daily_rate * typed(factor, Numeric()), 2)
+    values = select(
+        *(typed(value, Reservations.__table__.c[column].type) for column, value in row.items()), total_amount
+    ).where(Cars.id == row['car_id'], Cars.is_active, ~overlap)
+    if postgres:
+        # NOT EXISTS skips the committed conflicts without raising; a concurrent booking that
+        # commits first is caught by the reservation_no_overlap constraint, and DO NOTHING
+        # turns that into an empty result as well
+        return pg_insert(Reservations).from_select(columns, values).on_conflict_do_nothing().returning(Reservations.id, Reservations.total_amount)
+    return insert(Reservations).from_select(columns, values).returning(Reservations.id, Reservations.total_amount)
+
+@router.post("/add")
+async def add_reservation(db: AsyncSessionDep, reservation: ReservationBase):
+    # one round trip: the database decides, so a stale availability index can neither let a
+    # double booking through nor turn away a booking for dates freed by another worker
     try:
-        db.add(db_reservation)
-        db.commit()
+        factor = price_engine.factor(reservation.start_at, reservation.end_at)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # the client's total_amount is ignored, the price comes from the car's daily rate
+    row = {**reservation.model_dump(exclude={'total_amount'}), 'status': ReservationStatus.pending, 'created_at': datetime.now(timezone.utc)}
+    try:
+        inserted = (await db.exec(insert_reservation(db, row, factor))).first()
+        if inserted is not None and settings.RESERVATION_COUNTS_ROLLUP:
+            # a Core INSERT bypasses the ORM hooks that keep the rollup current
+            await db.exec(adjust_count(ReservationStatus.pending, 1))
+        await db.commit()
     except IntegrityError as e:
        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Failed to add reservation. {e}') 
+    if inserted is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The selected car is not available for these dates.")
+    
+    reservation_id, total_amount = inserted
+    db_reservation = Reservations(id=reservation_id, total_amount=total_amount, **row)
+    if availability_index.sync(db_reservation):
+        await response_cache.invalidate_availability(db_reservation.start_at, db_reservation.end_at)
 
-    return {"success": "reservation successfully added"}
\ No newline at end of file
+    return {"success": "reservation successfully added", "id": reservation_id, "total_amount": total_amount}
+
+@router.post("/add_batch")
+async def add_reservations(db: AsyncSessionDep, reservations: Annotated[list[ReservationBase], Body(min_length=1, max_length=settings.RESERVATION_BATCH_MAX)], user: UserBase = Depends(get_current_user)):
+    # meant for corporate and partner integrations booking on behalf of others, so unlike
+    # a single booking it needs an authenticated caller
+    # the batch is checked with one query against the database rather than the index, so
+    # a worker's stale index can't let a whole batch through
+    errors, daily_rates = await check_batch(db, reservations)
+    accepted = [r for r, error in zip(reservations, errors) if error is None]
+    created = []
+    if accepted:
+        try:
+            created = await insert_batch(db, accepted, daily_rates)
+            await db.commit()
+        except IntegrityError as e:
+            # a concurrent booking won one of the dates after the check, nothing was inserted
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Failed to add reservations. {e}')
+        
+        changed = [availability_index.sync(r) for r in created]
+        if any(changed):
+            await response_cache.invalidate_availability(min(r.start_at for r in created), max(r.end_at for r in created))
+    
+    ids = iter({'id': r.id, 'total_amount': r.total_amount} for r in created)
+    results = [
+        {'index': i, 'status': 'created', **next(ids)} if error is None else {'index': i, 'status': 'rejected', 'detail': error}
+        for i, error in enumerate(errors)
+    ]
+    return {'created': len(created), 'rejected': len(reservations) - len(created), 'results': results}
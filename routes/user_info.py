@@ -1,48 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlmodel import select
-from db import SessionDep
-from models import UserBase, Reservations, Cars
+from db import AsyncSessionDep
+from models import UserBase, Reservations
+from config import settings
+from reservation_list import list_reservations, status_conditions
 from user import get_current_user
+from availability import availability_index
+from response_cache import response_cache
 
-router = APIRouter(prefix='user_info', tags=['user info'])
+router = APIRouter(prefix='/user_info', tags=['user info'])
 
 @router.get('/reservations')
-async def get_reservations(db: SessionDep, status: str | None = None, cursor: int | None = None, limit: int | None = None, user: UserBase = Depends(get_current_user)):
-    if not limit:
-        limit = 20
-        
-    match status:
-        case 'active':
-            db_statuses = {'pending', 'active', 'confirmed'}
-        case 'inactive':
-            db_statuses = {'completed', 'cancelled'}
-        case _:
-            db_statuses = {'pending', 'active', 'confirmed', 'completed', 'cancelled'}
-            
-    condition = [Reservations.status.in_(db_statuses), Reservations.user_email == user.email]
-    if cursor:
-        condition.append(Reservations.id >= cursor)
-    stmt = select(Reservations, Cars).where(*condition).join(Cars).order_by(Reservations.id).limit(limit + 1)
-    results = db.exec(stmt).all()
-    if not results:
-        return {'response': f'No {status if status != 'all' else 'found'} reservations'}
-    reservations_resp = []
-    for res, car in results:
-        car_info = {'id': car.id, 'make': car.make, 'model': car.model, 'year': car.year}
-        reservation = res.model_dump(exclude={'car_id', 'created_at'})
-        reservation['car'] = car_info
-        reservations_resp.append(reservation)
+async def get_reservations(db: AsyncSessionDep, status: str | None = None, sort: str = 'id', cursor: str | None = None, limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX), user: UserBase = Depends(get_current_user)):
+    conditions = status_conditions(status) + [Reservations.user_email == user.email]
+    page = await list_reservations(db, conditions, sort, cursor, limit)
+    if not page['items'] and not cursor:
+        return {'response': f'No {status or "found"} reservations'}
     
-    if len(reservations_resp) > limit:
-        cursor = reservations_resp.pop()['id']
-    else:
-        cursor = None
-        
-    return {'items': reservations_resp, 'next_cursor': cursor}
+    return page
 
 @router.patch("/reservations/cancel/{id}")
-def cancel_reservation(db: SessionDep, id: int, user: UserBase = Depends(get_current_user)):
-    reservation = db.exec(select(Reservations).where(Reservations.id == id, Reservations.user_email == user.email)).first()
+async def cancel_reservation(db: AsyncSessionDep, id: int, user: UserBase = Depends(get_current_user)):
+    reservation = (await db.exec(select(Reservations).where(Reservations.id == id, Reservations.user_email == user.email))).first()
     if not reservation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Reservation not found')
 
@@ -51,6 +30,8 @@ def cancel_reservation(db: SessionDep, id: int, user: UserBase = Depends(get_cur
     setattr(reservation, 'status', 'cancelled')
         
     db.add(reservation)
-    db.commit()
+    await db.commit()
+    if availability_index.sync(reservation):
+        await response_cache.invalidate_availability(reservation.start_at, reservation.end_at)
     
     return {'detail': 'Reservation successfully updated'}
\ No newline at end of file
@@ -0,0 +1,100 @@
+'''
+entry point for running the API
+
+    python -m server                  production: one worker per core
+    python -m server --workers 4
+    python -m server --dev            single process with auto-reload
+
+apply pending migrations first (python -m migrations upgrade), workers refuse to start
+on an outdated schema
+'''
+from config import settings
+import argparse, os, logging, uvicorn
+
+logger = logging.getLogger(__name__)
+
+def pool_sizing(max_connections: int, workers: int, reserved: int = 0) -> tuple[int, int]:
+    '''
+    splits a database connection budget between the workers. Each worker has two engines
+    (async for requests, sync for startup and background work) with a pool each
+
+    Input:
+        max_connections: how many connections the whole server may open
+        workers: the number of worker processes
+        reserved: connections each worker opens outside its pools (its streaming exports)
+    Returns:
+        the pool size and max overflow of each engine
+    Raises:
+        ValueError: if the budget can't give every engine at least one connection
+    '''
+    per_engine = (max_connections // workers - reserved) // 2
+    if per_engine < 1:
+        raise ValueError(f'DB_MAX_CONNECTIONS={max_connections} is too small for {workers} workers, each needs {2 + reserved} connections')
+    # no overflow, so the budget is a hard cap even when every pool is exhausted
+    return per_engine, 0
+
+def fit_workers(max_connections: int, workers: int, reserved: int = 0) -> int:
+    '''
+    lowers the worker count to what a database connection budget can serve, rather than
+    open more connections than the budget allows
+
+    Input:
+        max_connections: how many connections the whole server may open
+        workers: the requested number of worker processes
+        reserved: connections each worker opens outside its pools
+    Returns:
+        the number of workers to start
+    '''
+    affordable = max(max_connections // (2 + reserved), 1)
+    if workers > affordable:
+        logger.warning("DB_MAX_CONNECTIONS=%s only fits %s workers, starting %s instead of %s", max_connections, affordable, affordable, workers)
+        return affordable
+    return workers
+
+def run(workers: int | None = None, dev: bool = False) -> None:
+    '''
+    starts uvicorn
+
+    Input:
+        workers: the number of worker processes, defaults to settings.WEB_WORKERS or the core count
+        dev: run a single auto-reloading process instead
+    Returns:
+        None
+    '''
+    if dev:
+        uvicorn.run('main:app', host='127.0.0.1', port=settings.PORT, reload=True)
+        return
+
+    workers = workers or settings.WEB_WORKERS or os.cpu_count() or 1
+    if settings.DB_MAX_CONNECTIONS:
+        workers = fit_workers(settings.DB_MAX_CONNECTIONS, workers, settings.EXPORT_MAX_CONCURRENT)
+        pool_size, max_overflow = pool_sizing(settings.DB_MAX_CONNECTIONS, workers, settings.EXPORT_MAX_CONCURRENT)
+        # workers are fresh processes that build their own Settings, so the sizes are
+        # handed down through the environment
+        os.environ['DB_POOL_SIZE'] = str(pool_size)
+        os.environ['DB_MAX_OVERFLOW'] = str(max_overflow)
+
+    uvicorn.run(
+        'main:app',
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        # uvloop and httptools when they are installed, asyncio and h11 otherwise
+        loop='auto',
+        http='auto',
+        # in-flight requests get this long to finish on SIGTERM before workers are stopped
+        timeout_graceful_shutdown=settings.GRACEFUL_SHUTDOWN_SECONDS,
+        proxy_headers=True,
+        access_log=settings.ACCESS_LOG
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--dev', action='store_true')
+    args = parser.parse_args()
+
+    run(args.workers, args.dev)
+
+if __name__ == '__main__':
+    main()
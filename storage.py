@@ -0,0 +1,117 @@
+from config import settings
+from threading import Lock
+from typing import BinaryIO, Protocol
+import os, shutil, time
+
+class StorageBackend(Protocol):
+    '''
+    where car images end up. save is blocking and is run on a worker thread by uploads.py
+    '''
+    def save(self, file: BinaryIO, file_name: str) -> tuple[str, str]:
+        '''
+        stores a file
+
+        Input:
+            file: a readable binary file object
+            file_name: the unique name to store it under
+        Returns:
+            the url of the stored image and the url of its thumbnail
+        '''
+        ...
+
+class ImageKitStorage:
+    '''
+    stores images on ImageKit. The SDK client is only imported and built when the first
+    image is saved, so workers that never upload don't pay for it
+    '''
+    def __init__(self, private_key: str | None, public_key: str | None, url_endpoint: str | None):
+        self.private_key = private_key
+        self.public_key = public_key
+        self.url_endpoint = url_endpoint
+        self._client = None
+        self._lock = Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from imagekitio import ImageKit
+                    self._client = ImageKit(private_key=self.private_key, public_key=self.public_key, url_endpoint=self.url_endpoint)
+        return self._client
+
+    def save(self, file: BinaryIO, file_name: str) -> tuple[str, str]:
+        raw = self.client.upload_file(file=file, file_name=file_name).response_metadata.raw
+        # thumbnails are ImageKit url transformations of the stored original
+        thumbnail_url = self.client.url({'path': raw.get('filePath'), 'transformation': [{'width': settings.THUMBNAIL_WIDTH}]})
+        return raw.get('url'), thumbnail_url
+
+class LocalStorage:
+    '''
+    stores images under settings.MEDIA_PATH/images, served by the app at settings.MEDIA_URL.
+    There is no resizing, so the thumbnail is the original image
+    '''
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def save(self, file: BinaryIO, file_name: str) -> tuple[str, str]:
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, file_name), 'wb') as f:
+            shutil.copyfileobj(file, f)
+        url = f'{self.base_url}/{file_name}'
+        return url, url
+
+class MemoryStorage:
+    '''
+    keeps images in a dict, optionally waiting a fixed latency per save to stand in for a
+    remote store (tests and benchmarks)
+    '''
+    def __init__(self, latency: float = 0.0, url_endpoint: str = 'memory://images'):
+        self.latency = latency
+        self.url_endpoint = url_endpoint
+        self.files: dict[str, bytes] = {}
+
+    def save(self, file: BinaryIO, file_name: str) -> tuple[str, str]:
+        self.files[file_name] = file.read()
+        time.sleep(self.latency)
+        return f'{self.url_endpoint}/{file_name}', f'{self.url_endpoint}/tr:w-{settings.THUMBNAIL_WIDTH}/{file_name}'
+
+def create_storage(backend: str) -> StorageBackend:
+    '''
+    builds a storage backend
+
+    Input:
+        backend: 'imagekit', 'local' or 'memory'
+    Returns:
+        the storage backend
+    Raises:
+        ValueError: if the backend is unknown
+    '''
+    match backend:
+        case 'imagekit':
+            return ImageKitStorage(settings.IK_PRIVATE, settings.IK_PUBLIC, settings.IK_URL)
+        case 'local':
+            return LocalStorage(os.path.join(settings.MEDIA_PATH, 'images'), settings.MEDIA_URL)
+        case 'memory':
+            return MemoryStorage(latency=settings.MEMORY_STORAGE_LATENCY)
+        case _:
+            raise ValueError(f'Unknown storage backend {backend}')
+
+# the process-wide backend, built by the first get_storage call
+storage_backend: StorageBackend | None = None
+_storage_lock = Lock()
+
+def get_storage() -> StorageBackend:
+    '''
+    gets the storage backend selected by settings.STORAGE_BACKEND, building it on first use
+
+    Returns:
+        the shared storage backend
+    '''
+    global storage_backend
+    if storage_backend is None:
+        with _storage_lock:
+            if storage_backend is None:
+                storage_backend = create_storage(settings.STORAGE_BACKEND)
+    return storage_backend
@@ -2,11 +2,15 @@ from fastapi.testclient import TestClient
 from datetime import datetime, timedelta, timezone
 from main import app
 from db import engine
-from models import Users, Cars, Reservations
+from models import Users, Cars, Reservations, ReservationCounts, ReservationStatus
+from reservation_counts import rebuild_reservation_counts
 from user import hash_password
 from sqlmodel import Session, select
+from sqlalchemy import func, update
 from uuid import uuid4
-import pytest
+from config import settings
+import routes.admin
+import pytest, json, csv, io, asyncio
 
 
 client = TestClient(app)
@@ -123,10 +127,66 @@ class TestAdmin:
         headers={'Authorization': f'Bearer {str(uuid4())}'}
         )
         
+        counts = resp_200.json()
         assert resp_200.status_code == 200
+        assert counts['active'] >= 1
+        assert counts['all'] == counts['active'] + counts['inactive']
         assert resp_401_non_admin.status_code == 401
         assert resp_401_invalid_token.status_code == 401
     
+    def test_rebuild_reservation_counts(self, info):
+        with Session(engine) as db:
+            # drifted counters are overwritten, missing ones are created
+            db.exec(update(ReservationCounts).values(count=999))
+            cancelled = db.get(ReservationCounts, ReservationStatus.cancelled.value)
+            if cancelled:
+                db.delete(cancelled)
+            db.commit()
+        
+        assert rebuild_reservation_counts()
+        
+        with Session(engine) as db:
+            expected = {ReservationStatus(status).value: count for status, count in db.exec(select(Reservations.status, func.count()).group_by(Reservations.status)).all()}
+            counts = {row.status: row.count for row in db.exec(select(ReservationCounts)).all()}
+        assert counts == {status.value: expected.get(status.value, 0) for status in ReservationStatus}
+    
+    def test_pool_stats(self, info):
+        admin_access_token = info['admin_access_token']
+        user_access_token = info['user_access_token']
+        
+        resp_200 = client.get(
+            "/admin/pool_stats",
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_401_non_admin = client.get(
+            "/admin/pool_stats",
+            headers={'Authorization': f'Bearer {user_access_token}'}
+        )
+        
+        assert resp_200.status_code == 200
+        assert resp_200.json()['async']['checkouts'] > 0
+        assert resp_200.json()['async']['checked_out'] >= 0
+        assert resp_401_non_admin.status_code == 401
+    
+    def test_metrics(self, info):
+        admin_access_token = info['admin_access_token']
+        user_access_token = info['user_access_token']
+        
+        client.get("/cars/available_cars", params={'start': '2030-01-01', 'end': '2030-01-05'})
+        resp_200 = client.get(
+            "/admin/metrics",
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_401_non_admin = client.get(
+            "/admin/metrics",
+            headers={'Authorization': f'Bearer {user_access_token}'}
+        )
+        
+        assert resp_200.status_code == 200
+        # keyed by route template, not by url
+        assert resp_200.json()['GET /cars/available_cars']['count'] >= 1
+        assert resp_401_non_admin.status_code == 401
+    
     def test_reservations(self, info):
         admin_access_token = info['admin_access_token']
         user_access_token = info['user_access_token']
@@ -149,6 +209,131 @@ class TestAdmin:
         assert resp_401_non_admin.status_code == 401
         assert isinstance(resp_200.json()['items'], list)
         
+        with Session(engine) as db:
+            extra = [
+                Reservations(
+                    car_id=info['car'].id,
+                    user_email=info['user'].email,
+                    user_first_name=info['user'].first_name,
+                    user_last_name=info['user'].last_name,
+                    start_at=(datetime.now(timezone.utc) - timedelta(days=30 + i)).date(),
+                    end_at=(datetime.now(timezone.utc) - timedelta(days=29 + i)).date(),
+                    status=status,
+                    total_amount=50
+                )
+                for i, status in enumerate(('completed', 'cancelled'))
+            ]
+            db.add_all(extra)
+            db.commit()
+            extra_ids = [r.id for r in extra]
+        
+        # walk every page one row at a time; rows must not repeat across page boundaries
+        for sort in ('id', 'start_at', 'status'):
+            seen = []
+            cursor = None
+            while True:
+                params = {'limit': 1, 'sort': sort}
+                if cursor:
+                    params['cursor'] = cursor
+                page = client.get(
+                    "/admin/reservations",
+                    params=params,
+                    headers={'Authorization': f'Bearer {admin_access_token}'}
+                ).json()
+                seen.extend(item['id'] for item in page['items'])
+                cursor = page['next_cursor']
+                if not cursor:
+                    break
+            assert len(seen) == len(set(seen))
+            assert {info['reservation'].id, *extra_ids} <= set(seen)
+        
+        with Session(engine) as db:
+            for r in db.exec(select(Reservations).where(Reservations.id.in_(extra_ids))).all():
+                db.delete(r)
+            db.commit()
+        
+        resp_422_page_size = client.get(
+            "/admin/reservations",
+            params={'limit': 10_000},
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_400_cursor = client.get(
+            "/admin/reservations",
+            params={'cursor': 'invalid'},
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        assert resp_422_page_size.status_code == 422
+        assert resp_400_cursor.status_code == 400
+        
+    def test_reservations_export(self, info, monkeypatch):
+        admin_access_token = info['admin_access_token']
+        user_access_token = info['user_access_token']
+        # several fetches per export, so the batching is exercised too
+        monkeypatch.setattr(settings, 'EXPORT_BATCH_SIZE', 1)
+        with Session(engine) as db:
+            extra = Reservations(
+                car_id=info['car'].id,
+                user_email=info['user'].email,
+                user_first_name=info['user'].first_name,
+                user_last_name=info['user'].last_name,
+                start_at=(datetime.now(timezone.utc) - timedelta(days=40)).date(),
+                end_at=(datetime.now(timezone.utc) - timedelta(days=39)).date(),
+                status='completed',
+                total_amount=75.5
+            )
+            db.add(extra)
+            db.commit()
+            extra_id = extra.id
+        
+        resp_ndjson = client.get(
+            "/admin/reservations/export",
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_csv = client.get(
+            "/admin/reservations/export",
+            params={'format': 'csv', 'statuses': 'inactive'},
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_401_non_admin = client.get(
+            "/admin/reservations/export",
+            headers={'Authorization': f'Bearer {user_access_token}'}
+        )
+        resp_422_format = client.get(
+            "/admin/reservations/export",
+            params={'format': 'xml'},
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        # every export slot taken
+        monkeypatch.setattr(routes.admin, 'export_slots', asyncio.Semaphore(0))
+        resp_503_busy = client.get(
+            "/admin/reservations/export",
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        
+        with Session(engine) as db:
+            db.delete(db.get(Reservations, extra_id))
+            db.commit()
+        
+        assert resp_ndjson.status_code == 200
+        assert resp_ndjson.headers['content-type'].startswith('application/x-ndjson')
+        rows = [json.loads(line) for line in resp_ndjson.text.splitlines()]
+        ids = [row['id'] for row in rows]
+        assert ids == sorted(ids)
+        assert {info['reservation'].id, extra_id} <= set(ids)
+        exported = next(row for row in rows if row['id'] == extra_id)
+        assert exported['status'] == 'completed'
+        assert exported['total_amount'] == '75.50'
+        assert exported['make'] == 'Test'
+        
+        assert resp_csv.headers['content-disposition'] == 'attachment; filename="reservations.csv"'
+        csv_rows = list(csv.DictReader(io.StringIO(resp_csv.text)))
+        assert extra_id in {int(row['id']) for row in csv_rows}
+        # only inactive reservations: the fixture's pending one is left out
+        assert info['reservation'].id not in {int(row['id']) for row in csv_rows}
+        assert resp_401_non_admin.status_code == 401
+        assert resp_422_format.status_code == 422
+        assert resp_503_busy.status_code == 503
+        
     def test_reservations_approve(self, info):
         reservation = info['reservation']
         admin_access_token = info['admin_access_token']
@@ -292,4 +477,65 @@ class TestAdmin:
         assert resp_200.status_code == 200
         assert resp_200.json()['detail'] == f'Deleted car ID {car.id}'
         assert resp_401_invalid_token.status_code == 401
-        assert resp_401_non_admin.status_code == 401 
\ No newline at end of file
+        assert resp_401_non_admin.status_code == 401 
+        
+    def test_cars_delete_reserved_after_check(self, info, monkeypatch):
+        car = info['car']
+        admin_access_token = info['admin_access_token']
+        checked = []
+        
+        # the fixture car's reservation is missed by the first check, as if it was booked
+        # between the check and the delete
+        reserved_cars = routes.admin.reserved_cars
+        async def late_reservation(db, ids):
+            checked.append(ids)
+            return set() if len(checked) == 1 else await reserved_cars(db, ids)
+        monkeypatch.setattr(routes.admin, 'reserved_cars', late_reservation)
+        
+        resp_409 = client.delete(
+            f"/admin/cars/delete/{car.id}",
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        
+        assert resp_409.status_code == 409
+        assert resp_409.json()['detail'] == f'Car ID {car.id} has reservations and cannot be deleted'
+        assert len(checked) == 2
+        with Session(engine) as db:
+            assert db.get(Cars, car.id)
+        
+    def test_cars_bulk_delete(self, info):
+        car = info['car']
+        admin_access_token = info['admin_access_token']
+        user_access_token = info['user_access_token']
+        
+        with Session(engine) as db:
+            cars = [
+                Cars(make="Test", model="Test", year=2000, seats=4, transmission="manual", daily_rate=50, description="Test")
+                for _ in range(2)
+            ]
+            db.add_all(cars)
+            db.commit()
+            car_ids = [c.id for c in cars]
+        
+        # the fixture car still has a reservation, so it must be kept
+        resp_409 = client.delete(
+            f"/admin/cars/delete/{car.id}",
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_200 = client.post(
+            "/admin/cars/bulk_delete",
+            json={'ids': car_ids + [car.id, 0]},
+            headers={'Authorization': f'Bearer {admin_access_token}'}
+        )
+        resp_401_non_admin = client.post(
+            "/admin/cars/bulk_delete",
+            json={'ids': car_ids},
+            headers={'Authorization': f'Bearer {user_access_token}'}
+        )
+        
+        assert resp_409.status_code == 409
+        assert resp_200.status_code == 200
+        assert resp_200.json() == {'deleted': sorted(car_ids), 'has_reservations': [car.id], 'not_found': [0]}
+        assert resp_401_non_admin.status_code == 401
+        with Session(engine) as db:
+            assert not db.exec(select(Cars).where(Cars.id.in_(car_ids))).all()
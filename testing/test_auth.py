@@ -5,8 +5,10 @@ from models import Users, RefreshTokens
 from user import hash_password
 from fastapi.testclient import TestClient
 from sqlmodel import select
+from refresh_tokens import purge_expired_refresh_tokens
+from datetime import datetime, timedelta, timezone
 from uuid import uuid4
-import pytest
+import pytest, asyncio
 
 client = TestClient(app)
 
@@ -109,6 +111,32 @@ class TestAuth:
         assert isinstance(new_access_token, str)
         assert resp_csrf_403_wrong_csrf.status_code == 403
         assert resp_csrf_403_no_csrf.status_code == 403
+
+    def test_refresh_rotation(self, user_and_tokens):
+        csrf_token = user_and_tokens['csrf_token']
+        old_refresh_token = client.cookies.get('refresh_token')
+        resp_200 = client.get('/user/refresh', headers={'X-CSRF-Token': csrf_token})
+        assert resp_200.status_code == 200
+        new_refresh_token = resp_200.cookies.get('refresh_token')
+        assert new_refresh_token != old_refresh_token
+        
+        # the rotated token can't be used again
+        client.cookies.set('refresh_token', old_refresh_token)
+        resp_401 = client.get('/user/refresh', headers={'X-CSRF-Token': resp_200.cookies.get('csrf_token')})
+        assert resp_401.status_code == 401
+        
+    def test_purge_expired(self, user_and_tokens):
+        user = user_and_tokens['user']
+        now = datetime.now(timezone.utc)
+        with Session(engine) as db:
+            db.add(RefreshTokens(jti=str(uuid4()), user_id=user.id, issued_at=now - timedelta(days=31), expires_at=now - timedelta(days=1)))
+            db.commit()
+        
+        assert asyncio.run(purge_expired_refresh_tokens()) >= 1
+        with Session(engine) as db:
+            tokens = db.exec(select(RefreshTokens).where(RefreshTokens.user_id == user.id)).all()
+        # only the live token of the current session is left
+        assert len(tokens) == 1
     
     def test_logout(self, user_and_tokens):
         access_token = user_and_tokens['access_token']
@@ -0,0 +1,65 @@
+from availability import AvailabilityIndex, encode_days
+from models import Reservations
+from datetime import date
+
+def make_reservation(id: int, car_id: int, start_at: date, end_at: date, status: str = 'pending') -> Reservations:
+    return Reservations(
+        id=id,
+        car_id=car_id,
+        user_email='user@test.com',
+        user_first_name='Test First',
+        user_last_name='Test Last',
+        start_at=start_at,
+        end_at=end_at,
+        status=status,
+        total_amount=50
+    )
+
+class TestAvailabilityIndex:
+    def test_overlap(self):
+        index = AvailabilityIndex()
+        index.sync(make_reservation(1, 1, date(2030, 1, 10), date(2030, 1, 12)))
+        index.sync(make_reservation(2, 1, date(2030, 1, 1), date(2030, 1, 31), status='completed'))
+        index.sync(make_reservation(3, 2, date(2030, 1, 1), date(2030, 1, 20)))
+        index.sync(make_reservation(4, 2, date(2030, 1, 5), date(2030, 1, 6), status='confirmed'))
+
+        # bounds are inclusive, matching start_at <= end AND end_at >= start
+        assert not index.is_available(1, date(2030, 1, 12), date(2030, 1, 14))
+        assert not index.is_available(1, date(2030, 1, 8), date(2030, 1, 10))
+        assert index.is_available(1, date(2030, 1, 13), date(2030, 1, 20))
+        assert index.is_available(1, date(2030, 1, 1), date(2030, 1, 9))
+        # a short reservation sorted after a long one must not hide the long one
+        assert not index.is_available(2, date(2030, 1, 15), date(2030, 1, 16))
+        assert index.is_available(3, date(2030, 1, 1), date(2030, 1, 31))
+        assert index.unavailable_cars(date(2030, 1, 11), date(2030, 1, 11)) == {1, 2}
+
+    def test_status_changes(self):
+        index = AvailabilityIndex()
+        reservation = make_reservation(1, 1, date(2030, 1, 10), date(2030, 1, 12))
+        index.sync(reservation)
+        reservation.status = 'confirmed'
+        # still blocking the same dates
+        assert not index.sync(reservation)
+        assert not index.is_available(1, date(2030, 1, 11), date(2030, 1, 11))
+
+        reservation.status = 'cancelled'
+        assert index.sync(reservation)
+        assert index.is_available(1, date(2030, 1, 11), date(2030, 1, 11))
+
+        index.sync(make_reservation(2, 1, date(2030, 2, 1), date(2030, 2, 2)))
+        index.discard_car(1)
+        assert index.unavailable_cars(date(2030, 1, 1), date(2030, 12, 31)) == set()
+
+    def test_blocked_days(self):
+        index = AvailabilityIndex()
+        index.sync(make_reservation(1, 1, date(2029, 12, 1), date(2029, 12, 3)))
+        index.sync(make_reservation(2, 1, date(2029, 12, 20), date(2030, 1, 2)))
+        index.sync(make_reservation(3, 1, date(2030, 1, 5), date(2030, 1, 5)))
+        index.sync(make_reservation(4, 1, date(2030, 1, 9), date(2030, 2, 1), status='cancelled'))
+        index.sync(make_reservation(5, 2, date(2030, 1, 9), date(2030, 1, 30)))
+        index.sync(make_reservation(6, 3, date(2030, 3, 1), date(2030, 3, 5)))
+
+        calendar = index.blocked_days(date(2030, 1, 1), date(2030, 1, 10))
+        # car 1 is blocked on days 0-1 and 4, car 2 from day 8, car 3 is free
+        assert calendar == {1: 0b10011, 2: 0b1100000000}
+        assert encode_days(0b1100000000, 10) == 'AAM'
@@ -0,0 +1,65 @@
+from cache import TTLCache
+from response_cache import ResponseCache, MemoryStore, available_cars_key, car_key
+from datetime import date
+import time, asyncio
+
+class TestTTLCache:
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        # 'b' is now the least recently used entry
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        cache.delete('a')
+        assert cache.get('a') is None
+
+    def test_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+class TestResponseCache:
+    def test_invalidate_availability(self):
+        cache = ResponseCache(MemoryStore(maxsize=10, ttl=60))
+        
+        async def scenario():
+            for start, end in [(date(2030, 1, 1), date(2030, 1, 5)), (date(2030, 1, 6), date(2030, 1, 10)), (date(2030, 2, 1), date(2030, 2, 5))]:
+                key = available_cars_key(start, end)
+                await cache.set(key, [], await cache.generation(key))
+            await cache.set(car_key(1), {'id': 1}, await cache.generation(car_key(1)))
+            await cache.invalidate_availability(date(2030, 1, 5), date(2030, 1, 6))
+            remaining = sorted(await cache.store.keys(''))
+            # a response computed before an invalidation is not stored
+            generation = await cache.generation(car_key(1))
+            await cache.invalidate_car(1)
+            await cache.set(car_key(1), {'id': 1}, generation)
+            return remaining, await cache.get(car_key(1))
+        
+        remaining, car = asyncio.run(scenario())
+        assert remaining == [available_cars_key(date(2030, 2, 1), date(2030, 2, 5)), car_key(1)]
+        assert car is None
+
+    def test_availability_responses_stay_local(self):
+        # stands in for a RedisStore shared by every worker
+        shared = MemoryStore(maxsize=10, ttl=60)
+        cache = ResponseCache(shared, MemoryStore(maxsize=10, ttl=60))
+        key = available_cars_key(date(2030, 1, 1), date(2030, 1, 5))
+        
+        async def scenario():
+            await cache.set(key, [], await cache.generation(key))
+            car_generation = await cache.generation(car_key(1))
+            # reservation writes only invalidate this worker's availability responses
+            await cache.invalidate_availability(date(2030, 1, 1), date(2030, 1, 1))
+            await cache.set(car_key(1), {'id': 1}, car_generation)
+            return await shared.keys(''), await cache.get(key), await cache.get(car_key(1))
+        
+        shared_keys, availability, car = asyncio.run(scenario())
+        assert shared_keys == [car_key(1)]
+        assert availability is None
+        assert car is not None
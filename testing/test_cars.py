@@ -0,0 +1,359 @@
+from fastapi.testclient import TestClient
+from main import app
+from db import engine, async_engine
+from models import Cars, CarImages, Users, Reservations, MediaJobs
+from jobs import MediaJobQueue, job_folder
+from user import hash_password
+from storage import MemoryStorage
+from sqlmodel import Session, select
+from sqlalchemy import event, delete
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from response_cache import response_cache
+import storage
+import pytest, time, asyncio, os, threading
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def admin_token():
+    with Session(engine) as db:
+        admin = Users(
+            first_name="Test First",
+            last_name="Test Last",
+            email="admin@test.com",
+            password_hash=hash_password('test_password'),
+            is_admin=True
+        )
+        db.add(admin)
+        db.commit()
+        db.refresh(admin)
+        
+        resp = client.post('/user/token', data={'username': admin.email, 'password': 'test_password'})
+        access_token = resp.json()['access_token']
+        
+        yield access_token
+        
+        client.post('/user/logout', headers={'Authorization': f'Bearer {access_token}'})
+        db.delete(admin)
+        db.commit()
+
+@pytest.fixture(scope="function")
+def fleet():
+    created_ids = []
+
+    def add_cars(n: int):
+        with Session(engine) as db:
+            cars = [
+                Cars(
+                    make='Test',
+                    model='Test',
+                    year=2000,
+                    seats=4,
+                    transmission='automatic',
+                    daily_rate=50,
+                    description='test'
+                )
+                for _ in range(n)
+            ]
+            db.add_all(cars)
+            db.commit()
+            for car in cars:
+                db.refresh(car)
+                created_ids.append(car.id)
+            images = [CarImages(car_id=car.id, image_url=f'https://test.com/{uuid4().hex}.jpg', is_primary=True) for car in cars]
+            db.add_all(images)
+            db.commit()
+
+    yield add_cars
+
+    with Session(engine) as db:
+        for reservation in db.exec(select(Reservations).where(Reservations.car_id.in_(created_ids))).all():
+            db.delete(reservation)
+        for img in db.exec(select(CarImages).where(CarImages.car_id.in_(created_ids))).all():
+            db.delete(img)
+        for car in db.exec(select(Cars).where(Cars.id.in_(created_ids))).all():
+            db.delete(car)
+        db.commit()
+
+def count_queries(func) -> int:
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    # the routes run on the async engine, whose events are dispatched by its sync_engine
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(async_engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    return len(queries)
+
+class TestCars:
+    def test_available_cars_query_count(self, fleet):
+        now = datetime.now(timezone.utc)
+        params = {
+            'start': (now + timedelta(days=300)).date().isoformat(),
+            'end': (now + timedelta(days=305)).date().isoformat()
+        }
+
+        # the fixture writes straight to the database, so the cached catalog is dropped by hand
+        asyncio.run(response_cache.clear())
+        fleet(2)
+        small_fleet_queries = count_queries(lambda: client.get('/cars/available_cars', params=params))
+        asyncio.run(response_cache.clear())
+        fleet(25)
+        large_fleet_queries = count_queries(lambda: client.get('/cars/available_cars', params=params))
+        cached_queries = count_queries(lambda: client.get('/cars/available_cars', params=params))
+
+        resp_200 = client.get('/cars/available_cars', params=params)
+        assert resp_200.status_code == 200
+        assert all(car['image_url'] for car in resp_200.json() if car['description'] == 'test')
+        assert small_fleet_queries == large_fleet_queries == 1
+        assert cached_queries == 0
+
+    def test_catalog_cache(self, fleet, admin_token):
+        now = datetime.now(timezone.utc)
+        params = {
+            'start': (now + timedelta(days=310)).date().isoformat(),
+            'end': (now + timedelta(days=315)).date().isoformat()
+        }
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        asyncio.run(response_cache.clear())
+        fleet(1)
+        
+        resp_200 = client.get('/cars/available_cars', params=params)
+        etag = resp_200.headers['etag']
+        car_id = max(car['id'] for car in resp_200.json())
+        assert resp_200.headers['cache-control'].startswith('public')
+        resp_304 = client.get('/cars/available_cars', params=params, headers={'If-None-Match': etag})
+        assert resp_304.status_code == 304
+        
+        car_200 = client.get(f'/cars/{car_id}')
+        assert car_200.status_code == 200
+        assert client.get(f'/cars/{car_id}', headers={'If-None-Match': car_200.headers['etag']}).status_code == 304
+        
+        # deactivating the car changes the catalog, so the old ETag no longer matches
+        client.patch(f'/admin/cars/set_inactive/{car_id}', headers=headers)
+        resp_200 = client.get('/cars/available_cars', params=params, headers={'If-None-Match': etag})
+        assert resp_200.status_code == 200
+        assert car_id not in {car['id'] for car in resp_200.json()}
+        
+        client.delete(f'/admin/cars/delete/{car_id}', headers=headers)
+        assert client.get(f'/cars/{car_id}').status_code == 404
+
+    def test_calendar(self, fleet):
+        start = (datetime.now(timezone.utc) + timedelta(days=320)).date()
+        asyncio.run(response_cache.clear())
+        fleet(3)
+        
+        resp_200 = client.get('/cars/calendar', params={'start': start.isoformat(), 'days': 90})
+        assert resp_200.status_code == 200
+        calendar = resp_200.json()
+        assert calendar['days'] == 90
+        assert len(calendar['cars']) >= 3
+        assert all(len(bitmap) == 16 for bitmap in calendar['cars'].values())
+        # the new cars have no reservations: 90 set bits, the last 6 bits of the 12th byte unused
+        new_cars = sorted(calendar['cars'], key=int)[-3:]
+        assert all(calendar['cars'][car_id] == '______________8D' for car_id in new_cars)
+        resp_422 = client.get('/cars/calendar', params={'start': start.isoformat(), 'days': 1000})
+        assert resp_422.status_code == 422
+
+    def test_search(self):
+        start = (datetime.now(timezone.utc) + timedelta(days=340)).date()
+        params = {'start': start.isoformat(), 'end': (start + timedelta(days=2)).isoformat(), 'make': ['SearchA', 'SearchB']}
+        specs = [('SearchA', 'One', 2020, 5, 'automatic', 40), ('SearchA', 'Two', 2022, 7, 'manual', 80), ('SearchB', 'One', 2024, 5, 'automatic', 60)]
+        with Session(engine) as db:
+            cars = [
+                Cars(make=make, model=model, year=year, seats=seats, transmission=transmission, daily_rate=rate, description='test')
+                for make, model, year, seats, transmission, rate in specs
+            ]
+            db.add_all(cars)
+            db.commit()
+            car_ids = [car.id for car in cars]
+        asyncio.run(response_cache.clear())
+        
+        try:
+            resp_200 = client.get('/cars/search', params=params)
+            # the make facet ignores the make filter, the others apply it
+            resp_filtered = client.get('/cars/search', params={**params, 'make': 'SearchA', 'seats': 5})
+            pages, cursor = [], None
+            while True:
+                page = client.get('/cars/search', params={**params, 'sort': '-daily_rate', 'limit': 1, **({'cursor': cursor} if cursor else {})}).json()
+                pages.append(page['items'])
+                cursor = page['next_cursor']
+                if not cursor:
+                    break
+            resp_range = client.get('/cars/search', params={**params, 'rate_min': 50, 'year_max': 2023})
+            resp_400 = client.get('/cars/search', params={**params, 'sort': 'color'})
+            resp_unfiltered = client.get('/cars/search', params={'start': params['start'], 'end': params['end'], 'sort': '-year'})
+            
+            # only the first page of an unfiltered search is cached
+            assert asyncio.run(response_cache.local.keys('search:')) == [f"search:{params['start']}:{params['end']}:-year"]
+            assert 'etag' in resp_unfiltered.headers and 'etag' not in resp_200.headers
+            assert resp_200.status_code == 200
+            assert resp_200.json()['total'] == 3
+            assert resp_200.json()['facets']['make'] == {'SearchA': 2, 'SearchB': 1}
+            assert resp_200.json()['facets']['transmission'] == {'automatic': 2, 'manual': 1}
+            assert resp_filtered.json()['total'] == 1
+            assert resp_filtered.json()['facets']['make'] == {'SearchA': 1, 'SearchB': 1}
+            assert resp_filtered.json()['facets']['seats'] == {'5': 1, '7': 1}
+            assert [float(items[0]['daily_rate']) for items in pages] == [80, 60, 40]
+            assert pages[0][0]['total_amount'] == 240
+            assert [car['id'] for car in resp_range.json()['items']] == [car_ids[1]]
+            assert resp_400.status_code == 400
+        finally:
+            with Session(engine) as db:
+                for car in db.exec(select(Cars).where(Cars.id.in_(car_ids))).all():
+                    db.delete(car)
+                db.commit()
+    
+    def test_quote(self, fleet):
+        start = (datetime.now(timezone.utc) + timedelta(days=330)).date()
+        params = {'start': start.isoformat(), 'end': (start + timedelta(days=2)).isoformat()}
+        asyncio.run(response_cache.clear())
+        fleet(2)
+        
+        available = client.get('/cars/available_cars', params=params).json()
+        new_cars = sorted(available, key=lambda car: car['id'])[-2:]
+        resp_all = client.get('/cars/quote', params=params)
+        resp_one = client.get('/cars/quote', params={**params, 'car_id': new_cars[0]['id']})
+        resp_404 = client.get('/cars/quote', params={**params, 'car_id': -1})
+        resp_400 = client.get('/cars/quote', params={'start': params['end'], 'end': params['start']})
+        resp_too_long = client.get('/cars/quote', params={'start': '0001-01-01', 'end': '9999-12-31'})
+        # booked behind the availability index's back, e.g. by another worker
+        with Session(engine) as db:
+            db.add(Reservations(
+                car_id=new_cars[1]['id'], user_email='user@test.com', user_first_name='Test', user_last_name='Test',
+                start_at=start, end_at=start, status='confirmed', total_amount=50
+            ))
+            db.commit()
+        resp_booked = client.get('/cars/quote', params=params)
+        
+        # 3 days at the fixture's daily rate of 50
+        assert all(float(car['total_amount']) == 150 for car in new_cars)
+        assert resp_all.status_code == 200
+        assert resp_all.json()['days'] == 3
+        assert {str(car['id']) for car in available} == set(resp_all.json()['quotes'])
+        assert resp_one.json()['quotes'] == {str(new_cars[0]['id']): 150}
+        assert resp_404.status_code == 404
+        assert resp_400.status_code == 400
+        assert resp_too_long.status_code == 400
+        assert str(new_cars[1]['id']) not in resp_booked.json()['quotes']
+        assert str(new_cars[0]['id']) in resp_booked.json()['quotes']
+
+    def test_add_car(self, admin_token, monkeypatch):
+        monkeypatch.setattr(storage, 'storage_backend', MemoryStorage())
+        car = {
+            'make': 'Upload Test',
+            'model': 'Test',
+            'year': 2000,
+            'seats': 4,
+            'transmission': 'automatic',
+            'daily_rate': 50,
+            'description': 'test'
+        }
+        images = [('images', (f'{i}.jpg', b'image bytes', 'image/jpeg')) for i in range(3)]
+        resp_200 = client.post('/cars/add_car', data=car, files=images, headers={'Authorization': f'Bearer {admin_token}'})
+        assert resp_200.status_code == 200
+        
+        with Session(engine) as db:
+            db_car = db.exec(select(Cars).where(Cars.make == 'Upload Test')).first()
+            db_images = db.exec(select(CarImages).where(CarImages.car_id == db_car.id).order_by(CarImages.id)).all()
+            assert len(db_images) == 3
+            assert [img.is_primary for img in db_images] == [True, False, False]
+            for img in db_images:
+                db.delete(img)
+            db.delete(db_car)
+            db.commit()
+
+    def test_add_car_job(self, admin_token, monkeypatch):
+        monkeypatch.setattr(storage, 'storage_backend', MemoryStorage())
+        car = {
+            'make': 'Job Test',
+            'model': 'Test',
+            'year': 2000,
+            'seats': 4,
+            'transmission': 'automatic',
+            'daily_rate': 50,
+            'description': 'test'
+        }
+        images = [('images', (f'{i}.jpg', b'image bytes', 'image/jpeg')) for i in range(3)]
+        headers = {'Authorization': f'Bearer {admin_token}'}
+        # entering the client runs the lifespan, which starts the job workers
+        with TestClient(app) as lifespan_client:
+            resp_202 = lifespan_client.post('/cars/add_car_job', data=car, files=images, headers=headers)
+            assert resp_202.status_code == 202
+            job_id = resp_202.json()['job_id']
+            
+            for _ in range(50):
+                job = lifespan_client.get(f'/cars/jobs/{job_id}', headers=headers).json()
+                if job['status'] == 'completed':
+                    break
+                time.sleep(0.1)
+            resp_404 = lifespan_client.get(f'/cars/jobs/{uuid4().hex}', headers=headers)
+        
+        assert job['status'] == 'completed'
+        assert job['attempts'] == 1
+        assert resp_404.status_code == 404
+        with Session(engine) as db:
+            db_car = db.exec(select(Cars).where(Cars.id == job['car_id'])).first()
+            db_images = db.exec(select(CarImages).where(CarImages.car_id == db_car.id)).all()
+            assert db_car.is_active
+            assert len(db_images) == 3
+            assert all(img.thumbnail_url for img in db_images)
+        
+        resp_200 = client.delete(f"/admin/cars/delete/{job['car_id']}", headers=headers)
+        assert resp_200.status_code == 200
+    
+    @pytest.mark.parametrize('deleted', ['before', 'during'])
+    def test_car_job_car_deleted(self, deleted, monkeypatch):
+        with Session(engine) as db:
+            car = Cars(make='Job Test', model='Test', year=2000, seats=4, transmission='automatic', daily_rate=50, description='test', is_active=False)
+            db.add(car)
+            db.commit()
+            job = MediaJobs(id=uuid4().hex, car_id=car.id)
+            db.add(job)
+            db.commit()
+            car_id, job_id = car.id, job.id
+        folder = job_folder(job_id)
+        os.makedirs(folder)
+        with open(os.path.join(folder, '0000.jpg'), 'wb') as f:
+            f.write(b'image bytes')
+        
+        def delete_car():
+            # in the same order as the admin endpoint, locking the car first
+            with Session(engine) as db:
+                db.exec(select(Cars).where(Cars.id == car_id).with_for_update())
+                db.exec(delete(CarImages).where(CarImages.car_id == car_id))
+                db.exec(delete(MediaJobs).where(MediaJobs.car_id == car_id))
+                db.exec(delete(Cars).where(Cars.id == car_id))
+                db.commit()
+        
+        deleter = threading.Thread(target=delete_car)
+        class DeletingStorage(MemoryStorage):
+            def save(self, file, file_name):
+                # a backend with row locks keeps the delete waiting until the job commits
+                deleter.start()
+                deleter.join(timeout=1)
+                return super().save(file, file_name)
+        
+        monkeypatch.setattr(storage, 'storage_backend', DeletingStorage())
+        if deleted == 'before':
+            deleter.start()
+            deleter.join()
+        
+        async def run():
+            try:
+                await MediaJobQueue().process(job_id)
+            finally:
+                await async_engine.dispose()
+        asyncio.run(run())
+        deleter.join()
+        
+        assert not os.path.exists(folder)
+        with Session(engine) as db:
+            assert db.get(MediaJobs, job_id) is None
+            assert db.get(Cars, car_id) is None
+            assert not db.exec(select(CarImages).where(CarImages.car_id == car_id)).all()
@@ -1,15 +1,11 @@
 from auth_tokens import create_access_token, create_refresh_token
 from config import settings
 from jose import jwt, JWTError
-from dotenv import find_dotenv, load_dotenv
 from datetime import timedelta
-import os
 import pytest
 
-path = find_dotenv()
-load_dotenv(path)
-SECRET_KEY = os.getenv('SECRET_KEY')
-ALGORITHM = os.getenv('ALGORITHM')
+SECRET_KEY = settings.SECRET_KEY
+ALGORITHM = settings.ALGORITHM
 WRONG_SECRET_KEY = 'leHmYZFIU6S3Jb72qeM3vuwwB6Kx4sLg'
 WRONG_TOKEN = 'AtXpVZ9Kew75dgCOrZ3PmqF6mD7jc0zg'
 
@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+from main import app
+from db import engine
+from metrics import RequestStats, MetricsRegistry, current_request
+from config import settings
+from sqlalchemy import text
+
+client = TestClient(app)
+
+class TestMetrics:
+    def test_server_timing(self):
+        resp = client.get("/cars/available_cars", params={'start': '2031-01-01', 'end': '2031-01-05'})
+        
+        assert resp.status_code == 200
+        timing = resp.headers['server-timing']
+        assert timing.startswith('app;dur=')
+        # the async engine's statements are attributed to the request
+        assert 'db;dur=' in timing
+        assert '"0 queries"' not in timing
+    
+    def test_n_plus_one(self):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                for i in range(settings.N_PLUS_ONE_THRESHOLD):
+                    conn.execute(text('SELECT :i'), {'i': i})
+        finally:
+            current_request.reset(token)
+        
+        assert stats.statements == settings.N_PLUS_ONE_THRESHOLD + 1
+        # the repeated statement is flagged once, whatever its parameters
+        assert list(stats.n_plus_one().values()) == [settings.N_PLUS_ONE_THRESHOLD]
+    
+    def test_registry(self):
+        registry = MetricsRegistry()
+        stats = RequestStats()
+        stats.statements = 3
+        stats.db_time = 0.002
+        registry.record('GET /cars/{id}', 200, 7.0, stats)
+        registry.record('GET /cars/{id}', 500, 700.0, stats)
+        
+        snapshot = registry.snapshot()['GET /cars/{id}']
+        assert snapshot['count'] == 2
+        assert snapshot['errors'] == 1
+        assert snapshot['latency_histogram_ms']['le_10'] == 1
+        assert snapshot['latency_histogram_ms']['le_1000'] == 1
+        assert snapshot['avg_statements'] == 3
+        assert snapshot['avg_db_ms'] == 2.0
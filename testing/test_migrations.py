@@ -0,0 +1,29 @@
+from sqlalchemy import inspect, create_engine
+from db import engine
+from models import MediaJobs, ReservationCounts
+from migrations import upgrade, pending_migrations, initial_schema, INITIAL_TABLES, HOT_PATH_INDEXES, CARS_SEARCH_INDEXES
+
+class TestMigrations:
+    def test_upgrade(self):
+        # the test database is expected to be migrated already, running it again is a no-op
+        upgrade()
+        assert upgrade() == []
+        assert pending_migrations() == []
+
+    def test_hot_path_indexes(self):
+        inspector = inspect(engine)
+        for model, names in HOT_PATH_INDEXES.items():
+            existing = {index['name'] for index in inspector.get_indexes(model.__tablename__)}
+            assert set(names) <= existing
+        assert set(CARS_SEARCH_INDEXES) <= {index['name'] for index in inspector.get_indexes('cars')}
+    
+    def test_initial_schema(self):
+        # tables added after the initial schema come from their own migrations
+        fresh = create_engine('sqlite://')
+        with fresh.begin() as conn:
+            initial_schema(conn)
+        assert set(inspect(fresh).get_table_names()) == {model.__tablename__ for model in INITIAL_TABLES}
+        
+        inspector = inspect(engine)
+        assert {'ix_mediajobs_car_id', 'ix_mediajobs_status_updated_at'} <= {index['name'] for index in inspector.get_indexes(MediaJobs.__tablename__)}
+        assert inspector.has_table(ReservationCounts.__tablename__)
@@ -0,0 +1,33 @@
+from pagination import encode_cursor, decode_cursor, split_page
+from models import Cars, Reservations, ReservationStatus
+from fastapi import HTTPException
+from datetime import date
+from decimal import Decimal
+import pytest
+
+class TestPagination:
+    def test_cursor_round_trip(self):
+        columns = (Reservations.status, Reservations.start_at, Reservations.id)
+        cursor = encode_cursor([ReservationStatus.pending, date(2030, 1, 1), 42])
+        assert isinstance(cursor, str)
+        assert decode_cursor(cursor, columns) == [ReservationStatus.pending, date(2030, 1, 1), 42]
+        # Decimal sort keys (e.g. daily_rate) round-trip exactly
+        assert decode_cursor(encode_cursor([Decimal('49.90'), 7]), (Cars.daily_rate, Cars.id)) == [Decimal('49.90'), 7]
+        
+    def test_invalid_cursor(self):
+        columns = (Reservations.start_at, Reservations.id)
+        with pytest.raises(HTTPException):
+            decode_cursor('not a cursor', columns)
+        with pytest.raises(HTTPException):
+            # built for a different sort order
+            decode_cursor(encode_cursor([42]), columns)
+        with pytest.raises(HTTPException):
+            decode_cursor(encode_cursor(['2030-01-01', 'abc']), columns)
+    
+    def test_split_page(self):
+        rows, cursor = split_page([1, 2, 3], 2, lambda row: [row])
+        assert rows == [1, 2]
+        assert decode_cursor(cursor, (Reservations.id,)) == [2]
+        rows, cursor = split_page([1, 2], 2, lambda row: [row])
+        assert rows == [1, 2]
+        assert cursor is None
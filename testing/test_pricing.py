@@ -0,0 +1,50 @@
+from pricing import PriceEngine, WeekendRule, SeasonRule, LongRentalRule, rental_days
+from config import settings
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+
+class TestPricing:
+    def test_plain(self):
+        engine = PriceEngine([])
+        
+        # both dates are rented
+        assert rental_days(date(2030, 1, 7), date(2030, 1, 9)) == 3
+        assert engine.quote(Decimal('49.99'), date(2030, 1, 7), date(2030, 1, 9)) == Decimal('149.97')
+        with pytest.raises(ValueError):
+            engine.factor(date(2030, 1, 9), date(2030, 1, 7))
+    
+    def test_rules(self):
+        engine = PriceEngine([
+            WeekendRule(Decimal('1.2')),
+            SeasonRule('12-20', '01-05', Decimal('1.5')),
+            LongRentalRule({7: Decimal('0.1'), 28: Decimal('0.2')})
+        ])
+        
+        # Friday to Sunday outside the season: 1 + 1.2 + 1.2
+        assert engine.factor(date(2030, 3, 1), date(2030, 3, 3)) == Decimal('3.4')
+        # Dec 30 to Jan 6, wrapping the new year: 5 season days, 2 season weekend days,
+        # 1 plain day, with the 7 day discount
+        assert engine.factor(date(2025, 12, 30), date(2026, 1, 6)) == (5 * Decimal('1.5') + 2 * Decimal('1.8') + 1) * Decimal('0.9')
+        # the longest tier reached applies
+        assert engine.factor(date(2030, 3, 4), date(2030, 4, 14)).quantize(Decimal('0.01')) == ((30 + 12 * Decimal('1.2')) * Decimal('0.8')).quantize(Decimal('0.01'))
+    
+    def test_quote_many(self):
+        engine = PriceEngine([WeekendRule(Decimal('2'))])
+        start, end = date(2030, 3, 1), date(2030, 3, 3)
+        quotes = engine.quote_many({1: Decimal('10'), 2: Decimal('33.33')}, start, end)
+        
+        assert quotes == {1: Decimal('50.00'), 2: Decimal('166.65')}
+        assert quotes[2] == engine.quote(Decimal('33.33'), start, end)
+    
+    def test_max_rental_days(self):
+        engine = PriceEngine([WeekendRule(Decimal('1.2'))])
+        start = date(2030, 1, 1)
+        
+        assert engine.factor(start, start + timedelta(days=settings.MAX_RENTAL_DAYS - 1)) > 0
+        with pytest.raises(ValueError):
+            engine.factor(start, start + timedelta(days=settings.MAX_RENTAL_DAYS))
+        with pytest.raises(ValueError):
+            engine.factor(date(1, 1, 1), date(9999, 12, 31))
+        # without per day rules the days aren't walked
+        assert PriceEngine([LongRentalRule({7: Decimal('0.5')})]).factor(start, start + timedelta(days=9)) == 5
@@ -1,7 +1,9 @@
 from fastapi.testclient import TestClient
 from main import app
 from db import engine
-from models import Cars, Reservations
+from models import Cars, Reservations, Users
+from user import hash_password
+from config import settings
 from sqlmodel import Session, select
 from datetime import datetime, timedelta, timezone
 import random
@@ -29,6 +31,22 @@ def car():
         
         db.delete(db_car)
         db.commit()
+
+@pytest.fixture(scope="module")
+def access_token():
+    with Session(engine) as db:
+        user = Users(first_name='Partner', last_name='Test', email='partner@test.com', password_hash=hash_password('test_password'), is_admin=False)
+        db.add(user)
+        db.commit()
+        
+        resp = client.post("/user/token", data={'username': user.email, 'password': 'test_password'})
+        access_token = resp.json()['access_token']
+        
+        yield access_token
+        
+        client.post("/user/logout", headers={'Authorization': f'Bearer {access_token}'})
+        db.delete(user)
+        db.commit()
         
 class TestReservations:
     def test_add_reservation(self, car):
@@ -54,6 +72,9 @@ class TestReservations:
         resp_200 = client.post('/reservations/add', json=reservation)
         resp_409 = client.post('/reservations/add', json=reservation_conflict) 
         assert resp_200.status_code == 200
+        # priced from the car's daily rate, not from the total the client sent
+        days = (datetime.fromisoformat(reservation['end_at']) - datetime.fromisoformat(reservation['start_at'])).days + 1
+        assert float(resp_200.json()['total_amount']) == 50 * days
         assert resp_409.status_code == 409
         assert resp_409.json()['detail'] == "The selected car is not available for these dates."
         
@@ -61,4 +82,85 @@ class TestReservations:
             reservations = db.exec(select(Reservations).where(Reservations.car_id == car.id)).all()
             for r in reservations:
                 db.delete(r)
-            db.commit()
\ No newline at end of file
+            db.commit()
+    
+    def test_add_reservation_stale_index(self, car):
+        start = datetime.now(timezone.utc).date() + timedelta(days=60)
+        with Session(engine) as db:
+            # written by "another worker": this process's availability index never sees it
+            db.add(Reservations(
+                car_id=car.id,
+                user_email='other@test.com',
+                user_first_name='Other First',
+                user_last_name='Other Last',
+                start_at=start,
+                end_at=start + timedelta(days=3),
+                total_amount=50
+            ))
+            db.commit()
+        reservation = {
+            'car_id': car.id,
+            'user_email': 'user@test.com',
+            'user_first_name': 'Test First',
+            'user_last_name': 'Test Last',
+            'start_at': (start + timedelta(days=2)).isoformat(),
+            'end_at': (start + timedelta(days=4)).isoformat(),
+            'total_amount': 50
+        }
+        resp_409 = client.post('/reservations/add', json=reservation)
+        
+        assert resp_409.status_code == 409
+        assert resp_409.json()['detail'] == "The selected car is not available for these dates."
+        
+        with Session(engine) as db:
+            reservations = db.exec(select(Reservations).where(Reservations.car_id == car.id)).all()
+            assert len(reservations) == 1
+            for r in reservations:
+                db.delete(r)
+            db.commit()
+    
+    def test_add_batch(self, car, access_token):
+        start = datetime.now(timezone.utc).date() + timedelta(days=30)
+        def item(car_id, offset, days):
+            return {
+                'car_id': car_id,
+                'user_email': 'user@test.com',
+                'user_first_name': 'Test First',
+                'user_last_name': 'Test Last',
+                'start_at': (start + timedelta(days=offset)).isoformat(),
+                'end_at': (start + timedelta(days=offset + days)).isoformat(),
+                'total_amount': 50
+            }
+        batch = [
+            item(car.id, 0, 2),
+            # overlaps the first item of the same batch
+            item(car.id, 2, 1),
+            item(car.id, 5, 1),
+            item(-1, 0, 1),
+            item(car.id, 10, -1),
+            item(car.id, 20, settings.MAX_RENTAL_DAYS)
+        ]
+        
+        headers = {'Authorization': f'Bearer {access_token}'}
+        resp_401 = client.post('/reservations/add_batch', json=batch)
+        resp = client.post('/reservations/add_batch', json=batch, headers=headers)
+        resp_conflict = client.post('/reservations/add_batch', json=[item(car.id, 6, 3)], headers=headers)
+        resp_empty = client.post('/reservations/add_batch', json=[], headers=headers)
+        
+        assert resp_401.status_code == 401
+        assert resp.status_code == 200
+        assert resp.json()['created'] == 2
+        assert [r['status'] for r in resp.json()['results']] == ['created', 'rejected', 'created', 'rejected', 'rejected', 'rejected']
+        assert resp.json()['results'][1]['detail'] == "The selected car is not available for these dates."
+        assert resp.json()['results'][3]['detail'] == "Car not found."
+        assert resp.json()['results'][5]['detail'] == f"Rentals can last at most {settings.MAX_RENTAL_DAYS} days."
+        assert [r.get('total_amount') for r in resp.json()['results']] == [150, None, 100, None, None, None]
+        assert resp_conflict.json()['results'][0]['status'] == 'rejected'
+        assert resp_empty.status_code == 422
+        
+        with Session(engine) as db:
+            reservations = db.exec(select(Reservations).where(Reservations.car_id == car.id)).all()
+            assert sorted(r.id for r in reservations) == sorted(r['id'] for r in resp.json()['results'] if r['status'] == 'created')
+            for r in reservations:
+                db.delete(r)
+            db.commit()
@@ -0,0 +1,18 @@
+from server import pool_sizing, fit_workers
+import pytest
+
+class TestServer:
+    def test_pool_sizing(self):
+        # 4 workers x 2 engines share 40 connections
+        assert pool_sizing(40, 4) == (5, 0)
+        # the budget is never exceeded: 8 workers need at least 16 connections
+        with pytest.raises(ValueError):
+            pool_sizing(3, 8)
+        assert fit_workers(3, 8) == 1
+        assert pool_sizing(3, fit_workers(3, 8)) == (1, 0)
+        assert fit_workers(40, 4) == 4
+        with pytest.raises(ValueError):
+            pool_sizing(1, fit_workers(1, 4))
+        # 2 export connections per worker come out of the budget first
+        assert pool_sizing(40, 4, reserved=2) == (4, 0)
+        assert fit_workers(10, 4, reserved=2) == 2
@@ -0,0 +1,24 @@
+from storage import ImageKitStorage, LocalStorage, MemoryStorage, create_storage
+from io import BytesIO
+import pytest, subprocess, sys
+
+class TestStorage:
+    def test_local_storage(self, tmp_path):
+        storage = LocalStorage(str(tmp_path), '/media/images/')
+        url, thumbnail_url = storage.save(BytesIO(b'image bytes'), 'car.jpg')
+        assert url == thumbnail_url == '/media/images/car.jpg'
+        assert (tmp_path / 'car.jpg').read_bytes() == b'image bytes'
+
+    def test_memory_storage(self):
+        storage = MemoryStorage()
+        url, thumbnail_url = storage.save(BytesIO(b'image bytes'), 'car.jpg')
+        assert storage.files == {'car.jpg': b'image bytes'}
+        assert url != thumbnail_url
+
+    def test_imagekit_is_lazy(self):
+        assert ImageKitStorage('private', 'public', 'https://ik.imagekit.io/test')._client is None
+        # importing the app must not import the ImageKit SDK
+        check = "import main, sys; assert 'imagekitio' not in sys.modules"
+        assert subprocess.run([sys.executable, '-c', check]).returncode == 0
+        with pytest.raises(ValueError):
+            create_storage('unknown')
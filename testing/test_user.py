@@ -1,8 +1,60 @@
-from user import hash_password, verify_password
+from user import hash_password, verify_password, get_user_by_email, user_cache
+from db import engine, async_engine, async_session_maker
+from models import Users
+from config import settings
+from sqlmodel import Session
+from uuid import uuid4
+import asyncio, time
 
 class TestUserAuth:
     def test_password_verification(self):
         hashed_pwd = hash_password('test_password')
         assert verify_password('test_password', hashed_pwd)
         assert not verify_password('wrong_password', hashed_pwd)
-        assert isinstance(hashed_pwd, str)
\ No newline at end of file
+        assert isinstance(hashed_pwd, str)
+
+class TestUserCache:
+    def test_evicted_after_commit(self):
+        email, new_email = f'{uuid4()}@test.com', f'{uuid4()}@test.com'
+        
+        async def lookup(email: str):
+            async with async_session_maker() as db:
+                return await get_user_by_email(db, email)
+        
+        async def scenario(db: Session, user: Users):
+            assert (await lookup(email)).is_admin
+            # admins are only cached briefly
+            assert user_cache._data[email][0] <= time.monotonic() + settings.USER_CACHE_ADMIN_TTL_SECONDS
+            
+            user.is_admin = False
+            db.flush()
+            # the change isn't evicted until it commits
+            assert user_cache.get(email) is not None
+            db.commit()
+            assert user_cache.get(email) is None
+            assert not (await lookup(email)).is_admin
+            
+            # an email change evicts the old address as well
+            user.email = new_email
+            db.commit()
+            assert user_cache.get(email) is None
+            assert await lookup(email) is None
+            
+            # a rolled back change evicts nothing
+            await lookup(new_email)
+            user.first_name = 'Rolled Back'
+            db.flush()
+            db.rollback()
+            assert user_cache.get(new_email) is not None
+        
+        with Session(engine) as db:
+            user = Users(first_name='Cache', last_name='Test', email=email, password_hash='x', is_admin=True)
+            db.add(user)
+            db.commit()
+            try:
+                asyncio.run(scenario(db, user))
+            finally:
+                asyncio.run(async_engine.dispose())
+                db.delete(db.get(Users, user.id))
+                db.commit()
+        assert user_cache.get(new_email) is None
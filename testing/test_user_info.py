@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from main import app
+from db import engine
+from models import Users, Cars, Reservations
+from user import hash_password
+from sqlmodel import Session, select
+from datetime import datetime, timedelta, timezone
+import pytest
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def info():
+    with Session(engine) as db:
+        user = Users(first_name="Info First", last_name="Info Last", email="info@test.com", password_hash=hash_password('test_password'), is_admin=False)
+        car = Cars(make="Test", model="Test", year=2000, seats=4, transmission="manual", daily_rate=50, description="Test")
+        db.add(user)
+        db.add(car)
+        db.commit()
+        db.refresh(car)
+        
+        start = (datetime.now(timezone.utc) + timedelta(days=200)).date()
+        def reservation(email, offset, status):
+            return Reservations(
+                car_id=car.id, user_email=email, user_first_name="Info First", user_last_name="Info Last",
+                start_at=start + timedelta(days=offset), end_at=start + timedelta(days=offset + 1), status=status, total_amount=100
+            )
+        reservations = [reservation(user.email, 0, 'pending'), reservation(user.email, 3, 'confirmed'), reservation("other@test.com", 6, 'pending')]
+        db.add_all(reservations)
+        db.commit()
+        ids = [r.id for r in reservations]
+        
+        resp = client.post("/user/token", data={'username': user.email, 'password': 'test_password'})
+        access_token = resp.json()['access_token']
+        
+        yield {'ids': ids, 'headers': {'Authorization': f'Bearer {access_token}'}}
+        
+        client.post("/user/logout", headers={'Authorization': f'Bearer {access_token}'})
+        for r in db.exec(select(Reservations).where(Reservations.id.in_(ids))).all():
+            db.delete(r)
+        db.delete(db.get(Users, user.id))
+        db.delete(db.get(Cars, car.id))
+        db.commit()
+
+class TestUserInfo:
+    def test_reservations(self, info):
+        own, confirmed, other = info['ids']
+        
+        resp_200 = client.get("/user_info/reservations", headers=info['headers'])
+        resp_page = client.get("/user_info/reservations", params={'limit': 1}, headers=info['headers'])
+        resp_401 = client.get("/user_info/reservations")
+        
+        assert resp_200.status_code == 200
+        # only the user's own reservations
+        assert [r['id'] for r in resp_200.json()['items']] == [own, confirmed]
+        assert len(resp_page.json()['items']) == 1 and resp_page.json()['next_cursor']
+        assert resp_401.status_code == 401
+    
+    def test_cancel(self, info):
+        own, confirmed, other = info['ids']
+        
+        resp_200 = client.patch(f"/user_info/reservations/cancel/{own}", headers=info['headers'])
+        resp_400 = client.patch(f"/user_info/reservations/cancel/{confirmed}", headers=info['headers'])
+        resp_404 = client.patch(f"/user_info/reservations/cancel/{other}", headers=info['headers'])
+        
+        assert resp_200.status_code == 200
+        assert resp_400.status_code == 400
+        assert resp_404.status_code == 404
+        with Session(engine) as db:
+            assert db.get(Reservations, own).status == 'cancelled'
+            assert db.get(Reservations, other).status == 'pending'
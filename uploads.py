@@ -0,0 +1,53 @@
+from fastapi import UploadFile
+from config import settings
+from storage import StorageBackend, get_storage
+from uuid import uuid4
+from typing import BinaryIO
+import asyncio, os
+
+async def store_file(file: BinaryIO, filename: str | None, semaphore: asyncio.Semaphore, storage: StorageBackend) -> tuple[str, str]:
+    '''
+    streams a single file to the image store
+
+    Input:
+        file: a readable binary file object
+        filename: the original file name, used for its extension
+        semaphore: bounds how many uploads run at once
+        storage: the storage backend
+    Returns:
+        the url of the stored image and the url of its thumbnail
+    '''
+    ext = os.path.splitext(filename or "")[1].lower() or ".bin"
+    file_name = f"{uuid4().hex}{ext}"
+    async with semaphore:
+        # backends are synchronous, so the save runs on a worker thread reading straight
+        # from the file object
+        return await asyncio.to_thread(storage.save, file, file_name)
+
+async def upload_image(img: UploadFile, semaphore: asyncio.Semaphore, storage: StorageBackend) -> tuple[str, str]:
+    '''
+    streams a single upload to the image store
+
+    Input:
+        img: the uploaded file
+        semaphore: bounds how many uploads run at once
+        storage: the storage backend
+    Returns:
+        the url of the stored image and the url of its thumbnail
+    '''
+    await img.seek(0)
+    return await store_file(img.file, img.filename, semaphore, storage)
+
+async def upload_images(images: list[UploadFile], storage: StorageBackend | None = None) -> list[tuple[str, str]]:
+    '''
+    uploads images concurrently, at most settings.IMAGE_UPLOAD_CONCURRENCY at a time
+
+    Input:
+        images: the uploaded files
+        storage: the storage backend, defaults to the shared one
+    Returns:
+        (image url, thumbnail url) pairs, in the same order as images
+    '''
+    semaphore = asyncio.Semaphore(settings.IMAGE_UPLOAD_CONCURRENCY)
+    storage = storage or get_storage()
+    return await asyncio.gather(*(upload_image(img, semaphore, storage) for img in images))
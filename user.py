@@ -1,20 +1,28 @@
 from models import Users, UserBase
-from db import SessionDep
-from sqlmodel import select, Session
+from db import AsyncSessionDep
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from dotenv import find_dotenv, load_dotenv
-import os
-
-path = find_dotenv()
-load_dotenv(path)
-SECRET_KEY = os.getenv('SECRET_KEY')
-ALGORITHM = os.getenv('ALGORITHM')
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+from cache import TTLCache
+import asyncio
 
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth_2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# argon2 releases the GIL while hashing, so a small thread pool keeps logins off the event
+# loop and bounds how many cores a login burst can take from other requests
+hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='argon2')
+# resolved users keyed by email (the token subject)
+user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+# bumped by every invalidation; a user read while one happened may be stale, so it is
+# returned but not cached
+user_cache_generation = 0
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -40,7 +48,32 @@ def hash_password(password: str) -> str:
     '''
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, email: str, plain_password: str) -> tuple | None:
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    '''
+    verifies a plain text against a hashed password on the hashing pool
+    
+    Input:
+        plain_password: the plain text version of the password
+        hashed_password: the hashed password
+    Returns:
+        a boolean indicating if the verification was successful or if it failed
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, verify_password, plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    '''
+    runs password through hashing algorithm on the hashing pool
+    
+    Input:
+        password: a plain text password
+    Returns:
+        a hashed password
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, hash_password, password)
+
+async def authenticate_user(db: AsyncSession, email: str, plain_password: str) -> tuple | None:
     '''
     checks if the email and password combination is correct
     
@@ -52,18 +85,18 @@ def authenticate_user(db: Session, email: str, plain_password: str) -> tuple | N
         a UserBase instance and the user id if the verification is successful, otherwise None
     '''
     stmt = select(Users).where(Users.email == email)
-    user_in_db = db.exec(stmt).first()
+    user_in_db = (await db.exec(stmt)).first()
     if not user_in_db:
         return None
-    if not verify_password(plain_password, user_in_db.password_hash):
+    if not await verify_password_async(plain_password, user_in_db.password_hash):
         return None
     user = UserBase(**user_in_db.model_dump(exclude={'id', 'password_hash'}))
     user_id = user_in_db.id
     return user, user_id
 
-def get_current_user(db: SessionDep, token: str = Depends(oauth_2_scheme)) -> UserBase:
+async def get_current_user(db: AsyncSessionDep, token: str = Depends(oauth_2_scheme)) -> UserBase:
     '''
-    validates the token and gets the user from the database
+    validates the token and gets the user from the token claims, the user cache or the database
     
     Input: 
         db: a database engine
@@ -79,17 +112,85 @@ def get_current_user(db: SessionDep, token: str = Depends(oauth_2_scheme)) -> Us
         headers={"WWW-Authenticate": "Bearer"}
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
         if not email:
             raise credential_exception
     except JWTError:
         raise credential_exception
     
+    if settings.TRUST_TOKEN_CLAIMS and "admin" in payload:
+        return UserBase(email=email, first_name=payload.get("first_name"), last_name=payload.get("last_name"), is_admin=payload.get("admin"))
+    
+    user = await get_user_by_email(db, email)
+    if not user:
+        raise credential_exception
+    
+    return user
+
+async def get_user_by_email(db: AsyncSession, email: str) -> UserBase | None:
+    '''
+    gets a user by email, serving repeated lookups from the user cache
+    
+    Input:
+        db: a database session
+        email: the user's email
+    Returns:
+        a UserBase instance, or None if the user does not exist
+    '''
+    user = user_cache.get(email)
+    if user:
+        return user
+    
+    generation = user_cache_generation
     stmt = select(Users).where(Users.email == email)
-    curr_user = db.exec(stmt).first()
+    curr_user = (await db.exec(stmt)).first()
     if not curr_user:
-        raise credential_exception
+        return None
     user = UserBase(email=curr_user.email, first_name=curr_user.first_name, last_name=curr_user.last_name, is_admin=curr_user.is_admin)
+    if generation == user_cache_generation:
+        user_cache.set(email, user, ttl=settings.USER_CACHE_ADMIN_TTL_SECONDS if user.is_admin else None)
+    
+    return user
+
+def invalidate_user(email: str) -> None:
+    '''
+    drops a user from the user cache so the next request reads it from the database
     
-    return user
\ No newline at end of file
+    Input:
+        email: the user's email
+    Returns:
+        None
+    '''
+    global user_cache_generation
+    user_cache_generation += 1
+    user_cache.delete(email)
+
+def _record_changed_email(target: Users, email: str) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_emails', set()).add(email)
+
+@event.listens_for(Users, 'after_update')
+@event.listens_for(Users, 'after_delete')
+def _record_changed_user(mapper, connection, target: Users) -> None:
+    # any ORM update (name, role, email) or deletion of a user evicts the cached copy once
+    # the change commits; evicting at flush would let a concurrent lookup cache the old row
+    # again before the commit
+    _record_changed_email(target, target.email)
+
+@event.listens_for(Users.email, 'set', active_history=True)
+def _record_old_email(target: Users, value, oldvalue, initiator) -> None:
+    # the old address may be cached too; active_history loads it even after a commit
+    # expired the attribute
+    if isinstance(oldvalue, str) and oldvalue != value:
+        _record_changed_email(target, oldvalue)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session: Session) -> None:
+    for email in session.info.pop('changed_user_emails', ()):
+        invalidate_user(email)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_users(session: Session, previous_transaction) -> None:
+    session.info.pop('changed_user_emails', None)